@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rides.instrumentation.RequestMetricsMiddleware",
+    # Inside the metrics, so request durations include compressing.
+    "rides.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -84,12 +90,93 @@ WSGI_APPLICATION = "api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Picked from the environment. DB_ENGINE=sqlite (the default) is tuned for a
+# single node: WAL so readers don't block the writer, and writers wait for the
+# lock instead of failing. DB_ENGINE=postgresql keeps connections open between
+# requests, or with DB_POOL=1 hands them out from psycopg's pool.
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+            "OPTIONS": {},
+        }
     }
-}
+    if os.environ.get("DB_SQLITE_TUNED", "1") == "1":
+        DATABASES["default"]["OPTIONS"] = {
+            # Seconds to wait for another writer before "database is locked".
+            "timeout": 20,
+            # Take the write lock up front: a deferred transaction that reads
+            # and then writes can't wait for a concurrent writer and fails.
+            # This applies to every atomic() block, read-only ones included,
+            # so keep reads out of them; the app's are all writes, and
+            # requests aren't ATOMIC_REQUESTS.
+            "transaction_mode": "IMMEDIATE",
+            "init_command": (
+                "PRAGMA journal_mode = WAL;"
+                # Durable at checkpoints rather than every commit under WAL.
+                "PRAGMA synchronous = NORMAL;"
+                "PRAGMA mmap_size = 268435456;"
+                "PRAGMA cache_size = -32000;"
+                "PRAGMA temp_store = MEMORY;"
+            ),
+        }
+elif DB_ENGINE == "postgresql":
+    # Needs psycopg, see requirements-postgres.txt.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "rides"),
+            "USER": os.environ.get("DB_USER", "postgres"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+            # Reused connections are checked before each request.
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    if os.environ.get("DB_POOL") == "1":
+        # The pool replaces persistent connections; Django refuses both.
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 20)),
+            "timeout": 10,
+        }
+else:
+    raise ImproperlyConfigured(
+        f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}."
+    )
+
+# Read replicas of the default database: DB_REPLICAS lists SQLite files or
+# PostgreSQL hosts (host or host:port), comma-separated. Reads of safe API
+# requests go to them, see rides/routers.py. Without any, the routing tests
+# add a "replica" alias mirroring the test database themselves.
+RIDES_REPLICAS = []
+for number, location in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(",")), 1
+):
+    replica = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+    if DB_ENGINE == "sqlite":
+        replica["NAME"] = location
+    else:
+        replica["HOST"], _, port = location.partition(":")
+        replica["PORT"] = port or replica["PORT"]
+    DATABASES[f"replica{number}"] = replica
+    RIDES_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["rides.routers.ReplicaRouter"]
+
+# Seconds a client that wrote reads from the primary, to see its own writes
+# despite replication lag, and seconds an unreachable replica is skipped.
+RIDES_REPLICA_STICKY_SECONDS = 5
+RIDES_REPLICA_RETRY_SECONDS = 30
 
 
 # Password validation
@@ -130,6 +217,60 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 10,
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Ride list/detail response cache (see rides/cache.py). 0 disables it.
+RIDES_CACHE_ALIAS = "default"
+RIDES_CACHE_TIMEOUT = 60
+
+# Seconds CachedBasicAuthentication trusts verified credentials without
+# rehashing the password (0 disables it), and how many it remembers per
+# process. See rides/authentication.py.
+RIDES_AUTH_CACHE_TIMEOUT = 60
+RIDES_AUTH_CACHE_SIZE = 1024
+
+# Serialize ride list/detail responses through the precompiled, read-only
+# FastRideSerializer (same output as RideSerializer).
+RIDES_FAST_SERIALIZATION = False
+
+# Requests under this path are measured, see rides/instrumentation.py; every
+# one's latency is recorded, and the queries and serialization of a share of
+# them timed. benchmark_metrics measures the overhead.
+RIDES_METRICS_PATH_PREFIX = "/api/"
+RIDES_METRICS_SAMPLE_RATE = 0.1
+
+# Ride events older than this many days are moved to ArchivedRideEvent by the
+# archive_ride_events command.
+RIDES_EVENT_HOT_DAYS = 30
+
+# Trips longer than this count as long in user stats (rebuild them with the
+# rebuild_user_stats command after changing it) and by default in the
+# long-trip report.
+RIDES_LONG_TRIP_MINUTES = 60
+
+# Live ride event feed, see rides/live.py. LocalBackend publishes the events
+# this process creates; DatabaseBackend polls for events from every process.
+RIDES_LIVE_BACKEND = "rides.live.LocalBackend"
+RIDES_LIVE_POLL_SECONDS = 1.0
+# Events a subscriber may fall behind before it is disconnected.
+RIDES_LIVE_QUEUE_SIZE = 1000
+RIDES_LIVE_KEEPALIVE_SECONDS = 15
+# How long clients wait before reconnecting.
+RIDES_LIVE_RETRY_MS = 3000
+
+# Ride heatmaps, see rides/heatmap.py: rows read per chunk, the largest number
+# of rows or columns a grid may have, and the sizes whose grids are cached.
+RIDES_HEATMAP_CHUNK_SIZE = 50000
+RIDES_HEATMAP_MAX_SIZE = 1024
+RIDES_HEATMAP_CACHED_SIZES = (32, 64, 128, 256)
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
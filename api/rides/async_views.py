@@ -0,0 +1,239 @@
+"""
+Async list/retrieve endpoints for rides, ride events and users.
+
+Each view borrows the configuration of the matching viewset in views.py
+(authentication, permissions, filters, ordering, pagination and serializers),
+so both return the same responses, but reads rows through the async ORM. Under
+ASGI a request waiting on the database doesn't hold a worker thread.
+
+Authentication, permission checks and filter construction stay synchronous
+(they may query users) and run through ``sync_to_async``.
+"""
+
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import live
+from .authentication import CachedBasicAuthentication
+from .models import UserDailyStats
+from .pagination import afetch
+from .permissions import IsAdmin
+from .serializers import LiveFeedParamsSerializer
+from .views import RideEventViewSet, RideViewSet, UserViewSet, todays_ride_events
+
+
+class AsyncReadOnlyView(View):
+    """
+    Serves ``list`` (no ``pk`` in the URL) and ``retrieve`` for
+    ``viewset_class`` with async database reads.
+    """
+
+    viewset_class = None
+
+    async def get(self, request, *args, **kwargs):
+        action = "retrieve" if "pk" in kwargs else "list"
+        viewset = self.viewset_class(
+            action_map={"get": action},
+            args=args,
+            kwargs=kwargs,
+            format_kwarg=None,
+        )
+        request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.request = request
+        viewset.headers = {
+            **viewset.default_response_headers,
+            "Allow": ", ".join(self._allowed_methods()),
+        }
+        try:
+            await sync_to_async(viewset.initial)(request, *args, **kwargs)
+            if viewset.action == "retrieve":
+                response = await self.retrieve(viewset, kwargs["pk"])
+            else:
+                response = await self.list(viewset)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(request, response, *args, **kwargs)
+
+    async def list(self, viewset):
+        queryset = await sync_to_async(viewset.filter_queryset)(viewset.get_queryset())
+        paginator = viewset.paginator
+        if paginator is None:
+            results = await self.fetch(viewset, queryset)
+            return Response(viewset.get_serializer(results, many=True).data)
+        page = await self.paginate(viewset, queryset)
+        serializer = viewset.get_serializer(page, many=True)
+        return viewset.get_paginated_response(serializer.data)
+
+    async def paginate(self, viewset, queryset):
+        return await viewset.paginator.apaginate_queryset(
+            queryset,
+            viewset.request,
+            view=viewset,
+            fetch=lambda page_queryset: self.fetch(viewset, page_queryset),
+        )
+
+    async def retrieve(self, viewset, pk):
+        queryset = await sync_to_async(viewset.filter_queryset)(viewset.get_queryset())
+        instance = await self.get_object(viewset, queryset, pk)
+        viewset.check_object_permissions(viewset.request, instance)
+        return Response(viewset.get_serializer(instance).data)
+
+    async def fetch(self, viewset, queryset):
+        return await afetch(queryset)
+
+    async def get_object(self, viewset, queryset, pk):
+        # Same errors as rest_framework.generics.get_object_or_404.
+        try:
+            return await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            name = queryset.model._meta.object_name
+            raise Http404(f"No {name} matches the given query.")
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+
+
+class AsyncRideView(AsyncReadOnlyView):
+    """
+    Rides with the same todays_ride_events as RideViewSet. Instead of a
+    prefetch that waits for the rides, events are read with a subquery over
+    the same page, concurrently with the rides themselves.
+    """
+
+    viewset_class = RideViewSet
+
+    async def paginate(self, viewset, queryset):
+        request = viewset.request
+        ordering = request.query_params.get("ordering", "")
+        if (
+            viewset.get_origin() is not None
+            and "distance" in ordering
+            and not viewset.paginator.is_cursor_request(request)
+        ):
+            # Nearest-first pages rank rides in Python (spatial.NearestRides).
+            return await sync_to_async(viewset.paginate_queryset)(queryset)
+        return await super().paginate(viewset, queryset.prefetch_related(None))
+
+    async def fetch(self, viewset, queryset):
+        if not viewset.shows_todays_events():
+            return await afetch(queryset)
+        rides, events = await asyncio.gather(
+            afetch(queryset),
+            afetch(todays_ride_events().filter(ride__in=queryset.values("pk"))),
+        )
+        attach_todays_events(rides, events)
+        return rides
+
+    async def get_object(self, viewset, queryset, pk):
+        if not viewset.shows_todays_events():
+            return await super().get_object(viewset, queryset, pk)
+        # Built first: a pk that isn't an id fails here, before there is a
+        # get_object() coroutine to leave unawaited.
+        try:
+            events = todays_ride_events().filter(ride_id=pk)
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        ride, events = await asyncio.gather(
+            super().get_object(viewset, queryset.prefetch_related(None), pk),
+            afetch(events),
+        )
+        attach_todays_events([ride], events)
+        return ride
+
+
+class AsyncRideEventView(AsyncReadOnlyView):
+    viewset_class = RideEventViewSet
+
+    async def fetch(self, viewset, queryset):
+        return await super().fetch(viewset, with_descriptions(queryset))
+
+    async def get_object(self, viewset, queryset, pk):
+        return await super().get_object(viewset, with_descriptions(queryset), pk)
+
+
+class AsyncUserView(AsyncReadOnlyView):
+    """
+    Users, with the stats of ``?expand=stats`` read once the page is.
+    """
+
+    viewset_class = UserViewSet
+
+    async def fetch(self, viewset, queryset):
+        users = await super().fetch(viewset, queryset)
+        await self.load_stats(viewset, users)
+        return users
+
+    async def get_object(self, viewset, queryset, pk):
+        user = await super().get_object(viewset, queryset, pk)
+        await self.load_stats(viewset, [user])
+        return user
+
+    async def load_stats(self, viewset, users):
+        if viewset.expands_stats():
+            viewset.user_stats = await sync_to_async(UserDailyStats.objects.totals)(
+                [user.pk for user in users]
+            )
+
+
+def with_descriptions(events):
+    # Events are serialized in async code, where a description missing from
+    # the event type cache couldn't be queried for. todays_ride_events()
+    # selects them already.
+    return events.select_related("event_type")
+
+
+def attach_todays_events(rides, events):
+    by_ride = defaultdict(list)
+    for event in events:
+        by_ride[event.ride_id].append(event)
+    for ride in rides:
+        ride.todays_events = by_ride[ride.pk]
+
+
+class RideEventStreamView(View):
+    """
+    New ride events as Server-Sent Events, optionally only those of a
+    ``ride``, a ``driver`` or rides in a ``status``, see rides.live.
+
+    A client resuming after a disconnect sends the last id it saw as
+    ``Last-Event-ID`` (browsers' EventSource does) or ``?last_event_id=`` and
+    first gets the events it missed. Needs an ASGI server, which holds no
+    thread per open stream.
+    """
+
+    class api_view_class(APIView):
+        authentication_classes = [CachedBasicAuthentication]
+        permission_classes = [IsAdmin]
+
+    async def get(self, request, *args, **kwargs):
+        api_view = self.api_view_class(args=args, kwargs=kwargs, format_kwarg=None)
+        request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = request
+        api_view.headers = api_view.default_response_headers
+        try:
+            await sync_to_async(api_view.initial)(request, *args, **kwargs)
+            data = request.query_params.dict()
+            if "Last-Event-ID" in request.headers:
+                # EventSource reconnects to the URL it started from.
+                data["last_event_id"] = request.headers["Last-Event-ID"]
+            params = LiveFeedParamsSerializer(data=data)
+            params.is_valid(raise_exception=True)
+        except Exception as exc:
+            response = api_view.handle_exception(exc)
+            return api_view.finalize_response(request, response, *args, **kwargs)
+
+        filters = dict(params.validated_data)
+        last_event_id = filters.pop("last_event_id", None)
+        response = StreamingHttpResponse(
+            live.stream(filters, last_event_id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Don't let nginx buffer the stream.
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -0,0 +1,118 @@
+"""
+HTTP Basic authentication that doesn't rehash the password on every request.
+
+Django's password hashers are deliberately slow, which BasicAuthentication
+pays on every API call. ``CachedBasicAuthentication`` remembers credentials
+it has verified in a small per-process LRU, keyed by an HMAC of the username
+and password, for ``RIDES_AUTH_CACHE_TIMEOUT`` seconds.
+
+Entries hold the user's field values rather than the ``User`` itself, and
+every request gets its own instance built from them, so nothing one request
+sets on ``request.user`` is seen by another.
+
+Saving a user's username, password, role or active flag forgets their
+entries (see signals.py), but only in the process that saved them; other
+processes keep accepting the old credentials until the entries expire, so
+keep the timeout short.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import BasicAuthentication
+
+# Fields whose change must log out cached credentials.
+CREDENTIAL_FIELDS = {"username", "password", "role", "is_active"}
+
+
+class CredentialCache:
+    """
+    Thread-safe LRU of ``key -> value`` entries that expire after a timeout,
+    each belonging to the user with primary key ``pk``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, _, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, pk, value, timeout, max_size):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, pk, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def forget_user(self, pk):
+        with self.lock:
+            for key in [
+                k for k, (_, user_pk, _) in self.entries.items() if user_pk == pk
+            ]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+credential_cache = CredentialCache()
+
+
+def credentials_key(userid, password):
+    message = f"{userid}\0{password}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    def authenticate_credentials(self, userid, password, request=None):
+        timeout = settings.RIDES_AUTH_CACHE_TIMEOUT
+        if not timeout:
+            return super().authenticate_credentials(userid, password, request)
+
+        key = credentials_key(userid, password)
+        snapshot = credential_cache.get(key)
+        if snapshot is not None:
+            return (user_from_snapshot(snapshot), None)
+        user, _ = super().authenticate_credentials(userid, password, request)
+        credential_cache.set(
+            key,
+            user.pk,
+            user_snapshot(user),
+            timeout,
+            settings.RIDES_AUTH_CACHE_SIZE,
+        )
+        return (user, None)
+
+
+def user_snapshot(user):
+    fields = user._meta.concrete_fields
+    return (
+        type(user),
+        user._state.db,
+        tuple(field.attname for field in fields),
+        tuple(getattr(user, field.attname) for field in fields),
+    )
+
+
+def user_from_snapshot(snapshot):
+    # A new instance each time, as if just read from the database.
+    model, db, field_names, values = snapshot
+    return model.from_db(db, field_names, values)
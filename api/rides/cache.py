@@ -0,0 +1,204 @@
+"""
+Response cache for ride reads, invalidated through version tags.
+
+Each cached response records the version of every tag it depends on: the list
+generation for list responses, plus one tag per ride and per rider/driver it
+contains. Writes bump the versions of the tags they touch (see signals.py), so
+a lookup is a hit only if none of those versions changed since it was stored.
+"""
+
+import hashlib
+import threading
+import uuid
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+
+# Bumped by anything that can change which rides a list returns.
+LIST_TAG = "rides"
+# Bumped by writes that bypass model signals (bulk loads, truncates).
+ALL_TAG = "all"
+# When rides last changed in a way their updated_at can't show, see
+# rides.conditional.
+CHANGED_AT_KEY = "rides:changed-at"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def get_cache():
+    return caches[settings.RIDES_CACHE_ALIAS]
+
+
+def ride_tag(pk):
+    return f"ride:{pk}"
+
+
+def user_tag(pk):
+    return f"user:{pk}"
+
+
+def _version_key(tag):
+    return f"rides:version:{tag}"
+
+
+def invalidate(*tags):
+    get_cache().set_many(
+        {_version_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None
+    )
+
+
+def invalidate_all():
+    invalidate(ALL_TAG)
+    mark_changed()
+
+
+def mark_changed():
+    get_cache().set(CHANGED_AT_KEY, timezone.now(), timeout=None)
+
+
+def changed_at():
+    cache = get_cache()
+    # Unknown (e.g. after a cache flush) counts as just now.
+    cache.add(CHANGED_AT_KEY, timezone.now(), timeout=None)
+    return cache.get(CHANGED_AT_KEY)
+
+
+def current_versions(tags):
+    cache = get_cache()
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class CachedResponseMixin:
+    """
+    Serves ``list`` and ``retrieve`` from the response cache. Other actions
+    can go through ``cached_response()`` too; like lists, their entries are
+    dropped by any ride write.
+
+    Views provide ``get_cache_tags(data)`` naming the tags a response depends
+    on and may provide ``get_cache_ttl(data)`` to expire it sooner than
+    ``RIDES_CACHE_TIMEOUT``. The ``response_validators`` a view set while
+    producing a response are stored with it, see rides.conditional.
+    """
+
+    response_validators = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_ttl(self, data):
+        return settings.RIDES_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        params = urlencode(
+            sorted(
+                (key, sorted(values)) for key, values in request.query_params.lists()
+            ),
+            doseq=True,
+        )
+        # Pagination links are absolute, so the host is part of the key.
+        raw = f"{self.action}|{request.build_absolute_uri(request.path)}|{params}"
+        return f"rides:response:{hashlib.md5(raw.encode()).hexdigest()}"
+
+    def get_cache_entry(self, request):
+        """
+        The cached entry for ``request`` if it is still current, else None.
+        Looked up once per request.
+        """
+        if not settings.RIDES_CACHE_TIMEOUT:
+            return None
+        if not hasattr(self, "_cache_entry"):
+            entry = get_cache().get(self.get_response_cache_key(request))
+            if (
+                entry is not None
+                and current_versions(entry["versions"]) != entry["versions"]
+            ):
+                entry = None
+            self._cache_entry = entry
+        return self._cache_entry
+
+    def get_stored_validators(self, request):
+        entry = self.get_cache_entry(request)
+        return None if entry is None else entry.get("validators")
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RIDES_CACHE_TIMEOUT:
+            return handler(request, *args, **kwargs)
+
+        entry = self.get_cache_entry(request)
+        if entry is not None:
+            _count("hits")
+            response = Response(entry["data"])
+            response["X-Cache"] = "HIT"
+            return response
+
+        _count("misses")
+        # Taken before the query runs so a concurrent write to the list makes
+        # the stored entry stale rather than silently missing it.
+        # Only a single ride's response can't show any other ride.
+        versions = current_versions(
+            [ALL_TAG] if self.action == "retrieve" else [ALL_TAG, LIST_TAG]
+        )
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            versions.update(current_versions(self.get_cache_tags(response.data)))
+            timeout = min(
+                settings.RIDES_CACHE_TIMEOUT, self.get_cache_ttl(response.data)
+            )
+            if timeout > 0:
+                get_cache().set(
+                    self.get_response_cache_key(request),
+                    {
+                        "data": response.data,
+                        "versions": versions,
+                        "validators": self.response_validators,
+                    },
+                    timeout,
+                )
+        response["X-Cache"] = "MISS"
+        return response
+
+
+def seconds_until_events_expire(rides, window=timedelta(days=1)):
+    """
+    Seconds until the first ``todays_ride_events`` entry in ``rides`` falls out
+    of the trailing ``window``, or None if none of them will.
+    """
+    now = timezone.now()
+    expires = [
+        parse_datetime(event["created_at"]) + window
+        for ride in rides
+        for event in ride.get("todays_ride_events", [])
+    ]
+    if not expires:
+        return None
+    return max(int((min(expires) - now).total_seconds()), 0)
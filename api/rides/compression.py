@@ -0,0 +1,53 @@
+"""
+Response compression negotiated through ``Accept-Encoding``: Zstandard when
+the client accepts it and the optional zstandard package is installed, else
+gzip like Django's ``GZipMiddleware``.
+
+HTML responses (the browsable API and the admin) are sent as they are, since
+their pages carry a CSRF token that compression would expose (BREACH).
+"""
+
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import zstandard
+except ImportError:  # Optional, see requirements-formats.txt.
+    zstandard = None
+
+re_accepts_zstd = re.compile(r"\bzstd\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    # Zstandard's default, about as fast as gzip's lowest level and smaller
+    # than its highest.
+    zstd_level = 3
+
+    def process_response(self, request, response):
+        if response.get("Content-Type", "").startswith("text/html"):
+            return response
+        if (
+            zstandard is None
+            or response.streaming
+            or not re_accepts_zstd.search(request.headers.get("Accept-Encoding", ""))
+        ):
+            return super().process_response(request, response)
+
+        # The same checks GZipMiddleware makes.
+        if len(response.content) < 200 or response.has_header("Content-Encoding"):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed = zstandard.ZstdCompressor(level=self.zstd_level).compress(
+            response.content
+        )
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = "zstd"
+        return response
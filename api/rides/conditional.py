@@ -0,0 +1,139 @@
+"""
+Conditional GET (ETag / Last-Modified) for ride responses.
+
+The validators of a response are computed by one aggregate query over the
+rides it is drawn from, without loading or serializing them:
+
+* the latest ``Ride.updated_at``, which every write to a ride or its events
+  bumps, of the ride or, for lists, of any ride;
+* how many rides there are, which pagination needs anyway (lists filtered
+  relative to the current time, such as ``idle_minutes``, change without any
+  write and have no validators at all);
+* the latest of the given events that fell out of the 24 hour window rides
+  embed (see ``todays_ride_events``) during the last day, as that changes the
+  response without any write;
+* ``cache.changed_at()``, for changes no updated_at shows: deleted rides,
+  rider and driver edits and bulk loads.
+
+A request whose ``If-None-Match``, or failing that ``If-Modified-Since``, still
+matches gets an empty 304 response. Events falling out of the window are only
+known for the last day, so older ``If-Modified-Since`` dates are not honoured.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.db.models import Func, IntegerField, Subquery
+from django.db.models.expressions import Star
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import cache
+
+
+def ride_validators(rides, updated, events, variant="", window=timedelta(days=1)):
+    """
+    The validators of a response showing ``rides``, which changes whenever
+    one of the ``updated`` rides does or one of ``events`` falls out of the
+    window. ``variant`` tells apart responses drawn from the same rides (the
+    URL).
+
+    Returns a dict of the ``version`` ETags are made from, the
+    ``last_modified`` and ``checked_at`` timestamps and the number of
+    ``rides``.
+    """
+    now = timezone.now()
+    cutoff = now - window
+    expired = events.filter(
+        created_at__gte=cutoff - window, created_at__lt=cutoff
+    ).order_by("-created_at")
+    # One row: the latest updated ride, with the rest as subqueries. The
+    # count is the one pagination needs anyway.
+    row = (
+        updated.order_by("-updated_at")
+        .values("updated_at")
+        .annotate(
+            rides=Subquery(
+                rides.order_by().values(
+                    n=Func(Star(), function="COUNT", output_field=IntegerField())
+                )
+            ),
+            last_expired_at=Subquery(expired.values("created_at")[:1]),
+        )
+        .first()
+    ) or {"updated_at": None, "rides": 0, "last_expired_at": None}
+    changed_at = cache.changed_at()
+    raw = "|".join(str(value) for value in [variant, *row.values(), changed_at])
+
+    modified = [changed_at, row["updated_at"]]
+    if row["last_expired_at"] is not None:
+        modified.append(row["last_expired_at"] + window)
+    return {
+        "version": hashlib.md5(raw.encode()).hexdigest(),
+        "last_modified": int(max(t for t in modified if t is not None).timestamp()),
+        "checked_at": now.timestamp(),
+        "rides": row["rides"],
+    }
+
+
+class ConditionalGetMixin:
+    """
+    Answers ``list`` and ``retrieve`` with 304 Not Modified when the client's
+    copy is current, see the module docstring, and adds ``ETag`` and
+    ``Last-Modified`` to their responses.
+
+    Views provide ``get_validator_querysets()``, the ``rides``, ``updated``
+    and ``events`` arguments of ``ride_validators``, or None to answer
+    unconditionally. Listed before ``CachedResponseMixin``, validators are
+    stored with cached responses, so answering from the cache, 304 or not,
+    runs no query.
+    """
+
+    validator_window = timedelta(days=1)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_validators(self, request):
+        get_stored_validators = getattr(self, "get_stored_validators", None)
+        if get_stored_validators is not None:
+            validators = get_stored_validators(request)
+            if validators is not None:
+                return validators
+        querysets = self.get_validator_querysets()
+        if querysets is None:
+            return None
+        return ride_validators(
+            *querysets, request.get_full_path(), self.validator_window
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        last_modified = validators["last_modified"]
+        since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE"))
+        if since is not None and since < (
+            validators["checked_at"] - self.validator_window.total_seconds()
+        ):
+            # Before events that fell out of the window are known.
+            last_modified = None
+        # One per format, which share validators and cached entries.
+        etag = f'W/"{validators["version"]}-{request.accepted_renderer.format}"'
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            self.response_validators = validators
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(validators["last_modified"])
+            # Authenticated data clients may keep, but must revalidate.
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
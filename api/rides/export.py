@@ -0,0 +1,91 @@
+"""
+Streaming bulk export of rides with all of their events, hot and archived.
+
+Rides are read with ``QuerySet.iterator(chunk_size=...)``, which fetches rows in
+chunks (through a server-side cursor where the backend has one) and runs the
+events prefetch once per chunk, so memory stays bounded by the chunk size
+however many rides match. Output is flushed once per chunk.
+"""
+
+import csv
+import io
+
+from django.db.models import Prefetch
+
+from .models import ArchivedRideEvent, RideEvent
+from .renderers import ndjson_line
+from .serializers import RideExportSerializer, compiled_representation
+
+RIDE_COLUMNS = [name for name in RideExportSerializer.Meta.fields if name != "events"]
+EVENT_FIELDS = ["id_ride_event", "description", "created_at"]
+EVENT_COLUMNS = ["event_id", "event_description", "event_created_at"]
+
+
+def export_queryset(queryset):
+    # Leading with ride lets the (ride, created_at) indexes serve the sorts.
+    ordering = ["ride", "created_at", "id_ride_event"]
+    return queryset.order_by("pickup_time", "id_ride").prefetch_related(
+        Prefetch(
+            "ride_events",
+            queryset=RideEvent.objects.order_by(*ordering),
+            to_attr="export_events",
+        ),
+        Prefetch(
+            "archived_events",
+            queryset=ArchivedRideEvent.objects.order_by(*ordering),
+            to_attr="export_archived_events",
+        ),
+    )
+
+
+def iter_rides(queryset, chunk_size):
+    represent = compiled_representation(RideExportSerializer)
+    for ride in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        if ride.export_archived_events:
+            ride.export_events = sorted(
+                ride.export_archived_events + ride.export_events,
+                key=lambda event: (event.created_at, event.id_ride_event),
+            )
+        yield represent(ride)
+
+
+def stream_ndjson(queryset, chunk_size):
+    lines = []
+    for ride in iter_rides(queryset, chunk_size):
+        lines.append(ndjson_line(ride))
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def stream_csv(queryset, chunk_size):
+    """
+    One row per ride event, repeating the ride columns; rides without events
+    get a single row with empty event columns.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(RIDE_COLUMNS + EVENT_COLUMNS)
+    yield _drain(buffer)
+
+    no_events = [None] * len(EVENT_FIELDS)
+    for count, ride in enumerate(iter_rides(queryset, chunk_size), 1):
+        columns = [ride[name] for name in RIDE_COLUMNS]
+        for event in ride["events"] or [None]:
+            if event is None:
+                writer.writerow(columns + no_events)
+            else:
+                writer.writerow(columns + [event[name] for name in EVENT_FIELDS])
+        if count % chunk_size == 0:
+            yield _drain(buffer)
+    if buffer.tell():
+        yield _drain(buffer)
+
+
+def _drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
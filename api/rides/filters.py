@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django_filters import rest_framework as filters
+
+from .models import Ride, RideEvent, User
+
+
+class RideFilter(filters.FilterSet):
+    rider__email = filters.CharFilter(method="filter_rider_email")
+    # ?pickup_time_after=...&pickup_time_before=... (ISO 8601, inclusive), and
+    # the same for last_event_at.
+    pickup_time = filters.IsoDateTimeFromToRangeFilter()
+    last_event_at = filters.IsoDateTimeFromToRangeFilter()
+    # Rides without any event in the last N minutes, including rides that
+    # have none at all. Capped at a century, beyond which the cutoff would
+    # overflow datetime.
+    idle_minutes = filters.NumberFilter(
+        method="filter_idle_minutes", min_value=0, max_value=100 * 366 * 24 * 60
+    )
+
+    # Filters whose matches change as time passes, without any write.
+    relative_to_now = ["idle_minutes"]
+
+    class Meta:
+        model = Ride
+        fields = {
+            "status": ["exact"],
+            "last_event_description": ["exact"],
+            "event_count": ["exact", "gte", "lte"],
+            "trip_distance_km": ["gte", "lte"],
+            "duration_seconds": ["gte", "lte"],
+        }
+
+    def filter_rider_email(self, queryset, name, value):
+        # Resolve the email to rider ids up front: filtering on id_rider lets
+        # the (rider, pickup_time, id_ride) index serve the ordering too, which
+        # it can't through a join on a non-unique column.
+        rider_ids = User.objects.filter(email=value).values_list("pk", flat=True)
+        return queryset.filter(rider__in=list(rider_ids))
+
+    def filter_idle_minutes(self, queryset, name, value):
+        cutoff = timezone.now() - timedelta(minutes=float(value))
+        return queryset.filter(
+            Q(last_event_at__lt=cutoff) | Q(last_event_at__isnull=True)
+        )
+
+
+class RideEventFilter(filters.FilterSet):
+    # Compared by event type code, see RideEventType.
+    description = filters.CharFilter(method="filter_description")
+
+    class Meta:
+        model = RideEvent
+        fields = ["ride__id_ride"]
+
+    def filter_description(self, queryset, name, value):
+        return queryset.with_description(value)
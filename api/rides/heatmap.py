@@ -0,0 +1,131 @@
+"""
+Ride density grids for heatmaps, see ``RideViewSet.heatmap``.
+
+The pickup or dropoff coordinates of the matching rides are read straight from
+the cursor, ``RIDES_HEATMAP_CHUNK_SIZE`` rows at a time (through a server-side
+cursor where the backend has one), and counted into the grid one chunk at a
+time, so memory is bounded by a chunk and the grid however many rides match.
+With NumPy installed (see requirements-heatmap.txt) a chunk is binned with
+array operations; without it, in a Python loop about a third slower.
+"""
+
+from django.db import connections
+from django.db.models.sql.constants import MULTI
+
+try:
+    import numpy
+except ImportError:  # Optional, see requirements-heatmap.txt.
+    numpy = None
+
+POINT_FIELDS = {
+    "pickup": ("pickup_latitude", "pickup_longitude"),
+    "dropoff": ("dropoff_latitude", "dropoff_longitude"),
+}
+
+
+class Grid:
+    """
+    Counts of points in ``rows`` x ``cols`` equal cells over the bounding box,
+    row 0 being the southernmost. Points on the north or east edge count in
+    the last row or column.
+    """
+
+    def __init__(self, south, west, north, east, rows, cols):
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.rows, self.cols = rows, cols
+        self.row_scale = rows / (north - south)
+        self.col_scale = cols / (east - west)
+        if numpy is not None:
+            self.counts = numpy.zeros(rows * cols, dtype=numpy.int64)
+        else:
+            self.counts = [0] * (rows * cols)
+
+    def add(self, points):
+        """
+        Count ``points``, a sequence of (latitude, longitude) pairs inside the
+        bounding box.
+        """
+        if not points:
+            return
+        if numpy is None:
+            self._add_each(points)
+            return
+        points = numpy.asarray(points, dtype=numpy.float64)
+        rows = ((points[:, 0] - self.south) * self.row_scale).astype(numpy.intp)
+        cols = ((points[:, 1] - self.west) * self.col_scale).astype(numpy.intp)
+        numpy.minimum(rows, self.rows - 1, out=rows)
+        numpy.minimum(cols, self.cols - 1, out=cols)
+        self.counts += numpy.bincount(
+            rows * self.cols + cols, minlength=self.rows * self.cols
+        )
+
+    def _add_each(self, points):
+        counts, south, west = self.counts, self.south, self.west
+        row_scale, col_scale = self.row_scale, self.col_scale
+        last_row, last_col, cols = self.rows - 1, self.cols - 1, self.cols
+        for latitude, longitude in points:
+            row = min(int((latitude - south) * row_scale), last_row)
+            col = min(int((longitude - west) * col_scale), last_col)
+            counts[row * cols + col] += 1
+
+    def cells(self):
+        """
+        ``[row, col, count]`` of every cell with a point, row by row.
+        """
+        if numpy is not None:
+            indexes = numpy.flatnonzero(self.counts)
+            counts = self.counts[indexes]
+            return [
+                [index // self.cols, index % self.cols, count]
+                for index, count in zip(indexes.tolist(), counts.tolist())
+            ]
+        return [
+            [index // self.cols, index % self.cols, count]
+            for index, count in enumerate(self.counts)
+            if count
+        ]
+
+
+def build(rides, point, bbox, rows, cols, chunk_size):
+    """
+    The heatmap of the ``point`` ("pickup" or "dropoff") coordinates of
+    ``rides`` within ``bbox``, (south, west, north, east).
+    """
+    south, west, north, east = bbox
+    latitude, longitude = POINT_FIELDS[point]
+    points = rides.filter(
+        **{
+            f"{latitude}__range": (south, north),
+            f"{longitude}__range": (west, east),
+        }
+    ).order_by()
+    grid = Grid(south, west, north, east, rows, cols)
+    total = 0
+    for chunk in point_chunks(points, [latitude, longitude], chunk_size):
+        grid.add(chunk)
+        total += len(chunk)
+    cells = grid.cells()
+    return {
+        "point": point,
+        "bbox": [south, west, north, east],
+        "rows": rows,
+        "cols": cols,
+        "total": total,
+        "max": max((count for _, _, count in cells), default=0),
+        "cells": cells,
+    }
+
+
+def point_chunks(queryset, fields, chunk_size):
+    """
+    Lists of up to ``chunk_size`` raw ``fields`` rows of ``queryset``, as
+    ``QuerySet.iterator()`` fetches them but without building a tuple per row
+    on top.
+    """
+    query = queryset.values_list(*fields).query
+    connection = connections[queryset.db]
+    yield from query.get_compiler(queryset.db).execute_sql(
+        MULTI,
+        chunked_fetch=connection.features.can_use_chunked_reads,
+        chunk_size=chunk_size,
+    )
@@ -0,0 +1,146 @@
+"""
+Batched ride event ingestion.
+
+A batch is validated item by item, then checked against the database with a
+single query for the rides it references. Valid events are written with one
+``bulk_create`` in one transaction, together with the ``Ride`` event summary,
+``Ride.status``, ``RideTrip`` and ``UserDailyStats`` updates their signals
+would otherwise have produced.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import cache, live
+from .models import Ride, RideEvent, RideEventType, RideTrip, UserDailyStats
+from .serializers import BulkRideEventSerializer
+
+STATUS_PREFIX = "Status changed to "
+
+
+def status_for(description):
+    """
+    The ride status a "Status changed to <status>" event sets, if any.
+    """
+    if not description.startswith(STATUS_PREFIX):
+        return None
+    status = description.removeprefix(STATUS_PREFIX)
+    max_length = Ride._meta.get_field("status").max_length
+    return status if 0 < len(status) <= max_length else None
+
+
+def ingest_events(items):
+    """
+    Validate and store ``items``, returning one result per item, in order.
+
+    Invalid items are reported and skipped; the valid ones are still written.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BulkRideEventSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = _error(index, serializer.errors)
+
+    ride_ids = {data["ride_id"] for _, data in valid}
+    existing = set(Ride.objects.filter(pk__in=ride_ids).values_list("pk", flat=True))
+    # Types a batch introduces are created whether or not its events are,
+    # which is harmless.
+    codes = RideEventType.objects.codes_for(
+        data["description"] for _, data in valid if data["ride_id"] in existing
+    )
+    indexes, events = [], []
+    for index, data in valid:
+        if data["ride_id"] in existing:
+            indexes.append(index)
+            events.append(
+                RideEvent(
+                    ride_id=data["ride_id"],
+                    event_type_id=codes[data["description"]],
+                    created_at=data["created_at"],
+                )
+            )
+        else:
+            message = f'Invalid pk "{data["ride_id"]}" - object does not exist.'
+            results[index] = _error(index, {"ride": [message]})
+
+    if events:
+        with transaction.atomic():
+            statuses = _new_statuses(events)
+            RideEvent.objects.bulk_create(events)
+            event_ride_ids = {event.ride_id for event in events}
+            Ride.objects.filter(pk__in=event_ride_ids).refresh_event_summary()
+            for status, pks in _group_by_status(statuses).items():
+                Ride.objects.filter(pk__in=pks).update(
+                    status=status, updated_at=timezone.now()
+                )
+            trip_ride_ids = {
+                event.ride_id
+                for event in events
+                if event.description in (RideEvent.PICKUP, RideEvent.DROPOFF)
+            }
+            if trip_ride_ids:
+                RideTrip.objects.rebuild(trip_ride_ids)
+            UserDailyStats.objects.refresh_rides(trip_ride_ids | statuses.keys())
+            # bulk_create() sends no post_save to publish them either.
+            live.events_created(event.pk for event in events)
+        # bulk_create() and update() don't send the signals that invalidate
+        # cached responses.
+        cache.invalidate(cache.LIST_TAG, *(cache.ride_tag(pk) for pk in event_ride_ids))
+
+    for index, event in zip(indexes, events):
+        results[index] = {
+            "index": index,
+            "status": "created",
+            "id_ride_event": event.pk,
+        }
+    return results
+
+
+def _new_statuses(events):
+    """
+    ``{ride_id: status}`` for rides whose latest status change is in
+    ``events``, rather than already stored with a later ``created_at``.
+    """
+    latest = {}
+    for event in events:
+        status = status_for(event.description)
+        if status is None:
+            continue
+        current = latest.get(event.ride_id)
+        if current is None or event.created_at >= current[0]:
+            latest[event.ride_id] = (event.created_at, status)
+    if not latest:
+        return {}
+
+    stored = (
+        RideEvent.objects.filter(
+            ride_id__in=latest,
+            event_type__in=RideEventType.objects.filter(
+                description__startswith=STATUS_PREFIX
+            ),
+        )
+        .values("ride_id")
+        .annotate(created_at=Max("created_at"))
+        .order_by()
+    )
+    for row in stored:
+        if row["created_at"] > latest[row["ride_id"]][0]:
+            del latest[row["ride_id"]]
+    return {ride_id: status for ride_id, (_, status) in latest.items()}
+
+
+def _group_by_status(statuses):
+    groups = defaultdict(list)
+    for ride_id, status in statuses.items():
+        groups[status].append(ride_id)
+    return groups
+
+
+def _error(index, errors):
+    return {"index": index, "status": "error", "errors": errors}
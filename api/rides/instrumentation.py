@@ -0,0 +1,256 @@
+"""
+Per-request performance metrics: latency, query count, database time and
+serialization time, by view.
+
+``RequestMetricsMiddleware`` times every request under
+``RIDES_METRICS_PATH_PREFIX``, and leaves the rest of the project alone. For a
+sample of them (``RIDES_METRICS_SAMPLE_RATE``) it also counts and times
+database queries,
+through an execute wrapper installed on every connection (see signals.py), and
+the time the timed serializers spend producing ``data``. Each response gets a
+``Server-Timing`` header, and ``registry`` keeps histograms per view that
+``MetricsView`` serves in the Prometheus text format. Metrics are per process.
+``manage.py benchmark_metrics`` measures what this costs per request.
+"""
+
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework import serializers
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# The metrics of the sampled request being handled, shared with the threads
+# sync_to_async runs its queries in.
+_current = ContextVar("rides_request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "db_time", "serialize_time", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_recorder(connection):
+    # Permanently, rather than per request with connection.execute_wrapper(),
+    # so queries the async ORM runs on other threads' connections are seen.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    metrics = _current.get()
+    # Nested serializers' data is part of the outer serializer's time.
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Counts producing ``data`` towards the request's serialization time. Set
+    ``Meta.list_serializer_class = TimedListSerializer`` to also time
+    ``many=True``.
+    """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            yield f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}"
+        yield f"{name}_sum{_labels(**labels)} {self.sum}"
+        yield f"{name}_count{_labels(**labels)} {self.count}"
+
+
+class MetricsRegistry:
+    # name: (help, buckets). All but the duration are only recorded for
+    # sampled requests.
+    HISTOGRAMS = {
+        "rides_request_duration_seconds": (
+            "Time to produce a response.",
+            SECONDS_BUCKETS,
+        ),
+        "rides_request_queries": ("Database queries per request.", QUERY_BUCKETS),
+        "rides_request_db_seconds": (
+            "Time spent in database queries per request.",
+            SECONDS_BUCKETS,
+        ),
+        "rides_request_serialize_seconds": (
+            "Time spent serializing per request.",
+            SECONDS_BUCKETS,
+        ),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, method, elapsed, metrics):
+        values = {"rides_request_duration_seconds": elapsed}
+        if metrics is not None:
+            values.update(
+                rides_request_queries=metrics.queries,
+                rides_request_db_seconds=metrics.db_time,
+                rides_request_serialize_seconds=metrics.serialize_time,
+            )
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view, method)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = Histogram(self.HISTOGRAMS[name][1])
+                    self.histograms[key] = histogram
+                histogram.observe(value)
+
+    def render(self, extra=()):
+        """
+        The histograms, then ``extra`` ``(name, type, help, value)`` metrics,
+        in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (key_name, view, method), histogram in sorted(
+                    self.histograms.items()
+                ):
+                    if key_name == name:
+                        lines += histogram.samples(
+                            name, {"view": view, "method": method}
+                        )
+        for name, kind, help_text, value in extra:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _labels(**labels):
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def server_timing(elapsed, metrics):
+    entries = []
+    if metrics is not None:
+        entries += [
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f"serialize;dur={metrics.serialize_time * 1000:.1f}",
+        ]
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.is_measured(request):
+            return self.get_response(request)
+        started, metrics, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started, metrics)
+
+    async def __acall__(self, request):
+        if not self.is_measured(request):
+            return await self.get_response(request)
+        started, metrics, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started, metrics)
+
+    def is_measured(self, request):
+        return request.path.startswith(settings.RIDES_METRICS_PATH_PREFIX)
+
+    def start(self):
+        sampled = random.random() < settings.RIDES_METRICS_SAMPLE_RATE
+        metrics = RequestMetrics() if sampled else None
+        return time.perf_counter(), metrics, _current.set(metrics)
+
+    def finish(self, request, response, started, metrics):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match is not None else "unmatched"
+        registry.observe(view, request.method, elapsed, metrics)
+        response["Server-Timing"] = server_timing(elapsed, metrics)
+        return response
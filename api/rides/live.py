@@ -0,0 +1,254 @@
+"""
+Live feed of new ride events over Server-Sent Events, see
+``RideEventStreamView``.
+
+Each worker process has one ``Broker`` fanning events out to the streams open
+in it. A subscriber's queue is bounded: one that falls ``RIDES_LIVE_QUEUE_SIZE``
+events behind is sent an ``overflow`` event and disconnected, so a slow client
+never holds up publishing or grows the worker's memory. Like any client that
+reconnects, it passes ``Last-Event-ID`` and catches up from the database.
+
+Where events come from is up to the backend, ``RIDES_LIVE_BACKEND``:
+
+* ``LocalBackend`` publishes the events this process creates, as their
+  transactions commit. Enough when one process serves both writes and streams.
+* ``DatabaseBackend`` polls the ride event table every
+  ``RIDES_LIVE_POLL_SECONDS`` while the process has subscribers, so every
+  worker sees every event, at one query per worker rather than per client.
+
+Both read new events by increasing id, as resuming does, so an event committed
+after one with a higher id (concurrent writers on PostgreSQL) can be missed by
+polling and resuming clients.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+from functools import cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+from .models import RideEvent, RideEventType
+
+_created_at = serializers.DateTimeField()
+
+
+class Subscriber:
+    """
+    One stream's filters and queue. ``deliver`` and ``get`` run on the event
+    loop the subscriber was created on.
+    """
+
+    def __init__(self, ride=None, driver=None, status=None, queue_size=1000):
+        filters = {"ride": ride, "driver": driver, "status": status}
+        self.filters = {
+            key: value for key, value in filters.items() if value is not None
+        }
+        self.loop = asyncio.get_running_loop()
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def matches(self, message):
+        return all(message[key] == value for key, value in self.filters.items())
+
+    def deliver(self, messages):
+        if self.overflowed:
+            return
+        if len(self.queue) + len(messages) > self.queue_size:
+            self.overflowed = True
+        else:
+            self.queue.extend(messages)
+        self.ready.set()
+
+    async def get(self, timeout):
+        """
+        The messages queued so far, waiting up to ``timeout`` seconds for the
+        first. Empty on timeout.
+        """
+        if not self.queue and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+        messages = list(self.queue)
+        self.queue.clear()
+        return messages
+
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def publish(self, messages):
+        """
+        Queue ``messages`` for every subscriber they match. Safe to call from
+        any thread; never waits for subscribers.
+        """
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            matching = [message for message in messages if subscriber.matches(message)]
+            if matching:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, matching)
+
+
+broker = Broker()
+
+
+def event_messages(events):
+    """
+    The feed messages of the ``events`` queryset.
+    """
+    rows = events.values_list(
+        "pk", "ride_id", "ride__driver_id", "ride__status", "event_type", "created_at"
+    )
+    description_for = RideEventType.objects.description_for
+    return [
+        {
+            "id": pk,
+            "ride": ride,
+            "driver": driver,
+            "status": status,
+            "description": description_for(event_type),
+            "created_at": _created_at.to_representation(created_at),
+        }
+        for pk, ride, driver, status, event_type, created_at in rows
+    ]
+
+
+def events_after(event_id, ride=None, driver=None, status=None):
+    """
+    The events with an id above ``event_id`` that match the filters, oldest
+    first.
+    """
+    events = RideEvent.objects.filter(pk__gt=event_id).order_by("pk")
+    if ride is not None:
+        events = events.filter(ride_id=ride)
+    if driver is not None:
+        events = events.filter(ride__driver_id=driver)
+    if status is not None:
+        events = events.filter(ride__status=status)
+    return events
+
+
+class LocalBackend:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def events_created(self, pks):
+        """
+        Called once the transaction that created ride events ``pks``
+        committed.
+        """
+        if len(self.broker):
+            events = RideEvent.objects.filter(pk__in=pks).order_by("pk")
+            self.broker.publish(event_messages(events))
+
+    def subscribed(self):
+        """
+        Called on the event loop when a stream starts.
+        """
+
+
+class DatabaseBackend(LocalBackend):
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.task = None
+
+    def events_created(self, pks):
+        pass  # Polled, whichever process wrote them.
+
+    def subscribed(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.poll())
+
+    async def poll(self):
+        last_id = await sync_to_async(self.last_event_id)()
+        while len(self.broker):
+            await asyncio.sleep(settings.RIDES_LIVE_POLL_SECONDS)
+            messages = await sync_to_async(event_messages)(events_after(last_id))
+            if messages:
+                last_id = messages[-1]["id"]
+                self.broker.publish(messages)
+
+    def last_event_id(self):
+        last = RideEvent.objects.order_by("-pk").values_list("pk", flat=True).first()
+        return last or 0
+
+
+@cache
+def get_backend():
+    return import_string(settings.RIDES_LIVE_BACKEND)(broker)
+
+
+def events_created(pks):
+    """
+    Publish ride events ``pks`` once the current transaction commits.
+    """
+    pks = list(pks)
+    transaction.on_commit(lambda: get_backend().events_created(pks))
+
+
+async def stream(filters, last_event_id=None):
+    """
+    The SSE body of a subscription to the events matching ``filters``: the
+    missed ones after ``last_event_id``, if given, then new ones as they come,
+    with a comment every ``RIDES_LIVE_KEEPALIVE_SECONDS`` while idle.
+    """
+    # Subscribed before catching up so nothing falls in between; what
+    # arrives twice is skipped by id.
+    subscriber = Subscriber(**filters, queue_size=settings.RIDES_LIVE_QUEUE_SIZE)
+    broker.subscribe(subscriber)
+    try:
+        get_backend().subscribed()
+        yield f"retry: {settings.RIDES_LIVE_RETRY_MS}\n\n"
+        if last_event_id is not None:
+            batch_size = settings.RIDES_LIVE_QUEUE_SIZE
+            while True:
+                missed = await sync_to_async(event_messages)(
+                    events_after(last_event_id, **filters)[:batch_size]
+                )
+                for message in missed:
+                    yield sse_event(message)
+                    last_event_id = message["id"]
+                if len(missed) < batch_size:
+                    break
+
+        while True:
+            messages = await subscriber.get(settings.RIDES_LIVE_KEEPALIVE_SECONDS)
+            if not messages and not subscriber.overflowed:
+                yield ": keepalive\n\n"
+            for message in messages:
+                if last_event_id is None or message["id"] > last_event_id:
+                    yield sse_event(message)
+                    last_event_id = message["id"]
+            if subscriber.overflowed:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+def sse_event(message):
+    data = json.dumps(message, separators=(",", ":"))
+    return f"id: {message['id']}\nevent: ride_event\ndata: {data}\n\n"
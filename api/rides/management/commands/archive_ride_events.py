@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rides.models import ArchivedRideEvent, RideEvent
+
+FIELDS = ["id_ride_event", "ride", "event_type", "created_at"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves ride events older than --older-than-days from the ride event "
+        "table to the archive, oldest first, in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=settings.RIDES_EVENT_HOT_DAYS
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches, to leave room for writers.",
+        )
+
+    def handle(self, *args, **options):
+        # Rides are served with their events from the last 24 hours, which
+        # must stay in the hot table.
+        if options["older_than_days"] < 1:
+            raise CommandError("--older-than-days must be at least 1.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options["pause"] < 0:
+            raise CommandError("--pause must not be negative.")
+
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+        started = time.monotonic()
+        moved = 0
+        while batch := self.archive_batch(cutoff, options["batch_size"]):
+            moved += batch
+            self.stdout.write(f"{moved} events archived")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {moved} ride events created before {cutoff.isoformat()} "
+                f"in {time.monotonic() - started:.1f}s."
+            )
+        )
+
+    @transaction.atomic
+    def archive_batch(self, cutoff, batch_size):
+        # Each batch is its own short transaction. Rows a writer holds locked
+        # are skipped and picked up by the next run rather than waited on.
+        ids = list(
+            RideEvent.objects.select_for_update(skip_locked=True)
+            .filter(created_at__lt=cutoff)
+            .order_by("created_at", "id_ride_event")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+
+        # Copied and deleted in SQL without sending delete signals: the events
+        # still exist, so the rides' event summaries and trips don't change,
+        # and they are older than anything a cached response includes.
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(
+            quote_name(RideEvent._meta.get_field(name).column) for name in FIELDS
+        )
+        hot = quote_name(RideEvent._meta.db_table)
+        archive = quote_name(ArchivedRideEvent._meta.db_table)
+        pk = quote_name(RideEvent._meta.pk.column)
+        placeholders = ", ".join(["%s"] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {archive} ({columns}) "
+                f"SELECT {columns} FROM {hot} WHERE {pk} IN ({placeholders})",
+                ids,
+            )
+            cursor.execute(f"DELETE FROM {hot} WHERE {pk} IN ({placeholders})", ids)
+            return cursor.rowcount
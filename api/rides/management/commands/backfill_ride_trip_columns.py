@@ -0,0 +1,145 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rides import cache, spatial
+from rides.models import Ride
+
+FIELDS = [
+    "pk",
+    "pickup_latitude",
+    "pickup_longitude",
+    "dropoff_latitude",
+    "dropoff_longitude",
+    "trip__duration",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in Ride.trip_distance_km and Ride.duration_seconds for existing "
+        "rides, a range of ride ids at a time. Distances are computed a batch "
+        "at a time, with NumPy when it is installed. With --checkpoint, the "
+        "last ride id done is saved after every batch and an interrupted run "
+        "resumes after it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50000)
+        parser.add_argument(
+            "--checkpoint",
+            help="File to record progress in and resume from; removed once done.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first ride even if the checkpoint has progress.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches, to leave room for writers.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options["pause"] < 0:
+            raise CommandError("--pause must not be negative.")
+
+        checkpoint = options["checkpoint"]
+        last_pk = 0
+        if checkpoint and not options["restart"]:
+            last_pk = read_checkpoint(checkpoint)
+            if last_pk:
+                self.stdout.write(f"Resuming after ride {last_pk}.")
+
+        started = time.monotonic()
+        done = 0
+        while batch := self.backfill_batch(last_pk, options["batch_size"]):
+            done += batch[0]
+            last_pk = batch[1]
+            if checkpoint:
+                write_checkpoint(checkpoint, last_pk)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{done} rides, up to id {last_pk} ({done / elapsed:,.0f} rides/s)"
+            )
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        # The updates went around the model signals.
+        cache.invalidate_all()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfilled the trip columns of {done} rides "
+                f"in {time.monotonic() - started:.1f}s."
+            )
+        )
+
+    @transaction.atomic
+    def backfill_batch(self, last_pk, batch_size):
+        """
+        Fill in the next ``batch_size`` rides after ``last_pk``, returning how
+        many there were and the last one's id, or None when there are none.
+        """
+        # Locked so an event changing a ride's trip meanwhile waits for this
+        # batch instead of being overwritten by it.
+        rows = list(
+            Ride.objects.select_for_update(of=("self",))
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list(*FIELDS)[:batch_size]
+        )
+        if not rows:
+            return None
+
+        pks, *coordinates, durations = zip(*rows)
+        distances = spatial.haversine_km_many(*coordinates)
+        seconds = [
+            None if duration is None else round(duration.total_seconds())
+            for duration in durations
+        ]
+        # Straight to executemany(), like populate_rides: one statement per
+        # ride without building model instances.
+        updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        quote_name = connection.ops.quote_name
+        columns = [
+            quote_name(Ride._meta.get_field(name).column)
+            for name in ("trip_distance_km", "duration_seconds", "updated_at")
+        ]
+        assignments = ", ".join(f"{column} = %s" for column in columns)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {quote_name(Ride._meta.db_table)} SET {assignments} "
+                f"WHERE {quote_name(Ride._meta.pk.column)} = %s",
+                [
+                    (distance, duration, updated_at, pk)
+                    for distance, duration, pk in zip(distances, seconds, pks)
+                ],
+            )
+        return len(rows), pks[-1]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as file:
+            return json.load(file)["last_id"]
+    except FileNotFoundError:
+        return 0
+    except (ValueError, KeyError, TypeError):
+        raise CommandError(f"{path} is not a checkpoint, remove it or pass --restart.")
+
+
+def write_checkpoint(path, last_pk):
+    # Replaced in one step, so an interrupted write leaves the previous one.
+    with open(f"{path}.tmp", "w") as file:
+        json.dump({"last_id": last_pk}, file)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,51 @@
+import base64
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from rides.authentication import CachedBasicAuthentication, credential_cache
+from rides.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares per-request authentication latency of BasicAuthentication "
+        "and CachedBasicAuthentication. Creates a throwaway user and deletes it "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests must be at least 1.")
+        username, password = "benchmark-auth", "benchmark-auth-password"
+        user = User.objects.create_user(
+            username=username, password=password, role="admin"
+        )
+        try:
+            token = base64.b64encode(f"{username}:{password}".encode()).decode()
+            request = APIRequestFactory().get(
+                "/api/rides/", HTTP_AUTHORIZATION=f"Basic {token}"
+            )
+            credential_cache.clear()
+            for authentication in (BasicAuthentication, CachedBasicAuthentication):
+                latency = self.latency(authentication(), request, options["requests"])
+                self.stdout.write(
+                    f"{authentication.__name__:>26}: {latency * 1000:8.3f} ms/request"
+                )
+        finally:
+            user.delete()
+
+    def latency(self, authenticator, request, count):
+        # Warm up, so the cached run measures hits only.
+        authenticator.authenticate(Request(request))
+        started = time.perf_counter()
+        for _ in range(count):
+            if authenticator.authenticate(Request(request)) is None:
+                raise CommandError("Authentication failed.")
+        return (time.perf_counter() - started) / count
@@ -0,0 +1,149 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection, connections
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from rides.models import Ride, RideEvent
+from rides.views import todays_ride_events
+
+BENCHMARK_EVENT = "Benchmark event"
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a mix of ride reads and ride event writes from concurrent threads "
+        "against the configured database and reports throughput, latency and "
+        "errors for each. Every operation is handled like a request, so "
+        "connections are reused or reopened as CONN_MAX_AGE and pooling "
+        "dictate. Compare database profiles by running it under different "
+        "DB_* environment variables. Needs rides, see populate_rides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--write-ratio",
+            type=float,
+            default=0.2,
+            help="Share of operations that create a ride event.",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        for name in ("operations", "threads"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        if not 0 <= options["write_ratio"] <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1.")
+
+        ride_ids = list(Ride.objects.values_list("pk", flat=True)[:10000])
+        if not ride_ids:
+            raise CommandError("There are no rides, run populate_rides first.")
+        self.stdout.write(f"Database profile: {self.describe_profile()}")
+
+        rng = random.Random(options["seed"])
+        plan = [
+            (
+                "write" if rng.random() < options["write_ratio"] else "read",
+                rng.choice(ride_ids),
+            )
+            for _ in range(options["operations"])
+        ]
+        threads = options["threads"]
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = [
+                    result
+                    for chunk in pool.map(
+                        self.work, [plan[i::threads] for i in range(threads)]
+                    )
+                    for result in chunk
+                ]
+            elapsed = time.perf_counter() - started
+        finally:
+            # Deleted through the ORM so the rides' event summaries and trips
+            # are restored.
+            for event in RideEvent.objects.with_description(BENCHMARK_EVENT):
+                event.delete()
+
+        for kind in ("read", "write"):
+            self.report(
+                kind, [result for result in results if result[0] == kind], elapsed
+            )
+        self.stdout.write(
+            f"{'total':>6}: {len(results) / elapsed:8,.0f} ops/s over {elapsed:.1f}s"
+        )
+
+    def describe_profile(self):
+        db = settings.DATABASES["default"]
+        details = [connection.vendor, f"CONN_MAX_AGE={db.get('CONN_MAX_AGE', 0)}"]
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    details.append(f"{pragma}={cursor.fetchone()[0]}")
+        if db.get("OPTIONS", {}).get("pool"):
+            details.append("pool")
+        return ", ".join(details)
+
+    def work(self, plan):
+        results = []
+        try:
+            for kind, ride_id in plan:
+                started = time.perf_counter()
+                error = None
+                try:
+                    if kind == "read":
+                        self.read(ride_id)
+                    else:
+                        self.write(ride_id)
+                except DatabaseError as exc:
+                    error = exc
+                finally:
+                    # The end of a request.
+                    close_old_connections()
+                results.append((kind, time.perf_counter() - started, error))
+        finally:
+            connections.close_all()
+        return results
+
+    def read(self, ride_id):
+        # What a ride detail and a page of the ride list query.
+        rides = Ride.objects.select_related("rider", "driver").prefetch_related(
+            Prefetch(
+                "ride_events", queryset=todays_ride_events(), to_attr="todays_events"
+            )
+        )
+        rides.get(pk=ride_id)
+        list(rides.filter(pk__gte=ride_id).order_by("pk")[:10])
+
+    def write(self, ride_id):
+        RideEvent.objects.create(
+            ride_id=ride_id, description=BENCHMARK_EVENT, created_at=timezone.now()
+        )
+
+    def report(self, kind, results, elapsed):
+        if not results:
+            return
+        latencies = [latency for _, latency, error in results if error is None]
+        errors = len(results) - len(latencies)
+        line = f"{kind + 's':>6}: {len(latencies) / elapsed:8,.0f} ops/s"
+        if len(latencies) > 1:
+            quantiles = statistics.quantiles(latencies, n=100)
+            line += (
+                f"  p50 {quantiles[49] * 1000:7.1f} ms"
+                f"  p95 {quantiles[94] * 1000:7.1f} ms"
+                f"  p99 {quantiles[98] * 1000:7.1f} ms"
+            )
+        if errors:
+            first = next(error for _, _, error in results if error is not None)
+            line += f"  {errors} errors ({first})"
+        self.stdout.write(line)
@@ -0,0 +1,328 @@
+import base64
+import gc
+import json
+import math
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from rides.models import Ride, RideEvent, User
+
+USERNAME, PASSWORD = "benchmark", "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests every rides endpoint (each list filter and ordering, deep "
+        "pages, details, ride events, users and reports) and records p50/p95 "
+        "latency, queries per request and peak memory per endpoint. Fails "
+        "when an endpoint's query count grows with the page size, or, with "
+        "--baseline, when it runs more queries or is slower than the baseline "
+        "allows. Runs in-process against the configured database, with the "
+        "response cache off and a throwaway admin user. --rides first "
+        "replaces the data, see populate_rides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rides",
+            type=int,
+            default=None,
+            help="Clear the rides and populate this many first, e.g. 1000, "
+            "100000 or 1000000.",
+        )
+        parser.add_argument("--events-per-ride", type=int, default=2)
+        parser.add_argument("--riders", type=int, default=10)
+        parser.add_argument("--drivers", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--page-size", type=int, default=10)
+        parser.add_argument(
+            "--output", help="Write the results to this JSON file, a new baseline."
+        )
+        parser.add_argument("--baseline", help="Compare with this JSON file.")
+        parser.add_argument(
+            "--latency-threshold",
+            type=float,
+            default=0.25,
+            help="Allowed p95 latency growth over the baseline, as a fraction.",
+        )
+        parser.add_argument(
+            "--latency-slack-ms",
+            type=float,
+            default=2.0,
+            help="p95 latency growth that never counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("repeat", "page_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        if options["latency_threshold"] < 0:
+            raise CommandError("--latency-threshold must not be negative.")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        if options["rides"] is not None:
+            call_command(
+                "populate_rides",
+                rides=options["rides"],
+                events_per_ride=options["events_per_ride"],
+                riders=options["riders"],
+                drivers=options["drivers"],
+                seed=0,
+                stdout=self.stdout,
+            )
+        ride_count = Ride.objects.count()
+        if not ride_count:
+            raise CommandError(
+                "There are no rides, pass --rides or run populate_rides."
+            )
+        if baseline is not None and baseline["rides"] != ride_count:
+            raise CommandError(
+                f"The baseline was recorded with {baseline['rides']} rides, "
+                f"not {ride_count}."
+            )
+
+        token = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+        self.client = Client(
+            headers={"Authorization": f"Basic {token}", "Accept": "application/json"}
+        )
+        self.aliases = [DEFAULT_DB_ALIAS, *settings.RIDES_REPLICAS]
+        user = User.objects.create_user(
+            username=USERNAME, password=PASSWORD, role="admin"
+        )
+        try:
+            # The test client sends "Host: testserver". DEBUG would add the
+            # debug toolbar's work, and cached responses only measure the cache.
+            with override_settings(
+                DEBUG=False,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                RIDES_CACHE_TIMEOUT=0,
+            ):
+                results, problems = self.run(ride_count, options)
+        finally:
+            user.delete()
+
+        self.stdout.write(
+            f"{'endpoint':<34} {'p50 ms':>8} {'p95 ms':>8} {'queries':>7} "
+            f"{'peak KiB':>9}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<34} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['queries']:>7} {result['peak_kib']:>9,.0f}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(
+                    {
+                        "rides": ride_count,
+                        "page_size": options["page_size"],
+                        "repeat": options["repeat"],
+                        "endpoints": results,
+                    },
+                    f,
+                    indent=2,
+                )
+                f.write("\n")
+        if baseline is not None:
+            problems += self.compare(results, baseline, options)
+        if problems:
+            raise CommandError("\n".join(["Benchmark failed:", *problems]))
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} endpoints passed."))
+
+    def run(self, ride_count, options):
+        page_size = options["page_size"]
+        # Large enough that a query per row can't hide in the noise.
+        large_page_size = page_size * 5
+        results, problems = {}, []
+        for (name, path), (_, large_page_path) in zip(
+            self.scenarios(ride_count, page_size),
+            self.scenarios(ride_count, large_page_size),
+        ):
+            self.get(path)  # Warm up, e.g. so the password is only hashed once.
+            with paginate_by(page_size):
+                queries, peak = self.profile(path)
+                latencies = []
+                # Like timeit, so a collection doesn't land in one endpoint's
+                # numbers.
+                gc.collect()
+                gc.disable()
+                try:
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        self.get(path)
+                        latencies.append(time.perf_counter() - started)
+                finally:
+                    gc.enable()
+            with paginate_by(large_page_size):
+                large_page_queries, _ = self.profile(large_page_path)
+            if large_page_queries != queries:
+                problems.append(
+                    f"{name}: {queries} queries with {page_size} rows per page, "
+                    f"{large_page_queries} with {large_page_size}."
+                )
+            results[name] = {
+                "path": path,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "queries": queries,
+                "peak_kib": round(peak / 1024, 1),
+            }
+        return results, problems
+
+    def scenarios(self, ride_count, page_size):
+        ride = (
+            Ride.objects.select_related("rider")
+            .order_by("pk")
+            .only(
+                "pk", "pickup_latitude", "pickup_longitude", "driver", "rider__email"
+            )[ride_count // 2]
+        )
+        event = RideEvent.objects.order_by("pk").only("pk").first()
+        day_ago = (timezone.now() - timedelta(days=1)).isoformat()
+        last_page = max(1, math.ceil(ride_count / page_size))
+        near = {"latitude": ride.pickup_latitude, "longitude": ride.pickup_longitude}
+
+        rides = [
+            ("rides", {}),
+            ("rides?status", {"status": "completed"}),
+            ("rides?rider__email", {"rider__email": ride.rider.email}),
+            ("rides?pickup_time_after", {"pickup_time_after": day_ago}),
+            ("rides?last_event_at_after", {"last_event_at_after": day_ago}),
+            (
+                "rides?last_event_description",
+                {"last_event_description": RideEvent.DROPOFF},
+            ),
+            ("rides?event_count__gte", {"event_count__gte": 2}),
+            ("rides?idle_minutes", {"idle_minutes": 60}),
+            ("rides?ordering=pickup_time", {"ordering": "pickup_time"}),
+            ("rides?ordering=-last_event_at", {"ordering": "-last_event_at"}),
+            ("rides?ordering=distance", {**near, "ordering": "distance"}),
+            ("rides?radius_km", {**near, "radius_km": 500}),
+            ("rides?page=last", {"page": last_page}),
+            ("rides?count=false&page=last", {"count": "false", "page": last_page}),
+            ("rides?pagination=cursor", {"pagination": "cursor"}),
+            (
+                "rides?fields",
+                {"fields": "id_ride,status,pickup_latitude,pickup_longitude"},
+            ),
+            ("rides?expand=rider", {"fields": "id_ride", "expand": "rider"}),
+        ]
+        scenarios = [(name, url("/api/rides/", params)) for name, params in rides]
+        scenarios += [
+            ("ride", f"/api/rides/{ride.pk}/"),
+            ("ride?fields", url(f"/api/rides/{ride.pk}/", {"fields": "status"})),
+            ("ride events history", f"/api/rides/{ride.pk}/events/"),
+            ("ride-events", "/api/ride-events/"),
+            (
+                "ride-events?ride__id_ride",
+                url("/api/ride-events/", {"ride__id_ride": ride.pk}),
+            ),
+            (
+                "ride-events?ordering=-created_at",
+                url("/api/ride-events/", {"ordering": "-created_at"}),
+            ),
+            ("async rides", "/api/async/rides/"),
+            ("async ride", f"/api/async/rides/{ride.pk}/"),
+            ("async ride-events", "/api/async/ride-events/"),
+            ("async users", "/api/async/users/"),
+            ("async users?role", url("/api/async/users/", {"role": "rider"})),
+            ("async user", f"/api/async/users/{ride.rider_id}/"),
+            (
+                "async users?expand=stats",
+                url("/api/async/users/", {"expand": "stats"}),
+            ),
+            ("user stats", f"/api/users/{ride.driver_id}/stats/"),
+            ("rides heatmap", url("/api/rides/heatmap/", {"rows": 256, "cols": 256})),
+            ("long trips report", "/api/reports/long-trips/"),
+        ]
+        if event is not None:
+            scenarios += [
+                ("ride-event", f"/api/ride-events/{event.pk}/"),
+                ("async ride-event", f"/api/async/ride-events/{event.pk}/"),
+            ]
+        return scenarios
+
+    def get(self, path):
+        response = self.client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f"GET {path} returned {response.status_code}.")
+        return response
+
+    def profile(self, path):
+        """
+        The queries a request runs, on any database, and its peak memory.
+        """
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in self.aliases
+            ]
+            tracemalloc.start()
+            try:
+                self.get(path)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return sum(len(queries) for queries in captured), peak
+
+    def compare(self, results, baseline, options):
+        problems = []
+        for name, result in results.items():
+            base = baseline["endpoints"].get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                problems.append(
+                    f"{name}: {result['queries']} queries, the baseline ran "
+                    f"{base['queries']}."
+                )
+            allowed = max(
+                base["p95_ms"] * (1 + options["latency_threshold"]),
+                base["p95_ms"] + options["latency_slack_ms"],
+            )
+            if result["p95_ms"] > allowed:
+                problems.append(
+                    f"{name}: p95 {result['p95_ms']:.1f} ms, the baseline was "
+                    f"{base['p95_ms']:.1f} ms (at most {allowed:.1f} ms allowed)."
+                )
+        return problems
+
+
+@contextmanager
+def paginate_by(page_size):
+    """
+    Sets the page size of every paginated rides endpoint, all of which take
+    theirs from these DRF base classes.
+    """
+    saved = PageNumberPagination.page_size, CursorPagination.page_size
+    PageNumberPagination.page_size = CursorPagination.page_size = page_size
+    try:
+        yield
+    finally:
+        PageNumberPagination.page_size, CursorPagination.page_size = saved
+
+
+def url(path, params):
+    return f"{path}?{urlencode(params)}" if params else path
+
+
+def percentile(values, percent):
+    # Nearest rank, so it is always one of the measured values.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
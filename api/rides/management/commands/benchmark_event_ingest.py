@@ -0,0 +1,92 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from rides.models import Ride, RideEvent, User
+from rides.views import RideEventViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ride event ingest throughput of POST /api/ride-events/ (one "
+        "event per request) and POST /api/ride-events/bulk/. Creates its own "
+        "rides and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=2000)
+        parser.add_argument("--rides", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for name in ("events", "rides", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        if options["batch_size"] > RideEventViewSet.bulk_max_events:
+            raise CommandError(
+                f"--batch-size must be at most {RideEventViewSet.bulk_max_events}."
+            )
+
+        self.user, _ = User.objects.get_or_create(
+            username="benchmark-ingest",
+            defaults={"email": "benchmark-ingest@example.com", "role": "admin"},
+        )
+        try:
+            self.run(options)
+        finally:
+            # Cascades to the benchmark rides and their events.
+            self.user.delete()
+
+    def run(self, options):
+        now = timezone.now()
+        rides = Ride.objects.bulk_create(
+            Ride(
+                status="en-route",
+                rider=self.user,
+                driver=self.user,
+                pickup_latitude=0.0,
+                pickup_longitude=0.0,
+                dropoff_latitude=0.0,
+                dropoff_longitude=0.0,
+                pickup_time=now,
+            )
+            for _ in range(options["rides"])
+        )
+        events = [
+            {
+                "ride": rides[i % len(rides)].pk,
+                "description": RideEvent.PICKUP if i % 2 else RideEvent.DROPOFF,
+                "created_at": (now + timedelta(milliseconds=i)).isoformat(),
+            }
+            for i in range(options["events"])
+        ]
+
+        single_view = RideEventViewSet.as_view({"post": "create"})
+        started = time.perf_counter()
+        for event in events:
+            self.post(single_view, "/api/ride-events/", event)
+        single = len(events) / (time.perf_counter() - started)
+
+        bulk_view = RideEventViewSet.as_view({"post": "bulk"})
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        for start in range(0, len(events), batch_size):
+            stop = start + batch_size
+            self.post(bulk_view, "/api/ride-events/bulk/", events[start:stop])
+        bulk = len(events) / (time.perf_counter() - started)
+
+        self.stdout.write(f"single event requests: {single:>10,.0f} events/s")
+        self.stdout.write(
+            f"bulk ({batch_size}/request):  {bulk:>10,.0f} events/s "
+            f"({bulk / single:.1f}x)"
+        )
+
+    def post(self, view, path, data):
+        request = APIRequestFactory().post(path, data, format="json")
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        if response.status_code != 201:
+            raise CommandError(f"POST {path} failed: {response.data}")
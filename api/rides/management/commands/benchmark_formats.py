@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from rides import compression
+from rides.models import Ride, RideEvent
+from rides.renderers import COMPACT_RENDERER_CLASSES
+from rides.serializers import RideSerializer, StandaloneRideEventSerializer
+from rides.views import RideEventViewSet, RideViewSet, todays_ride_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders a page of rides and a page of ride events in JSON and every "
+        "compact format (columnar, and MessagePack when msgpack is installed) "
+        "and reports their size, gzip and Zstandard compressed sizes and "
+        "median encode time, against JSON. Needs rides, see populate_rides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **options):
+        for name in ("page_size", "repeat"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        page_size = options["page_size"]
+        rides = list(
+            Ride.objects.select_related("rider", "driver")
+            .prefetch_related(
+                Prefetch(
+                    "ride_events",
+                    queryset=todays_ride_events(),
+                    to_attr="todays_events",
+                )
+            )
+            .order_by("pk")[:page_size]
+        )
+        if not rides:
+            raise CommandError("There are no rides, run populate_rides first.")
+        events = list(RideEvent.objects.order_by("pk")[:page_size])
+
+        self.stdout.write(
+            f"{'page':<12} {'format':<17} {'bytes':>9} {'gzip':>8} {'zstd':>8} "
+            f"{'encode ms':>9} {'vs JSON':>8}"
+        )
+        for name, view, results in [
+            ("rides", RideViewSet(), RideSerializer(rides, many=True).data),
+            (
+                "ride-events",
+                RideEventViewSet(),
+                StandaloneRideEventSerializer(events, many=True).data,
+            ),
+        ]:
+            page = {"count": len(results), "next": None, "previous": None}
+            page["results"] = results
+            json_bytes = None
+            for renderer_class in [JSONRenderer, *COMPACT_RENDERER_CLASSES]:
+                size, gzipped, zstd, encode = self.measure(
+                    renderer_class(), page, {"view": view}, options["repeat"]
+                )
+                if json_bytes is None:
+                    json_bytes = size
+                self.stdout.write(
+                    f"{name:<12} {renderer_class.format:<17} {size:>9,} "
+                    f"{gzipped:>8,} {zstd:>8} {encode * 1000:>9.2f} "
+                    f"{size / json_bytes:>8.0%}"
+                )
+
+    def measure(self, renderer, data, renderer_context, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = renderer.render(data, renderer.media_type, renderer_context)
+            timings.append(time.perf_counter() - started)
+        zstd = "-"
+        if compression.zstandard is not None:
+            compressor = compression.zstandard.ZstdCompressor(
+                level=compression.CompressionMiddleware.zstd_level
+            )
+            zstd = f"{len(compressor.compress(body)):,}"
+        # compress_string is what GZipMiddleware uses.
+        return len(body), len(compress_string(body)), zstd, statistics.median(timings)
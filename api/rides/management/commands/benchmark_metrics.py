@@ -0,0 +1,104 @@
+import base64
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from rides.models import User
+
+USERNAME, PASSWORD = "benchmark-metrics", "benchmark-metrics-password"
+MIDDLEWARE = "rides.instrumentation.RequestMetricsMiddleware"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the per-request overhead of RequestMetricsMiddleware: "
+        "GET /api/<path> without it, at RIDES_METRICS_SAMPLE_RATE and with "
+        "every request sampled. The variants take turns for --rounds rounds "
+        "and each reports its median round. Runs in-process against the "
+        "configured database, with a throwaway admin user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="rides/", help="e.g. rides/?page=2")
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument(
+            "--max-overhead",
+            type=float,
+            help="Fail if the configured sample rate costs more than this percent.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("requests", "rounds"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        if MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError(f"{MIDDLEWARE} is not in MIDDLEWARE.")
+        url = f"/api/{options['path'].lstrip('/')}"
+        token = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}"}
+        rate = settings.RIDES_METRICS_SAMPLE_RATE
+        variants = {
+            "off": {
+                "MIDDLEWARE": [
+                    name for name in settings.MIDDLEWARE if name != MIDDLEWARE
+                ]
+            },
+            f"sampled ({rate:g})": {},
+        }
+        # Unless that is already every request.
+        if rate < 1:
+            variants["sampled (1)"] = {"RIDES_METRICS_SAMPLE_RATE": 1.0}
+
+        user = User.objects.create_user(
+            username=USERNAME, password=PASSWORD, role="admin"
+        )
+        rounds = {name: [] for name in variants}
+        try:
+            # The test client sends "Host: testserver".
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                for _ in range(options["rounds"]):
+                    for name, overrides in variants.items():
+                        with override_settings(**overrides):
+                            rounds[name].append(self.latency(url, options["requests"]))
+        finally:
+            user.delete()
+
+        baseline = statistics.median(rounds["off"])
+        overheads = {}
+        for name, latencies in rounds.items():
+            latency = statistics.median(latencies)
+            overheads[name] = (latency / baseline - 1) * 100
+            self.stdout.write(
+                f"{name:>16}: {latency * 1000:8.3f} ms/request  "
+                f"{overheads[name]:+6.2f}%"
+            )
+        overhead = overheads[f"sampled ({rate:g})"]
+        if options["max_overhead"] is not None and overhead > options["max_overhead"]:
+            raise CommandError(
+                f"The metrics cost {overhead:.2f}% per request, more than "
+                f"{options['max_overhead']:g}%."
+            )
+
+    def latency(self, url, count):
+        # A new client per run loads the middleware as currently configured.
+        client = Client()
+        self.get(client, url)
+        started = time.perf_counter()
+        for _ in range(count):
+            self.get(client, url)
+        return (time.perf_counter() - started) / count
+
+    def get(self, client, url):
+        response = client.get(url, headers=self.headers)
+        if response.status_code != 200:
+            raise CommandError(
+                f"GET {url} returned {response.status_code}: "
+                f"{response.content[:200]!r}"
+            )
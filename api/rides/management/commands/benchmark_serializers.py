@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from rides.models import Ride, RideEvent, User
+from rides.serializers import FastRideSerializer, RideSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares RideSerializer and FastRideSerializer throughput on in-memory "
+        "pages of rides (no database access)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-sizes", type=int, nargs="+", default=[10, 100, 1000]
+        )
+        parser.add_argument("--events-per-ride", type=int, default=2)
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.5,
+            help="Seconds to keep repeating each measurement for.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'page size':>9}  {'RideSerializer':>16}  {'FastRideSerializer':>18}  "
+            f"{'speedup':>7}"
+        )
+        for page_size in options["page_sizes"]:
+            rides = self.make_rides(page_size, options["events_per_ride"])
+            slow_output = self.render(RideSerializer, rides)
+            if self.render(FastRideSerializer, rides) != slow_output:
+                raise AssertionError("FastRideSerializer output differs")
+
+            slow = self.rides_per_second(RideSerializer, rides, options["min_time"])
+            fast = self.rides_per_second(FastRideSerializer, rides, options["min_time"])
+            self.stdout.write(
+                f"{page_size:>9}  {slow:>11,.0f} /s  {fast:>13,.0f} /s  "
+                f"{fast / slow:>6.1f}x"
+            )
+
+    def render(self, serializer_class, rides):
+        return JSONRenderer().render(serializer_class(rides, many=True).data)
+
+    def rides_per_second(self, serializer_class, rides, min_time):
+        rendered = 0
+        started = time.perf_counter()
+        while (elapsed := time.perf_counter() - started) < min_time:
+            serializer_class(rides, many=True).data
+            rendered += len(rides)
+        return rendered / elapsed
+
+    def make_rides(self, count, events_per_ride):
+        now = timezone.now()
+        users = [
+            User(
+                id=i,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                email=f"user{i}@example.com",
+                phone_number="+63 900 000 0000",
+                role="driver" if i % 2 else "rider",
+            )
+            for i in range(1, 51)
+        ]
+        rides = []
+        for i in range(count):
+            ride = Ride(
+                id_ride=i + 1,
+                status="pickup",
+                rider=users[i % 50],
+                driver=users[(i * 7) % 50],
+                pickup_latitude=14.5 + i / 1000,
+                pickup_longitude=121.0 - i / 1000,
+                dropoff_latitude=14.6,
+                dropoff_longitude=121.1,
+                pickup_time=now - timedelta(minutes=i),
+            )
+            ride.todays_events = [
+                RideEvent(
+                    id_ride_event=i * events_per_ride + j,
+                    ride=ride,
+                    description="Status changed to pickup",
+                    created_at=now - timedelta(minutes=i, seconds=j),
+                )
+                for j in range(events_per_ride)
+            ]
+            rides.append(ride)
+        return rides
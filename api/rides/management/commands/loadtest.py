@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve
+
+from rides.management.commands.benchmark_endpoints import percentile
+from rides.models import User
+
+USERNAME, PASSWORD = "loadtest", "loadtest-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives GET /api/<path> through Django's WSGI handler from a thread "
+        "pool and GET /api/async/<path> through its ASGI handler from asyncio "
+        "tasks, at the same concurrency, and reports throughput and latency. "
+        "Runs in-process (no sockets or server) against the configured "
+        "database, with a throwaway admin user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="rides/",
+            help=(
+                "e.g. rides/ or ride-events/?page=2; only paths served both "
+                "under /api/ and /api/async/."
+            ),
+        )
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=64)
+
+    def handle(self, *args, **options):
+        for name in ("requests", "concurrency"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        path = options["path"].lstrip("/")
+        for prefix in ("/api/", "/api/async/"):
+            try:
+                resolve(prefix + path.split("?")[0])
+            except Resolver404:
+                raise CommandError(
+                    f"{prefix}{path} does not exist; --path must be served both "
+                    "under /api/ and /api/async/."
+                )
+        token = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+        self.headers = {
+            "Authorization": f"Basic {token}",
+            "Accept": "application/json",
+        }
+
+        user = User.objects.create_user(
+            username=USERNAME, password=PASSWORD, role="admin"
+        )
+        try:
+            # The test clients send "Host: testserver".
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                for name, run, url in [
+                    ("sync (WSGI)", self.run_sync, f"/api/{path}"),
+                    ("async (ASGI)", self.run_async, f"/api/async/{path}"),
+                ]:
+                    # Warm up, e.g. so the password is only hashed once.
+                    run(url, 1, 1)
+                    started = time.perf_counter()
+                    latencies = run(url, options["requests"], options["concurrency"])
+                    self.report(name, latencies, time.perf_counter() - started)
+        finally:
+            user.delete()
+
+    def run_sync(self, url, count, concurrency):
+        def get(_):
+            started = time.perf_counter()
+            response = Client().get(url, headers=self.headers)
+            return self.elapsed(url, response, started)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(get, range(count)))
+
+    def run_async(self, url, count, concurrency):
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            client = AsyncClient()
+
+            async def get():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(url, headers=self.headers)
+                    return self.elapsed(url, response, started)
+
+            return await asyncio.gather(*(get() for _ in range(count)))
+
+        return asyncio.run(main())
+
+    def elapsed(self, url, response, started):
+        if response.status_code != 200:
+            raise CommandError(
+                f"GET {url} returned {response.status_code}: "
+                f"{response.content[:200]!r}"
+            )
+        return time.perf_counter() - started
+
+    def report(self, name, latencies, elapsed):
+        self.stdout.write(
+            f"{name:>12}: {len(latencies) / elapsed:8,.0f} req/s  "
+            f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+            f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:7.1f} ms"
+        )
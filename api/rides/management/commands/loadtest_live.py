@@ -0,0 +1,177 @@
+import asyncio
+import base64
+import math
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rides import live
+from rides.models import Ride, RideEvent, User
+
+USERNAME, PASSWORD = "live-loadtest", "live-loadtest-password"
+LOADTEST_EVENT = "Live load test event"
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens many idle live feed streams in this process, through Django's "
+        "ASGI handler as an ASGI server would, then creates ride events and "
+        "reports the memory per subscriber and how long each event took to "
+        "reach every stream. Uses a throwaway admin user and removes the "
+        "events it creates. Needs rides, see populate_rides."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=20)
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30.0,
+            help="Seconds to wait for the streams to connect or an event to "
+            "reach them all.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("subscribers", "events"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        ride = Ride.objects.order_by("pk").first()
+        if ride is None:
+            raise CommandError("There are no rides, run populate_rides first.")
+
+        user = User.objects.create_user(
+            username=USERNAME, password=PASSWORD, role="admin"
+        )
+        try:
+            with override_settings(
+                DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                asyncio.run(self.run(ride, options))
+        finally:
+            # Through the ORM so the ride's event summary is restored.
+            for event in RideEvent.objects.with_description(LOADTEST_EVENT):
+                event.delete()
+            user.delete()
+
+    async def run(self, ride, options):
+        count, timeout = options["subscribers"], options["timeout"]
+        handler = ASGIHandler()
+        token = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": reverse("live-rideevent-stream"),
+            "query_string": b"",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorization", f"Basic {token}".encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        streams = [Stream() for _ in range(count)]
+
+        tracemalloc.start()
+        try:
+            memory_before, _ = tracemalloc.get_traced_memory()
+            started = time.perf_counter()
+            tasks = [
+                asyncio.ensure_future(handler(dict(scope), stream.receive, stream.send))
+                for stream in streams
+            ]
+            await self.wait_for(
+                lambda: len(live.broker) >= count,
+                timeout,
+                f"Only {len(live.broker)} of {count} streams connected.",
+            )
+            connect_time = time.perf_counter() - started
+            memory_after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        failed = [stream.status for stream in streams if stream.status != 200]
+        if failed:
+            raise CommandError(f"{len(failed)} streams failed: {failed[0]}.")
+        self.stdout.write(
+            f"{count} streams connected in {connect_time:.1f}s, "
+            f"{(memory_after - memory_before) / count / 1024:.1f} KiB each."
+        )
+
+        latencies = []
+        for _ in range(options["events"]):
+            created = time.perf_counter()
+            event = await sync_to_async(RideEvent.objects.create)(
+                ride=ride, description=LOADTEST_EVENT, created_at=timezone.now()
+            )
+            await self.wait_for(
+                lambda: all(event.pk in stream.received for stream in streams),
+                timeout,
+                f"Event {event.pk} didn't reach every stream.",
+            )
+            latencies.append(
+                max(stream.received[event.pk] for stream in streams) - created
+            )
+
+        for stream in streams:
+            stream.disconnect()
+        await asyncio.gather(*tasks)
+        latencies.sort()
+        self.stdout.write(
+            f"{len(latencies)} events reached every stream in "
+            f"p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+            f"p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+            f"max {latencies[-1] * 1000:.1f} ms; "
+            f"{len(live.broker)} streams left open."
+        )
+
+    async def wait_for(self, condition, timeout, message):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise CommandError(message)
+            await asyncio.sleep(0.001)
+
+
+class Stream:
+    """
+    The client side of one streaming request: when each event arrived.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.received = {}
+        self.requested = False
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            return
+        body = message.get("body", b"")
+        if body.startswith(b"id: "):
+            event_id = int(body.split(b"\n", 1)[0].removeprefix(b"id: "))
+            self.received[event_id] = time.perf_counter()
+
+    def disconnect(self):
+        self.disconnected.set()
+
+
+def percentile(ordered, percent):
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
@@ -1,10 +1,44 @@
 import random
+import time
 from datetime import timedelta
+from datetime import timezone as dt_timezone
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 from django.utils import timezone
 
-from rides.models import Ride, RideEvent, User
+from rides import cache, spatial
+from rides.models import (
+    Ride,
+    RideEvent,
+    RideEventType,
+    RideTrip,
+    User,
+    UserDailyStats,
+)
+
+RIDE_FIELDS = [
+    "id_ride",
+    "status",
+    "rider",
+    "driver",
+    "pickup_latitude",
+    "pickup_longitude",
+    "dropoff_latitude",
+    "dropoff_longitude",
+    "pickup_time",
+    "pickup_cell",
+    "last_event_at",
+    "last_event_description",
+    "event_count",
+    "trip_distance_km",
+    "duration_seconds",
+    "updated_at",
+]
+EVENT_FIELDS = ["ride", "event_type", "created_at"]
+EN_ROUTE = "Status changed to en-route"
+TRIP_FIELDS = ["ride", "driver", "pickup_at", "dropoff_at", "duration", "dropoff_month"]
 
 
 class Command(BaseCommand):
@@ -13,57 +47,218 @@ class Command(BaseCommand):
         "populates the Ride table with sample data and ride events"
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument("--rides", type=int, default=20)
+        parser.add_argument("--riders", type=int, default=1)
+        parser.add_argument("--drivers", type=int, default=1)
+        parser.add_argument(
+            "--events-per-ride",
+            type=int,
+            default=2,
+            help="Pickup, en-route..., dropoff events created for each ride.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed for reproducible data (times are relative to the hour).",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
     def handle(self, *args, **options):
-        # Clear existing rides (which cascades to ride events)
-        Ride.objects.all().delete()
+        for name in ("rides", "riders", "drivers", "batch_size"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        if options["events_per_ride"] < 0:
+            raise CommandError("--events-per-ride must not be negative.")
+
+        self.clear()
         self.stdout.write(self.style.WARNING("Cleared existing rides and ride events."))
 
-        # Create or get a rider
-        rider, _ = User.objects.get_or_create(
-            username="rider1",
-            defaults={
-                "email": "rider1@example.com",
-                "role": "rider",
-                "password": "pass",
-            },
-        )
-        # Create or get a driver
-        driver, _ = User.objects.get_or_create(
-            username="driver1",
-            defaults={
-                "email": "driver1@example.com",
-                "role": "driver",
-                "password": "pass",
-            },
-        )
+        riders = self.get_users("rider", options["riders"])
+        drivers = self.get_users("driver", options["drivers"])
 
-        # Create 20 rides
-        for i in range(20):
-            ride = Ride.objects.create(
-                status="completed",
-                rider=rider,
-                driver=driver,
-                pickup_latitude=random.uniform(-90, 90),
-                pickup_longitude=random.uniform(-180, 180),
-                dropoff_latitude=random.uniform(-90, 90),
-                dropoff_longitude=random.uniform(-180, 180),
-                pickup_time=timezone.now() - timedelta(days=random.randint(0, 10)),
-            )
-            # Create two ride events for each ride:
-            # A "pickup" event and a "dropoff" event with created_at set to now
-            RideEvent.objects.create(
-                ride=ride,
-                description="Status changed to pickup",
-                created_at=timezone.now(),
+        # Throwaway load data doesn't need an fsync per batch. The pragma only
+        # lasts for this connection and can't be changed inside a transaction.
+        if connection.vendor == "sqlite" and not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+        self.codes = RideEventType.objects.codes_for(
+            [RideEvent.PICKUP, RideEvent.DROPOFF, EN_ROUTE]
+        )
+        rng = random.Random(options["seed"])
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        total, batch_size = options["rides"], options["batch_size"]
+        started = time.monotonic()
+        created = events_created = 0
+        # The tables were just truncated with their sequences reset, so ride ids
+        # are assigned here and events can reference them without a round-trip.
+        while created < total:
+            size = min(batch_size, total - created)
+            events_created += self.create_batch(
+                rng, now, created + 1, size, riders, drivers, options["events_per_ride"]
             )
-            RideEvent.objects.create(
-                ride=ride,
-                description="Status changed to dropoff",
-                created_at=timezone.now(),
+            created += size
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{created}/{total} rides, {events_created} events "
+                f"({created / elapsed:,.0f} rides/s)"
             )
 
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Ride]):
+                cursor.execute(sql)
+        # None of the above went through model signals.
+        UserDailyStats.objects.rebuild()
+        cache.invalidate_all()
+
+        elapsed = time.monotonic() - started
         self.stdout.write(
             self.style.SUCCESS(
-                "Successfully created 20 rides with associated ride events."
+                f"Successfully created {created} rides with {events_created} "
+                f"associated ride events in {elapsed:.1f}s."
             )
         )
+
+    def clear(self):
+        # Truncate instead of Ride.objects.all().delete(), which would load
+        # every ride event to cascade and send delete signals. allow_cascade
+        # also clears every table that references rides.
+        sql_list = connection.ops.sql_flush(
+            no_style(), [Ride._meta.db_table], reset_sequences=True, allow_cascade=True
+        )
+        # SQLite can only take its truncate fast path with FK checks off.
+        with connection.constraint_checks_disabled():
+            connection.ops.execute_sql_flush(sql_list)
+
+    def get_users(self, role, count):
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f"{role}{i}",
+                    email=f"{role}{i}@example.com",
+                    role=role,
+                    password="pass",
+                )
+                for i in range(1, count + 1)
+            ],
+            ignore_conflicts=True,
+        )
+        usernames = [f"{role}{i}" for i in range(1, count + 1)]
+        return list(
+            User.objects.filter(username__in=usernames)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    @transaction.atomic
+    def create_batch(self, rng, now, first_id, size, riders, drivers, events_per_ride):
+        # Rows go straight to executemany(): building model instances and
+        # compiling bulk_create() costs more than the inserts themselves.
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        duration_field = RideTrip._meta.get_field("duration")
+        updated_at = adapt_datetime(now)
+        rides, events, trips = [], [], []
+        for ride_id in range(first_id, first_id + size):
+            pickup_latitude = rng.uniform(-90, 90)
+            pickup_longitude = rng.uniform(-180, 180)
+            dropoff_latitude = rng.uniform(-90, 90)
+            dropoff_longitude = rng.uniform(-180, 180)
+            driver_id = rng.choice(drivers)
+            pickup_time = now - timedelta(minutes=rng.randint(0, 10 * 24 * 60))
+            ride = [
+                ride_id,
+                "completed",
+                rng.choice(riders),
+                driver_id,
+                pickup_latitude,
+                pickup_longitude,
+                dropoff_latitude,
+                dropoff_longitude,
+                adapt_datetime(pickup_time),
+                spatial.cell_for(pickup_latitude, pickup_longitude),
+            ]
+
+            times = self.event_times(rng, pickup_time, events_per_ride)
+            description = ""
+            for i, created_at in enumerate(times):
+                if i == 0:
+                    description = RideEvent.PICKUP
+                elif i == len(times) - 1:
+                    description = RideEvent.DROPOFF
+                else:
+                    description = EN_ROUTE
+                events.append(
+                    (ride_id, self.codes[description], adapt_datetime(created_at))
+                )
+            # The event summary and trip columns the model and RideEvent
+            # signals would have recorded.
+            last_event_at = adapt_datetime(times[-1]) if times else None
+            distance = spatial.haversine_km(
+                pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
+            )
+            seconds = None
+            if len(times) > 1:
+                seconds = round((times[-1] - times[0]).total_seconds())
+            rides.append(
+                (
+                    *ride,
+                    last_event_at,
+                    description,
+                    len(times),
+                    distance,
+                    seconds,
+                    updated_at,
+                )
+            )
+
+            # What the RideEvent signals would have recorded, see RideTrip.
+            if len(times) > 1:
+                dropoff_month = times[-1].astimezone(dt_timezone.utc).date()
+                trips.append(
+                    (
+                        ride_id,
+                        driver_id,
+                        adapt_datetime(times[0]),
+                        adapt_datetime(times[-1]),
+                        duration_field.get_db_prep_value(
+                            times[-1] - times[0], connection
+                        ),
+                        connection.ops.adapt_datefield_value(
+                            dropoff_month.replace(day=1)
+                        ),
+                    )
+                )
+            elif times:
+                trips.append(
+                    (ride_id, driver_id, adapt_datetime(times[0]), None, None, None)
+                )
+
+        self.insert(Ride, RIDE_FIELDS, rides)
+        self.insert(RideEvent, EVENT_FIELDS, events)
+        self.insert(RideTrip, TRIP_FIELDS, trips)
+        return len(events)
+
+    def insert(self, model, field_names, rows):
+        if not rows:
+            return
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(
+            quote_name(model._meta.get_field(name).column) for name in field_names
+        )
+        placeholders = ", ".join(["%s"] * len(field_names))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {quote_name(model._meta.db_table)} ({columns}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+
+    def event_times(self, rng, pickup_time, count):
+        if count == 0:
+            return []
+        if count == 1:
+            return [pickup_time]
+        duration = timedelta(minutes=rng.randint(5, 150))
+        step = duration / (count - 1)
+        return [pickup_time + step * i for i in range(count)]
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rides import cache
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the denormalized last_event_at, last_event_description and "
+        "event_count of rides from their events, or with --verify only reports "
+        "rides where they are out of date"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options["verify"]:
+            self.verify()
+        else:
+            self.rebuild(options["batch_size"])
+
+    def verify(self):
+        stale = list(
+            Ride.objects.with_stale_event_summary()
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if stale:
+            sample = ", ".join(str(pk) for pk in stale[:20])
+            raise CommandError(
+                f"{len(stale)} rides have an out of date event summary: {sample}"
+                + (", ..." if len(stale) > 20 else "")
+            )
+        self.stdout.write(self.style.SUCCESS("All ride event summaries are correct."))
+
+    def rebuild(self, batch_size):
+        # One UPDATE per range of ride ids keeps each transaction short.
+        updated = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                Ride.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            updated += Ride.objects.filter(
+                pk__gte=pks[0], pk__lte=pks[-1]
+            ).refresh_event_summary()
+            last_pk = pks[-1]
+        # update() doesn't send the signals that invalidate cached responses.
+        cache.invalidate_all()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt the event summary of {updated} rides.")
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from rides.models import RideTrip
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the RideTrip summary table from pickup and dropoff ride events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        RideTrip.objects.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {RideTrip.objects.count()} ride trips.")
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.models import UserDailyStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the UserDailyStats rollup table from rides and their trips, "
+        "a few days of pickups at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-days", type=int, default=7)
+
+    def handle(self, *args, **options):
+        if options["batch_days"] < 1:
+            raise CommandError("--batch-days must be at least 1.")
+        UserDailyStats.objects.rebuild(batch_days=options["batch_days"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {UserDailyStats.objects.count()} user daily stats."
+            )
+        )
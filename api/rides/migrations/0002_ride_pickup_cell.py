@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+from rides.spatial import cell_for
+
+
+def backfill_pickup_cell(apps, schema_editor):
+    Ride = apps.get_model("rides", "Ride")
+    rides = Ride.objects.only("pickup_latitude", "pickup_longitude")
+    batch = []
+    for ride in rides.iterator(chunk_size=2000):
+        ride.pickup_cell = cell_for(ride.pickup_latitude, ride.pickup_longitude)
+        batch.append(ride)
+        if len(batch) == 2000:
+            Ride.objects.bulk_update(batch, ["pickup_cell"])
+            batch = []
+    Ride.objects.bulk_update(batch, ["pickup_cell"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="pickup_cell",
+            field=models.IntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_pickup_cell, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0002_ride_pickup_cell"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["pickup_time", "id_ride"], name="ride_pickup_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["status", "pickup_time", "id_ride"],
+                name="ride_status_pickup_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["rider", "pickup_time", "id_ride"],
+                name="ride_rider_pickup_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                fields=["created_at", "id_ride_event"], name="rideevent_created_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                fields=["ride", "created_at", "id_ride_event"],
+                name="rideevent_ride_created_at_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("rides", "0003_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ride",
+            name="rider",
+            field=models.ForeignKey(
+                db_column="id_rider",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rides_as_rider",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rideevent",
+            name="ride",
+            field=models.ForeignKey(
+                db_column="id_ride",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="ride_events",
+                to="rides.ride",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                fields=["description", "created_at", "id_ride_event"],
+                name="rideevent_description_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                condition=models.Q(("description", "Status changed to pickup")),
+                fields=["ride", "created_at"],
+                name="rideevent_pickup_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                condition=models.Q(("description", "Status changed to dropoff")),
+                fields=["ride", "created_at"],
+                name="rideevent_dropoff_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["email"], name="user_email_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["role"], name="user_role_idx"),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:14
+
+from datetime import timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min, Q
+
+PICKUP = "Status changed to pickup"
+DROPOFF = "Status changed to dropoff"
+
+
+def backfill_ride_trips(apps, schema_editor):
+    RideEvent = apps.get_model("rides", "RideEvent")
+    RideTrip = apps.get_model("rides", "RideTrip")
+    rows = (
+        RideEvent.objects.filter(description__in=[PICKUP, DROPOFF])
+        .values("ride_id", "ride__driver_id")
+        .annotate(
+            pickup_at=Min("created_at", filter=Q(description=PICKUP)),
+            dropoff_at=Max("created_at", filter=Q(description=DROPOFF)),
+        )
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        pickup_at, dropoff_at = row["pickup_at"], row["dropoff_at"]
+        batch.append(
+            RideTrip(
+                ride_id=row["ride_id"],
+                driver_id=row["ride__driver_id"],
+                pickup_at=pickup_at,
+                dropoff_at=dropoff_at,
+                duration=(dropoff_at - pickup_at if pickup_at and dropoff_at else None),
+                dropoff_month=(
+                    dropoff_at.astimezone(timezone.utc).date().replace(day=1)
+                    if dropoff_at
+                    else None
+                ),
+            )
+        )
+        if len(batch) == 2000:
+            RideTrip.objects.bulk_create(batch)
+            batch = []
+    RideTrip.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0004_access_pattern_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RideTrip",
+            fields=[
+                (
+                    "ride",
+                    models.OneToOneField(
+                        db_column="id_ride",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="trip",
+                        serialize=False,
+                        to="rides.ride",
+                    ),
+                ),
+                ("pickup_at", models.DateTimeField(null=True)),
+                ("dropoff_at", models.DateTimeField(null=True)),
+                ("duration", models.DurationField(null=True)),
+                ("dropoff_month", models.DateField(null=True)),
+                (
+                    "driver",
+                    models.ForeignKey(
+                        db_column="id_driver",
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trips_as_driver",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["dropoff_month", "driver", "duration"],
+                        name="ridetrip_month_driver_idx",
+                    ),
+                    models.Index(
+                        fields=["driver", "dropoff_month"], name="ridetrip_driver_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_ride_trips, migrations.RunPython.noop),
+    ]
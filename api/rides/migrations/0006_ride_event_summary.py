@@ -0,0 +1,61 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_event_summary(apps, schema_editor):
+    Ride = apps.get_model("rides", "Ride")
+    RideEvent = apps.get_model("rides", "RideEvent")
+    events = RideEvent.objects.filter(ride=OuterRef("pk"))
+    latest = events.order_by("-created_at", "-id_ride_event")
+    Ride.objects.update(
+        event_count=Coalesce(
+            Subquery(
+                events.order_by()
+                .values("ride")
+                .annotate(count=Count("*"))
+                .values("count")
+            ),
+            0,
+        ),
+        last_event_at=Subquery(latest.values("created_at")[:1]),
+        last_event_description=Coalesce(
+            Subquery(latest.values("description")[:1]), Value("")
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0005_ride_trip"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="event_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="last_event_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="last_event_description",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["last_event_at", "id_ride"], name="ride_last_event_at_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_event_summary, migrations.RunPython.noop),
+    ]
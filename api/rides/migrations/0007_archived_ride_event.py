@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0006_ride_event_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRideEvent",
+            fields=[
+                (
+                    "id_ride_event",
+                    models.IntegerField(primary_key=True, serialize=False),
+                ),
+                ("description", models.CharField(max_length=255)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "ride",
+                    models.ForeignKey(
+                        db_column="id_ride",
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_events",
+                        to="rides.ride",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["ride", "created_at", "id_ride_event"],
+                        name="archivedrideevent_ride_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0007_archived_ride_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(fields=["updated_at"], name="ride_updated_at_idx"),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:42
+
+import datetime
+from datetime import timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_user_daily_stats(apps, schema_editor):
+    Ride = apps.get_model("rides", "Ride")
+    UserDailyStats = apps.get_model("rides", "UserDailyStats")
+    long_trip = datetime.timedelta(minutes=settings.RIDES_LONG_TRIP_MINUTES)
+    batch = []
+    for role in ("rider", "driver"):
+        rows = (
+            Ride.objects.values(
+                role, "status", day=TruncDate("pickup_time", tzinfo=timezone.utc)
+            )
+            .annotate(
+                rides=Count("*"),
+                trips=Count("trip__duration"),
+                long_trips=Count("trip", filter=Q(trip__duration__gt=long_trip)),
+                trip_duration=Sum("trip__duration"),
+            )
+            .order_by()
+        )
+        for row in rows.iterator(chunk_size=2000):
+            batch.append(
+                UserDailyStats(
+                    user_id=row[role],
+                    role=role,
+                    day=row["day"],
+                    status=row["status"],
+                    rides=row["rides"],
+                    trips=row["trips"],
+                    long_trips=row["long_trips"],
+                    trip_duration=row["trip_duration"] or datetime.timedelta(0),
+                )
+            )
+            if len(batch) == 2000:
+                UserDailyStats.objects.bulk_create(batch)
+                batch = []
+    UserDailyStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0008_ride_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("rider", "rider"), ("driver", "driver")],
+                        max_length=10,
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("status", models.CharField(max_length=50)),
+                ("rides", models.PositiveIntegerField(default=0)),
+                ("trips", models.PositiveIntegerField(default=0)),
+                ("long_trips", models.PositiveIntegerField(default=0)),
+                ("trip_duration", models.DurationField(default=datetime.timedelta(0))),
+            ],
+            options={
+                "verbose_name_plural": "user daily stats",
+            },
+        ),
+        migrations.AlterField(
+            model_name="ride",
+            name="driver",
+            field=models.ForeignKey(
+                db_column="id_driver",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rides_as_driver",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["driver", "pickup_time", "id_ride"],
+                name="ride_driver_pickup_time_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="userdailystats",
+            name="user",
+            field=models.ForeignKey(
+                db_column="id_user",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_stats",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="userdailystats",
+            constraint=models.UniqueConstraint(
+                fields=("user", "role", "day", "status"), name="userdailystats_key"
+            ),
+        ),
+        migrations.RunPython(backfill_user_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0009_user_daily_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RideEventType",
+            fields=[
+                (
+                    "id_event_type",
+                    models.SmallAutoField(primary_key=True, serialize=False),
+                ),
+                ("description", models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        # Nullable until 0011 fills it in and 0012 drops the descriptions.
+        migrations.AddField(
+            model_name="rideevent",
+            name="event_type",
+            field=models.ForeignKey(
+                db_column="id_event_type",
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="rides.rideeventtype",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedrideevent",
+            name="event_type",
+            field=models.ForeignKey(
+                db_column="id_event_type",
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="rides.rideeventtype",
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:05
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 2000
+
+
+def backfill_event_types(apps, schema_editor):
+    RideEventType = apps.get_model("rides", "RideEventType")
+    for model_name in ("RideEvent", "ArchivedRideEvent"):
+        events = apps.get_model("rides", model_name).objects.order_by()
+        descriptions = set(events.values_list("description", flat=True).distinct())
+        RideEventType.objects.bulk_create(
+            [RideEventType(description=description) for description in descriptions],
+            ignore_conflicts=True,
+        )
+        code = RideEventType.objects.filter(description=OuterRef("description")).values(
+            "pk"
+        )
+        # One range of event ids at a time, so no statement rewrites the whole
+        # table at once.
+        ids = events.order_by("pk").values_list("pk", flat=True)
+        last_pk = 0
+        while pks := list(ids.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+            events.filter(pk__gte=pks[0], pk__lte=pks[-1]).update(
+                event_type=Subquery(code)
+            )
+            last_pk = pks[-1]
+
+
+def restore_descriptions(apps, schema_editor):
+    # Undoes backfill_event_types once 0012 is reversed and the description
+    # columns are back, empty.
+    RideEventType = apps.get_model("rides", "RideEventType")
+    description = RideEventType.objects.filter(pk=OuterRef("event_type")).values(
+        "description"
+    )
+    for model_name in ("RideEvent", "ArchivedRideEvent"):
+        events = apps.get_model("rides", model_name).objects.order_by()
+        ids = events.order_by("pk").values_list("pk", flat=True)
+        last_pk = 0
+        while pks := list(ids.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+            events.filter(pk__gte=pks[0], pk__lte=pks[-1]).update(
+                description=Subquery(description)
+            )
+            last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    # Separate from the schema changes around it: PostgreSQL can't alter a
+    # table in the transaction that updated its rows' deferred foreign keys.
+
+    dependencies = [
+        ("rides", "0010_ride_event_type"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_event_types, restore_descriptions),
+    ]
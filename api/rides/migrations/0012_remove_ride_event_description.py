@@ -0,0 +1,83 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0011_backfill_ride_event_type"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="rideevent",
+            name="rideevent_description_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="rideevent",
+            name="rideevent_pickup_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="rideevent",
+            name="rideevent_dropoff_idx",
+        ),
+        # State only: the default lets unapplying the removals below add the
+        # columns back to tables that have rows, which 0011 then fills in
+        # from the event types.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name=model_name,
+                    name="description",
+                    field=models.CharField(default="", max_length=255),
+                )
+                for model_name in ("archivedrideevent", "rideevent")
+            ]
+        ),
+        migrations.RemoveField(
+            model_name="archivedrideevent",
+            name="description",
+        ),
+        migrations.RemoveField(
+            model_name="rideevent",
+            name="description",
+        ),
+        migrations.AlterField(
+            model_name="archivedrideevent",
+            name="event_type",
+            field=models.ForeignKey(
+                db_column="id_event_type",
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="rides.rideeventtype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rideevent",
+            name="event_type",
+            field=models.ForeignKey(
+                db_column="id_event_type",
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="rides.rideeventtype",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                fields=["event_type", "created_at", "id_ride_event"],
+                name="rideevent_type_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rideevent",
+            index=models.Index(
+                fields=["ride", "event_type", "created_at"],
+                name="rideevent_ride_type_idx",
+            ),
+        ),
+    ]
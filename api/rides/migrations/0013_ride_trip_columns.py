@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rides", "0012_remove_ride_event_description"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="duration_seconds",
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="trip_distance_km",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["trip_distance_km", "id_ride"], name="ride_trip_distance_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ride",
+            index=models.Index(
+                fields=["duration_seconds", "id_ride"], name="ride_duration_idx"
+            ),
+        ),
+    ]
@@ -1,16 +1,171 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DateTimeField,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.lookups import GreaterThanOrEqual, IsNull
+from django.utils import timezone
+
+from . import spatial
 
 
 class User(AbstractUser):
     role = models.CharField(max_length=50, blank=True)
     phone_number = models.CharField(max_length=20, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Backs the rider__email filter on rides and the user filters.
+            models.Index(fields=["email"], name="user_email_idx"),
+            models.Index(fields=["role"], name="user_role_idx"),
+        ]
+
     def __str__(self):
         return self.username
 
 
+class RideQuerySet(models.QuerySet):
+    def record_event(self, event):
+        """
+        Count a newly created event and, if it is the latest one, make it the
+        ride's last event. A single UPDATE, so concurrent events can't race.
+        """
+        is_latest = Q(last_event_at__isnull=True) | Q(
+            last_event_at__lte=event.created_at
+        )
+        return self.filter(pk=event.ride_id).update(
+            updated_at=timezone.now(),
+            event_count=F("event_count") + 1,
+            last_event_at=Case(
+                When(is_latest, then=Value(event.created_at)),
+                default=F("last_event_at"),
+                output_field=DateTimeField(),
+            ),
+            last_event_description=Case(
+                When(is_latest, then=Value(event.description)),
+                default=F("last_event_description"),
+            ),
+        )
+
+    def set_trip_durations(self, trips):
+        """
+        Copy the durations of ``trips`` to these rides, clearing it on those
+        without a trip among them.
+        """
+        seconds = [
+            When(pk=trip.ride_id, then=Value(round(trip.duration.total_seconds())))
+            for trip in trips
+            if trip.duration is not None
+        ]
+        return self.update(
+            updated_at=timezone.now(),
+            duration_seconds=Case(
+                *seconds, default=None, output_field=models.IntegerField()
+            ),
+        )
+
+    def refresh_event_summary(self):
+        """
+        Recompute the event summary fields of these rides from their events.
+        """
+        return self.update(updated_at=timezone.now(), **event_summary_expressions())
+
+    def with_stale_event_summary(self):
+        """
+        Rides whose event summary fields don't match their events.
+        """
+        expected = {
+            f"expected_{name}": expression
+            for name, expression in event_summary_expressions().items()
+        }
+        return self.annotate(**expected).exclude(
+            Q(event_count=F("expected_event_count"))
+            & Q(last_event_description=F("expected_last_event_description"))
+            & (
+                Q(last_event_at=F("expected_last_event_at"))
+                | Q(last_event_at__isnull=True, expected_last_event_at__isnull=True)
+            )
+        )
+
+
+def event_summary_expressions():
+    """
+    Expressions computing each summary field of a ride from its events, both
+    hot and archived.
+    """
+    hot = _event_summary_subqueries(RideEvent)
+    archived = _event_summary_subqueries(ArchivedRideEvent)
+
+    def latest(name, output_field):
+        # Archival moves the oldest events, so the latest one is nearly always
+        # hot, but an event can be created with an old timestamp.
+        return Case(
+            When(IsNull(archived["last_event_at"], True), then=hot[name]),
+            When(IsNull(hot["last_event_at"], True), then=archived[name]),
+            When(
+                GreaterThanOrEqual(hot["last_event_at"], archived["last_event_at"]),
+                then=hot[name],
+            ),
+            default=archived[name],
+            output_field=output_field,
+        )
+
+    return {
+        "event_count": Coalesce(hot["event_count"], 0)
+        + Coalesce(archived["event_count"], 0),
+        "last_event_at": latest("last_event_at", DateTimeField()),
+        "last_event_description": Coalesce(
+            latest("last_event_description", models.CharField()), Value("")
+        ),
+    }
+
+
+def _event_summary_subqueries(model):
+    events = model.objects.filter(ride=OuterRef("pk"))
+    latest = events.order_by("-created_at", "-id_ride_event")
+    return {
+        "event_count": Subquery(
+            events.order_by().values("ride").annotate(count=Count("*")).values("count")
+        ),
+        "last_event_at": Subquery(latest.values("created_at")[:1]),
+        "last_event_description": Subquery(
+            latest.values("event_type__description")[:1]
+        ),
+    }
+
+
 class Ride(models.Model):
+    # Denormalized from the ride's events (see RideQuerySet and signals.py),
+    # so current state can be filtered and sorted without reading them.
+    EVENT_SUMMARY_FIELDS = ("last_event_at", "last_event_description", "event_count")
+    # Copied from the ride's RideTrip by RideTripQuerySet.
+    TRIP_SUMMARY_FIELDS = ("duration_seconds",)
+    # Derived from the ride's own fields on save.
+    COORDINATE_FIELDS = (
+        "pickup_latitude",
+        "pickup_longitude",
+        "dropoff_latitude",
+        "dropoff_longitude",
+    )
+
     id_ride = models.AutoField(primary_key=True)
     status = models.CharField(max_length=50)
     rider = models.ForeignKey(
@@ -18,34 +173,731 @@ class Ride(models.Model):
         related_name="rides_as_rider",
         on_delete=models.CASCADE,
         db_column="id_rider",
+        # Covered by ride_rider_pickup_time_idx.
+        db_index=False,
     )
     driver = models.ForeignKey(
         User,
         related_name="rides_as_driver",
         on_delete=models.CASCADE,
         db_column="id_driver",
+        # Covered by ride_driver_pickup_time_idx.
+        db_index=False,
     )
     pickup_latitude = models.FloatField()
     pickup_longitude = models.FloatField()
     dropoff_latitude = models.FloatField()
     dropoff_longitude = models.FloatField()
     pickup_time = models.DateTimeField()
+    # Grid cell of the pickup point, see rides.spatial.
+    pickup_cell = models.IntegerField(null=True, editable=False, db_index=True)
+    last_event_at = models.DateTimeField(null=True, editable=False)
+    last_event_description = models.CharField(
+        max_length=255, blank=True, default="", editable=False
+    )
+    event_count = models.PositiveIntegerField(default=0, editable=False)
+    # Great-circle distance from pickup to dropoff, null until filled in by
+    # backfill_ride_trip_columns for rides saved before it was stored.
+    trip_distance_km = models.FloatField(null=True, editable=False)
+    # From the pickup to the dropoff event, see RideTrip.duration.
+    duration_seconds = models.IntegerField(null=True, editable=False)
+    # Bumped by every write to the ride or its events, including the queryset
+    # updates above, see rides.conditional.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RideQuerySet.as_manager()
 
-    objects = models.Manager()
+    class Meta:
+        indexes = [
+            # Keyset pagination on (pickup_time, id_ride), alone and under the
+            # status/rider filters.
+            models.Index(
+                fields=["pickup_time", "id_ride"], name="ride_pickup_time_idx"
+            ),
+            models.Index(
+                fields=["status", "pickup_time", "id_ride"],
+                name="ride_status_pickup_time_idx",
+            ),
+            models.Index(
+                fields=["rider", "pickup_time", "id_ride"],
+                name="ride_rider_pickup_time_idx",
+            ),
+            # A driver's rides by day, see UserDailyStats.
+            models.Index(
+                fields=["driver", "pickup_time", "id_ride"],
+                name="ride_driver_pickup_time_idx",
+            ),
+            # Idle-ride filters and ordering by last event.
+            models.Index(
+                fields=["last_event_at", "id_ride"], name="ride_last_event_at_idx"
+            ),
+            # Range filters and ordering on the trip columns.
+            models.Index(
+                fields=["trip_distance_km", "id_ride"], name="ride_trip_distance_idx"
+            ),
+            models.Index(
+                fields=["duration_seconds", "id_ride"], name="ride_duration_idx"
+            ),
+            # Validators of unfiltered lists, see rides.conditional.
+            models.Index(fields=["updated_at"], name="ride_updated_at_idx"),
+        ]
 
     def __str__(self):
         return f"Ride {self.id_ride} - {self.status}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the save signals update the stats the ride counted towards
+        # before its rider, driver or pickup day changed.
+        instance.saved_stats_keys = instance.stats_keys()
+        return instance
+
+    def stats_keys(self):
+        """
+        The ``(user_id, role, day)`` rows of UserDailyStats the ride counts
+        towards, as loaded.
+        """
+        names = ("rider_id", "driver_id", "pickup_time")
+        rider_id, driver_id, pickup_time = map(self.__dict__.get, names)
+        if pickup_time is None:
+            return set()
+        day = pickup_time.astimezone(dt_timezone.utc).date()
+        return {
+            (user_id, role, day)
+            for user_id, role in [(rider_id, "rider"), (driver_id, "driver")]
+            if user_id is not None
+        }
+
+    def save(self, *args, **kwargs):
+        if (
+            kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and not self._state.adding
+        ):
+            # The event and trip summaries are maintained in the database; don't
+            # write back a copy that may have gone stale since this ride was
+            # loaded.
+            maintained = {*self.EVENT_SUMMARY_FIELDS, *self.TRIP_SUMMARY_FIELDS}
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in maintained
+            ]
+        self.pickup_cell = spatial.cell_for(self.pickup_latitude, self.pickup_longitude)
+        self.trip_distance_km = spatial.haversine_km(
+            *(getattr(self, name) for name in self.COORDINATE_FIELDS)
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = {*update_fields, "updated_at"}
+            if {"pickup_latitude", "pickup_longitude"} & update_fields:
+                update_fields.add("pickup_cell")
+            if set(self.COORDINATE_FIELDS) & update_fields:
+                update_fields.add("trip_distance_km")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        self.saved_stats_keys = self.stats_keys()
+
+
+class _CreatedEventTypes(dict):
+    """
+    ``{description: code}`` of the types a transaction created, registered as
+    its on_commit callback to cache them. Rolling back, or back to a savepoint
+    from before they were created, discards the callback and them with it.
+    """
+
+    def __init__(self, manager, rows):
+        super().__init__(rows)
+        self.manager = manager
+
+    def __call__(self):
+        self.manager._cache(self)
+
+
+class RideEventTypeManager(models.Manager):
+    """
+    Interns event descriptions as type codes. Types are never renamed or
+    deleted, so both directions are cached in-process once read. Types created
+    in a transaction are only cached once it commits, so a rollback can't
+    leave a code behind that no row has; until then they're looked up in the
+    transaction's on_commit callbacks.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._descriptions = {}
+
+    def code_for(self, description, create=True):
+        """
+        The code of ``description``, created if it's new unless not
+        ``create``, in which case None.
+        """
+        code = self._codes.get(description)
+        if code is None:
+            code = self.codes_for([description], create).get(description)
+        return code
+
+    def codes_for(self, descriptions, create=True):
+        """
+        ``{description: code}`` of ``descriptions``, creating the new ones in
+        one insert unless not ``create``, in which case they're left out.
+        """
+        descriptions = set(descriptions)
+        codes = {
+            description: self._codes[description]
+            for description in descriptions
+            if description in self._codes
+        }
+        if not (missing := descriptions - codes.keys()):
+            return codes
+        created = self._created()
+        codes.update(
+            (description, created[description])
+            for description in missing
+            if description in created
+        )
+        if missing := missing - codes.keys():
+            codes.update(self._load(created, description__in=missing))
+        if create and (new := missing - codes.keys()):
+            # Ignoring conflicts and reading back also picks up the types a
+            # concurrent writer just created.
+            using = router.db_for_write(self.model)
+            types = self.using(using)
+            types.bulk_create(
+                [self.model(description=description) for description in new],
+                ignore_conflicts=True,
+            )
+            rows = dict(
+                types.filter(description__in=new).values_list("description", "pk")
+            )
+            if connections[using].in_atomic_block:
+                transaction.on_commit(_CreatedEventTypes(self, rows), using=using)
+            else:
+                self._cache(rows)
+            codes.update(rows)
+        return codes
+
+    def description_for(self, code):
+        """
+        The description of type ``code``, None if there's no such type.
+        """
+        description = self._descriptions.get(code)
+        if description is None and code is not None:
+            created = self._created()
+            for created_description, created_code in created.items():
+                if created_code == code:
+                    return created_description
+            # Usually a type another process created: read them all while at it.
+            rows = self._load(created)
+            description = next(
+                (description for description, pk in rows.items() if pk == code), None
+            )
+        return description
+
+    def clear_cache(self):
+        with self._lock:
+            self._codes.clear()
+            self._descriptions.clear()
+
+    def _created(self):
+        created = {}
+        connection = connections[router.db_for_write(self.model)]
+        for _, callback, _ in connection.run_on_commit:
+            if isinstance(callback, _CreatedEventTypes) and callback.manager is self:
+                created.update(callback)
+        return created
+
+    def _load(self, created, **filters):
+        rows = dict(self.filter(**filters).values_list("description", "pk"))
+        # Those this transaction created can't be cached before it commits.
+        self._cache({key: value for key, value in rows.items() if key not in created})
+        return rows
+
+    def _cache(self, rows):
+        with self._lock:
+            for description, code in rows.items():
+                self._codes[description] = code
+                self._descriptions[code] = description
+
+
+class RideEventType(models.Model):
+    """
+    The distinct ride event descriptions, which events reference by code
+    rather than repeating the text. Codes are small integers, so there's room
+    for about 32,000 types.
+    """
+
+    id_event_type = models.SmallAutoField(primary_key=True)
+    description = models.CharField(max_length=255, unique=True)
+
+    objects = RideEventTypeManager()
+
+    def __str__(self):
+        return self.description
+
+
+class RideEventQuerySet(models.QuerySet):
+    def with_description(self, *descriptions):
+        """
+        The events with one of ``descriptions``, compared by type code.
+        """
+        codes = RideEventType.objects.codes_for(descriptions, create=False)
+        return self.filter(event_type__in=codes.values())
+
+
+class EventDescriptionMixin:
+    """
+    ``description`` of a ride event model, read and written as its type code,
+    or read from ``event_type`` when that was selected along. Accepted as a
+    model and ``create()`` keyword argument, but queries have to go through
+    ``event_type``, see ``RideEventQuerySet.with_description``.
+    """
+
+    @property
+    def description(self):
+        event_type = self._state.fields_cache.get("event_type")
+        if event_type is not None:
+            return event_type.description
+        return RideEventType.objects.description_for(self.event_type_id)
+
+    @description.setter
+    def description(self, description):
+        self.event_type_id = RideEventType.objects.code_for(description)
+
+
+class RideEvent(EventDescriptionMixin, models.Model):
+    PICKUP = "Status changed to pickup"
+    DROPOFF = "Status changed to dropoff"
 
-class RideEvent(models.Model):
     id_ride_event = models.AutoField(primary_key=True)
     ride = models.ForeignKey(
-        Ride, related_name="ride_events", on_delete=models.CASCADE, db_column="id_ride"
+        Ride,
+        related_name="ride_events",
+        on_delete=models.CASCADE,
+        db_column="id_ride",
+        # Covered by rideevent_ride_created_at_idx.
+        db_index=False,
+    )
+    event_type = models.ForeignKey(
+        RideEventType,
+        related_name="+",
+        on_delete=models.PROTECT,
+        db_column="id_event_type",
+        # Covered by rideevent_type_idx.
+        db_index=False,
     )
-    description = models.CharField(max_length=255)
     created_at = models.DateTimeField()
 
-    objects = models.Manager()
+    objects = RideEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (created_at, id_ride_event), alone and per ride.
+            models.Index(
+                fields=["created_at", "id_ride_event"], name="rideevent_created_at_idx"
+            ),
+            models.Index(
+                fields=["ride", "created_at", "id_ride_event"],
+                name="rideevent_ride_created_at_idx",
+            ),
+            models.Index(
+                fields=["event_type", "created_at", "id_ride_event"],
+                name="rideevent_type_idx",
+            ),
+            # For the trip rebuild and the monthly long-trip report, which join
+            # each ride to its pickup and dropoff events.
+            models.Index(
+                fields=["ride", "event_type", "created_at"],
+                name="rideevent_ride_type_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"RideEvent {self.id_ride_event} for Ride {self.ride.id_ride}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the save signals update the ride an event was moved away from.
+        instance.saved_ride_id = instance.__dict__.get("ride_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The post_save handlers that maintain RideTrip and the ride's event
+        # summary run inside this transaction.
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+        self.saved_ride_id = self.ride_id
+
+
+class ArchivedRideEvent(EventDescriptionMixin, models.Model):
+    """
+    Ride events moved out of RideEvent once they fall out of the hot window,
+    see the archive_ride_events command. Rows keep their RideEvent ids and are
+    only read per ride, so the table carries a single index.
+
+    Archived events still count towards the ride's event summary and trip.
+    """
+
+    id_ride_event = models.IntegerField(primary_key=True)
+    ride = models.ForeignKey(
+        Ride,
+        related_name="archived_events",
+        on_delete=models.CASCADE,
+        db_column="id_ride",
+        # Covered by archivedrideevent_ride_idx.
+        db_index=False,
+    )
+    event_type = models.ForeignKey(
+        RideEventType,
+        related_name="+",
+        on_delete=models.PROTECT,
+        db_column="id_event_type",
+        db_index=False,
+    )
+    created_at = models.DateTimeField()
+
+    objects = RideEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["ride", "created_at", "id_ride_event"],
+                name="archivedrideevent_ride_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"ArchivedRideEvent {self.id_ride_event} for Ride {self.ride_id}"
+
+
+class RideTripQuerySet(models.QuerySet):
+    def record_event(self, event):
+        """
+        Fold a newly created pickup/dropoff event into its ride's trip.
+        """
+        with transaction.atomic(using=self.db):
+            trip = self.select_for_update().filter(ride_id=event.ride_id).first()
+            if trip is None:
+                trip = self.model(ride_id=event.ride_id, driver_id=event.ride.driver_id)
+            duration = trip.duration
+            if event.description == RideEvent.PICKUP:
+                if trip.pickup_at is None or event.created_at < trip.pickup_at:
+                    trip.pickup_at = event.created_at
+            elif event.description == RideEvent.DROPOFF:
+                if trip.dropoff_at is None or event.created_at > trip.dropoff_at:
+                    trip.dropoff_at = event.created_at
+            trip.save(force_insert=trip._state.adding)
+            if trip.duration != duration:
+                rides = Ride.objects.using(self.db).filter(pk=trip.ride_id)
+                rides.set_trip_durations([trip])
+        return trip
+
+    def rebuild(self, ride_ids=None, batch_size=2000):
+        """
+        Recompute trips from ride events, hot and archived, for every ride or
+        only ``ride_ids``.
+        """
+        stale = self
+        if ride_ids is not None:
+            ride_ids = list(ride_ids)
+            stale = stale.filter(ride_id__in=ride_ids)
+
+        rides = Ride.objects.using(self.db)
+        with transaction.atomic(using=self.db):
+            stale.delete()
+            if ride_ids is not None:
+                for start in range(0, len(ride_ids), batch_size):
+                    stop = start + batch_size
+                    trips = self.bulk_create(
+                        self.build(Q(ride_id__in=ride_ids[start:stop]))
+                    )
+                    rides.filter(pk__in=ride_ids[start:stop]).set_trip_durations(trips)
+                return
+            # Every ride, one range of ride ids at a time.
+            ordered = rides.order_by("pk")
+            last_pk = 0
+            while pks := list(
+                ordered.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size]
+            ):
+                trips = self.bulk_create(
+                    self.build(Q(ride_id__gte=pks[0], ride_id__lte=pks[-1]))
+                )
+                rides.filter(pk__gte=pks[0], pk__lte=pks[-1]).set_trip_durations(trips)
+                last_pk = pks[-1]
+
+    def build(self, condition):
+        """
+        Unsaved trips for the rides whose events match ``condition``.
+        """
+        codes = RideEventType.objects.codes_for(
+            [RideEvent.PICKUP, RideEvent.DROPOFF], create=False
+        )
+        pickup, dropoff = codes.get(RideEvent.PICKUP), codes.get(RideEvent.DROPOFF)
+        trips = {}
+        for model in (RideEvent, ArchivedRideEvent):
+            rows = (
+                model.objects.using(self.db)
+                .filter(condition, event_type__in=[pickup, dropoff])
+                .values("ride_id", "ride__driver_id")
+                .annotate(
+                    pickup_at=Min("created_at", filter=Q(event_type=pickup)),
+                    dropoff_at=Max("created_at", filter=Q(event_type=dropoff)),
+                )
+                .order_by()
+            )
+            for row in rows:
+                trip = trips.get(row["ride_id"])
+                if trip is None:
+                    trips[row["ride_id"]] = self.model(
+                        ride_id=row["ride_id"],
+                        driver_id=row["ride__driver_id"],
+                        pickup_at=row["pickup_at"],
+                        dropoff_at=row["dropoff_at"],
+                    )
+                    continue
+                # The ride has both hot and archived pickup/dropoff events.
+                trip.pickup_at = min(
+                    filter(None, [trip.pickup_at, row["pickup_at"]]), default=None
+                )
+                trip.dropoff_at = max(
+                    filter(None, [trip.dropoff_at, row["dropoff_at"]]), default=None
+                )
+        for trip in trips.values():
+            trip.set_duration()
+        return list(trips.values())
+
+
+class RideTrip(models.Model):
+    """
+    One row per ride summarising its pickup and dropoff events, so trip
+    duration reports read a single table instead of self-joining ride events.
+    """
+
+    ride = models.OneToOneField(
+        Ride,
+        primary_key=True,
+        related_name="trip",
+        on_delete=models.CASCADE,
+        db_column="id_ride",
+    )
+    # Copied from the ride so reports can group by driver without a join.
+    driver = models.ForeignKey(
+        User,
+        related_name="trips_as_driver",
+        on_delete=models.CASCADE,
+        db_column="id_driver",
+        db_index=False,
+    )
+    pickup_at = models.DateTimeField(null=True)
+    dropoff_at = models.DateTimeField(null=True)
+    duration = models.DurationField(null=True)
+    dropoff_month = models.DateField(null=True)
+
+    objects = RideTripQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Covers the monthly long-trip report end to end.
+            models.Index(
+                fields=["dropoff_month", "driver", "duration"],
+                name="ridetrip_month_driver_idx",
+            ),
+            models.Index(
+                fields=["driver", "dropoff_month"], name="ridetrip_driver_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"RideTrip for Ride {self.ride_id}"
+
+    def set_duration(self):
+        if self.pickup_at is None or self.dropoff_at is None:
+            self.duration = None
+        else:
+            self.duration = self.dropoff_at - self.pickup_at
+        if self.dropoff_at is None:
+            self.dropoff_month = None
+        else:
+            dropoff_at = self.dropoff_at.astimezone(dt_timezone.utc)
+            self.dropoff_month = dropoff_at.date().replace(day=1)
+
+    def save(self, *args, **kwargs):
+        self.set_duration()
+        super().save(*args, **kwargs)
+
+
+class UserDailyStatsQuerySet(models.QuerySet):
+    def refresh_rides(self, ride_ids):
+        """
+        Recompute the rows the rides ``ride_ids`` count towards.
+        """
+        rides = Ride.objects.using(self.db).filter(pk__in=list(ride_ids))
+        keys = set()
+        for ride in rides.only("rider", "driver", "pickup_time"):
+            keys |= ride.stats_keys()
+        self.refresh(keys)
+
+    def refresh(self, keys):
+        """
+        Recompute the rows of ``keys``, ``(user_id, role, day)`` tuples, from
+        the rides they count.
+        """
+        users = defaultdict(set)
+        for user_id, role, day in keys:
+            users[role, day].add(user_id)
+        with transaction.atomic(using=self.db):
+            for (role, day), user_ids in users.items():
+                self.filter(role=role, day=day, user__in=user_ids).delete()
+                start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+                condition = Q(
+                    **{f"{role}__in": user_ids},
+                    pickup_time__gte=start,
+                    pickup_time__lt=start + timedelta(days=1),
+                )
+                self.bulk_create(self.build(role, condition))
+
+    def rebuild(self, batch_days=7):
+        """
+        Recompute every row from rides, ``batch_days`` days of pickups at a
+        time.
+        """
+        rides = Ride.objects.using(self.db)
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            bounds = rides.aggregate(first=Min("pickup_time"), last=Max("pickup_time"))
+            if bounds["first"] is None:
+                return
+            start = bounds["first"].astimezone(dt_timezone.utc)
+            start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            while start <= bounds["last"]:
+                stop = start + timedelta(days=batch_days)
+                condition = Q(pickup_time__gte=start, pickup_time__lt=stop)
+                for role in self.model.ROLES:
+                    self.bulk_create(self.build(role, condition))
+                start = stop
+
+    def build(self, role, condition):
+        """
+        Unsaved rows of ``role`` for the rides matching ``condition``.
+        """
+        long_trip = timedelta(minutes=settings.RIDES_LONG_TRIP_MINUTES)
+        rows = (
+            Ride.objects.using(self.db)
+            .filter(condition)
+            .values(
+                role, "status", day=TruncDate("pickup_time", tzinfo=dt_timezone.utc)
+            )
+            .annotate(
+                rides=Count("*"),
+                trips=Count("trip__duration"),
+                long_trips=Count("trip", filter=Q(trip__duration__gt=long_trip)),
+                trip_duration=Sum("trip__duration"),
+            )
+            .order_by()
+        )
+        return [
+            self.model(
+                user_id=row[role],
+                role=role,
+                day=row["day"],
+                status=row["status"],
+                rides=row["rides"],
+                trips=row["trips"],
+                long_trips=row["long_trips"],
+                trip_duration=row["trip_duration"] or timedelta(0),
+            )
+            for row in rows
+        ]
+
+    def totals(self, user_ids, start=None, end=None):
+        """
+        ``{user_id: {role: stats}}`` summed over the ``start``..``end`` days
+        (inclusive, either open), for every one of ``user_ids`` and role. Reads
+        one row per user, role, day and status.
+        """
+        user_ids = list(user_ids)
+        rows = self.filter(user__in=user_ids)
+        if start is not None:
+            rows = rows.filter(day__gte=start)
+        if end is not None:
+            rows = rows.filter(day__lte=end)
+        rows = (
+            rows.values("user", "role", "status")
+            .annotate(
+                total_rides=Sum("rides"),
+                total_trips=Sum("trips"),
+                total_long_trips=Sum("long_trips"),
+                total_trip_duration=Sum("trip_duration"),
+            )
+            .order_by("user", "role", "status")
+        )
+        totals = {
+            user_id: {
+                role: {
+                    "rides": 0,
+                    "rides_by_status": {},
+                    "trips": 0,
+                    "long_trips": 0,
+                    "trip_duration": timedelta(0),
+                }
+                for role in self.model.ROLES
+            }
+            for user_id in user_ids
+        }
+        for row in rows:
+            stats = totals[row["user"]][row["role"]]
+            stats["rides"] += row["total_rides"]
+            stats["rides_by_status"][row["status"]] = row["total_rides"]
+            stats["trips"] += row["total_trips"]
+            stats["long_trips"] += row["total_long_trips"]
+            stats["trip_duration"] += row["total_trip_duration"]
+        return totals
+
+
+class UserDailyStats(models.Model):
+    """
+    Rides of a user as rider or driver per pickup day (UTC) and ride status,
+    with their trips from RideTrip, so a user's statistics are summed from a
+    row per day instead of counted from their rides.
+
+    Kept up to date as rides and their pickup/dropoff events are written (see
+    signals.py and ingest.py); rebuilt with the rebuild_user_stats command.
+    """
+
+    ROLES = ("rider", "driver")
+
+    user = models.ForeignKey(
+        User,
+        related_name="daily_stats",
+        on_delete=models.CASCADE,
+        db_column="id_user",
+        # Covered by userdailystats_key.
+        db_index=False,
+    )
+    role = models.CharField(max_length=10, choices=[(role, role) for role in ROLES])
+    day = models.DateField()
+    status = models.CharField(max_length=50)
+    rides = models.PositiveIntegerField(default=0)
+    # Rides with both a pickup and a dropoff event.
+    trips = models.PositiveIntegerField(default=0)
+    # Trips longer than RIDES_LONG_TRIP_MINUTES.
+    long_trips = models.PositiveIntegerField(default=0)
+    trip_duration = models.DurationField(default=timedelta(0))
+
+    objects = UserDailyStatsQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "role", "day", "status"], name="userdailystats_key"
+            ),
+        ]
+        verbose_name_plural = "user daily stats"
+
+    def __str__(self):
+        return f"{self.role.title()} stats of user {self.user_id} on {self.day}"
@@ -0,0 +1,316 @@
+import asyncio
+
+from django.core.paginator import InvalidPage, Page
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a unique ``(sort_field, pk)`` key.
+
+    Unlike DRF's ``CursorPagination`` the cursor stores the whole key, so every
+    page is a single index range scan (``sort_field >= x AND (sort_field > x OR
+    pk > y)``) with no OFFSET and no COUNT, however deep the client pages.
+    The key is taken from ``view.cursor_ordering``; ``?ordering=-<sort_field>``
+    walks it backwards, and any other ``?ordering=`` is rejected rather than
+    ignored.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None, fetch=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(await (fetch or afetch)(page_queryset))
+
+    def get_page_queryset(self, queryset, request, view):
+        """
+        The unevaluated query for this page, including one row past its end.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip("-")) for name in self.ordering
+        ]
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        descending = self.ordering[0].startswith("-") != reverse
+
+        if reverse:
+            queryset = queryset.order_by(*_invert(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self.after(self.cursor.position, descending))
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_following = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = (
+                self.cursor is not None and self.cursor.position is not None
+            )
+
+        if self.page and (self.has_next or self.has_previous):
+            self.display_page_controls = True
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(view.cursor_ordering)
+        requested = tuple(
+            term.strip()
+            for term in request.query_params.get("ordering", "").split(",")
+            if term.strip()
+        )
+        for candidate in (ordering, _invert(ordering)):
+            if requested == candidate[: len(requested)]:
+                return candidate
+        raise ValidationError(
+            {
+                "ordering": [
+                    f"Cursor pagination is ordered by {ordering[0]} or "
+                    f"-{ordering[0]} only."
+                ]
+            }
+        )
+
+    def after(self, position, descending):
+        try:
+            key, pk = position.rsplit("|", 1)
+            key = self.fields[0].to_python(key)
+            pk = self.fields[1].to_python(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        if key is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        lookup = "lt" if descending else "gt"
+        key_name, pk_name = (field.name for field in self.fields)
+        return Q(**{f"{key_name}__{lookup}e": key}) & (
+            Q(**{f"{key_name}__{lookup}": key}) | Q(**{f"{pk_name}__{lookup}": pk})
+        )
+
+    def position(self, instance):
+        return "|".join(field.value_to_string(instance) for field in self.fields)
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        cursor = Cursor(offset=0, reverse=False, position=self.position(self.page[-1]))
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        cursor = Cursor(offset=0, reverse=True, position=self.position(self.page[0]))
+        return self.encode_cursor(cursor)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination that can also paginate through the async ORM, see
+    ``apaginate_queryset``.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None, fetch=None):
+        """
+        Async ``paginate_queryset``. The page's rows are read with ``fetch``
+        (an async callable taking the sliced queryset, by default
+        ``afetch``), concurrently with the count when the page number is known
+        up front.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        fetch = fetch or afetch
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        try:
+            number = int(request.query_params.get(self.page_query_param) or 1)
+        except ValueError:
+            number = None
+        if number is not None and number > 0 and not paginator.orphans:
+            bottom = (number - 1) * page_size
+            top = bottom + page_size
+            paginator.count, results = await asyncio.gather(
+                queryset.acount(), fetch(queryset[bottom:top])
+            )
+        else:
+            paginator.count, results = await queryset.acount(), None
+
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        if results is None:
+            bottom = (number - 1) * page_size
+            top = bottom + page_size
+            if top + paginator.orphans >= paginator.count:
+                top = paginator.count
+            results = await fetch(queryset[bottom:top])
+
+        self.page = Page(results, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class RidePagination(AsyncPageNumberPagination):
+    """
+    Page-number pagination with two opt-ins for bulk readers:
+
+    * ``?pagination=cursor`` switches to ``KeysetPagination``.
+    * ``?count=false`` keeps page numbers but skips the ``COUNT(*)``; one extra
+      row is fetched to tell whether there is a next page and ``count`` is
+      returned as ``null``.
+    """
+
+    pagination_query_param = "pagination"
+    count_query_param = "count"
+    # The number of rides, when the view has already counted them.
+    known_count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = None
+        self.counted = True
+        if self.is_cursor_request(request):
+            self.keyset = KeysetPagination()
+            page = self.keyset.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        if self.is_count_free_request(request):
+            self.counted = False
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None, fetch=None):
+        self.request = request
+        self.keyset = None
+        self.counted = True
+        if self.is_cursor_request(request):
+            self.keyset = KeysetPagination()
+            page = await self.keyset.apaginate_queryset(queryset, request, view, fetch)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        if self.is_count_free_request(request):
+            self.counted = False
+            page_queryset = self.get_uncounted_page_queryset(queryset, request)
+            if page_queryset is None:
+                return None
+            return self.set_uncounted_page(await (fetch or afetch)(page_queryset))
+        return await super().apaginate_queryset(queryset, request, view, fetch)
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = DjangoPaginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+    def is_cursor_request(self, request):
+        return request.query_params.get(self.pagination_query_param) == "cursor"
+
+    def is_count_free_request(self, request):
+        value = request.query_params.get(self.count_query_param, "")
+        return value.lower() in ("0", "false")
+
+    def paginate_without_count(self, queryset, request):
+        page_queryset = self.get_uncounted_page_queryset(queryset, request)
+        if page_queryset is None:
+            return None
+        return self.set_uncounted_page(list(page_queryset))
+
+    def get_uncounted_page_queryset(self, queryset, request):
+        self.uncounted_page_size = page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        stop = offset + page_size + 1
+        return queryset[offset:stop]
+
+    def set_uncounted_page(self, results):
+        self.has_next = len(results) > self.uncounted_page_size
+        self.display_page_controls = False
+        return results[: self.uncounted_page_size]
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        if self.counted:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "count": None,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_next_link(self):
+        if self.counted:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.counted:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_html_context(self):
+        if self.keyset is not None:
+            return self.keyset.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+
+async def afetch(queryset):
+    return [obj async for obj in queryset]
+
+
+def _invert(ordering):
+    return tuple(name[1:] if name.startswith("-") else f"-{name}" for name in ordering)
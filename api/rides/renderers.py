@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+
+from rest_framework import renderers
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # Optional, see requirements-formats.txt.
+    msgpack = None
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Newline-delimited JSON: one object per line.
+
+    Streaming views write their own lines (see export.py); this renders the
+    non-streamed responses of the same views, such as errors.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        items = data if isinstance(data, list) else [data]
+        return "".join(ndjson_line(item) for item in items).encode(self.charset)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    CSV with a header row taken from the keys of the first object.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        items = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        if items:
+            writer = csv.DictWriter(buffer, fieldnames=list(items[0]))
+            writer.writeheader()
+            writer.writerows(items)
+        return buffer.getvalue().encode(self.charset)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    MessagePack: the same data as JSON, with floats and integers in binary.
+    Needs the msgpack package.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=str)
+
+
+class ColumnarJSONRenderer(renderers.JSONRenderer):
+    """
+    Lists, and the ``results`` of pages, as ``columns`` plus one value array
+    per object in ``rows``, see ``to_columns``. Anything else renders as JSON.
+    """
+
+    media_type = "application/vnd.rides.columnar+json"
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(
+            to_columns(data, renderer_context), accepted_media_type, renderer_context
+        )
+
+
+class ColumnarMessagePackRenderer(MessagePackRenderer):
+    media_type = "application/vnd.rides.columnar+msgpack"
+    format = "columnar-msgpack"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(
+            to_columns(data, renderer_context), accepted_media_type, renderer_context
+        )
+
+
+def to_columns(data, renderer_context=None):
+    """
+    ``data`` with its objects (a list, or a page's ``results``) as ``columns``
+    and ``rows``.
+
+    Nested objects in the view's ``columnar_side_tables`` fields (field name:
+    table name) are replaced by their ``id`` and listed once each in that
+    table, e.g. ``{"users": {"3": {...}}}`` for the riders and drivers of a
+    page of rides.
+    """
+    if isinstance(data, list):
+        page, objects = {}, data
+    elif isinstance(data, dict) and isinstance(data.get("results"), list):
+        page, objects = dict(data), data["results"]
+    else:
+        return data
+    view = (renderer_context or {}).get("view")
+    side_tables = getattr(view, "columnar_side_tables", {})
+
+    columns = list(objects[0]) if objects else []
+    tables = {name: {} for name in side_tables.values()}
+    rows = []
+    for obj in objects:
+        row = []
+        for column in columns:
+            value = obj.get(column)
+            if column in side_tables and isinstance(value, dict):
+                tables[side_tables[column]][str(value["id"])] = value
+                value = value["id"]
+            row.append(value)
+        rows.append(row)
+    page.pop("results", None)
+    return {**page, "columns": columns, "rows": rows, **tables}
+
+
+# The compact formats list and detail views offer besides the defaults.
+COMPACT_RENDERER_CLASSES = [ColumnarJSONRenderer]
+if msgpack is not None:
+    COMPACT_RENDERER_CLASSES += [MessagePackRenderer, ColumnarMessagePackRenderer]
+RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, *COMPACT_RENDERER_CLASSES]
+
+
+def ndjson_line(item):
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n"
@@ -0,0 +1,163 @@
+"""
+Read-replica routing for the rides app.
+
+Views opt in with ``ReplicaReadMixin``. For a safe request to one of their
+``replica_actions``, every read of a rides model for the rest of the request
+goes to a replica from ``RIDES_REPLICAS``; everything else, including all
+writes and every read in a request that writes, goes to the primary.
+
+A client that has just written is kept on the primary for
+``RIDES_REPLICA_STICKY_SECONDS`` so it reads its own writes despite
+replication lag, and a replica that can't be connected to is skipped for
+``RIDES_REPLICA_RETRY_SECONDS``. With no replicas configured nothing changes.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+# The replica the current request reads from, if any. A context variable so
+# it follows the request into sync_to_async threads.
+_read_alias = ContextVar("rides_read_alias", default=None)
+
+_down_lock = threading.Lock()
+_down_until = {}
+
+# Set on every write, see ``recently_written``.
+LAST_WRITE_KEY = "rides:replica:last-write"
+
+
+def _sticky_key(user_pk):
+    return f"rides:replica:sticky:{user_pk}"
+
+
+def choose_replica():
+    """
+    A random available replica alias, or None to read from the primary.
+    """
+    now = time.monotonic()
+    replicas = list(settings.RIDES_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        with _down_lock:
+            if _down_until.get(alias, 0) > now:
+                continue
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning(
+                "Replica %r is unavailable, reading from the primary.",
+                alias,
+                exc_info=True,
+            )
+            with _down_lock:
+                _down_until[alias] = now + settings.RIDES_REPLICA_RETRY_SECONDS
+            continue
+        return alias
+    return None
+
+
+def read_from(alias):
+    _read_alias.set(alias)
+
+
+def reading_from():
+    return _read_alias.get()
+
+
+def stick_to_primary(user):
+    cache = get_cache()
+    timeout = settings.RIDES_REPLICA_STICKY_SECONDS
+    cache.set(LAST_WRITE_KEY, True, timeout)
+    if user is not None and user.is_authenticated:
+        cache.set(_sticky_key(user.pk), True, timeout)
+
+
+def is_stuck_to_primary(user):
+    return (
+        user is not None
+        and user.is_authenticated
+        and bool(get_cache().get(_sticky_key(user.pk)))
+    )
+
+
+def recently_written():
+    """
+    Whether any client wrote within the sticky window, i.e. replicas may not
+    have caught up yet.
+    """
+    return bool(get_cache().get(LAST_WRITE_KEY))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "rides":
+            # None falls back to the hinted instance's database, so related
+            # lookups on rows read from a replica stay there.
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == "rides":
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.RIDES_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db != DEFAULT_DB_ALIAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Reads safe requests to ``replica_actions`` from a replica (views without
+    actions: every safe request) and keeps a client that writes on the primary
+    for a while, see the module docstring. ``self.read_db`` is the replica
+    chosen for the request, for querysets evaluated after the view returns.
+    """
+
+    replica_actions = ("list", "retrieve")
+    read_db = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.reads_from_replica(request):
+            self.read_db = choose_replica()
+            read_from(self.read_db)
+
+    def reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS or not settings.RIDES_REPLICAS:
+            return False
+        action = getattr(self, "action", None)
+        if action is not None and action not in self.replica_actions:
+            return False
+        return not is_stuck_to_primary(request.user)
+
+    def get_cache_ttl(self, data):
+        # Don't cache what a lagging replica returned right after a write.
+        if self.read_db is not None and recently_written():
+            return 0
+        return super().get_cache_ttl(data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        read_from(None)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            stick_to_primary(getattr(request, "user", None))
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,28 +1,126 @@
+import functools
+import operator
 from datetime import timedelta
 
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import serializers
 
+from .instrumentation import TimedListSerializer, TimedSerializerMixin
 from .models import Ride, RideEvent, User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class RoleStatsSerializer(serializers.Serializer):
+    rides = serializers.IntegerField()
+    rides_by_status = serializers.DictField(child=serializers.IntegerField())
+    trips = serializers.IntegerField()
+    long_trips = serializers.IntegerField()
+    trip_duration = serializers.DurationField()
+
+
+class UserStatsSerializer(serializers.Serializer):
+    """
+    A user's ride statistics as rider and as driver, from
+    ``UserDailyStats.objects.totals()``.
+    """
+
+    rider = RoleStatsSerializer()
+    driver = RoleStatsSerializer()
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A user. With ``?expand=stats`` the view passes their statistics in the
+    ``user_stats`` context, keyed by user id, and they are shown as ``stats``.
+    """
+
+    expandable_fields = ("stats",)
+
     class Meta:
         model = User
         fields = ["id", "first_name", "last_name", "email", "phone_number", "role"]
+        list_serializer_class = TimedListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if "user_stats" in self.context:
+            fields["stats"] = serializers.SerializerMethodField()
+        return fields
+
+    def get_stats(self, user):
+        return UserStatsSerializer(self.context["user_stats"][user.pk]).data
 
 
 class RideEventSerializer(serializers.ModelSerializer):
+    # A property over the event type code, see RideEventType.
+    description = serializers.CharField(max_length=255)
+
     class Meta:
         model = RideEvent
         fields = ["id_ride_event", "description", "created_at"]
 
 
-class RideSerializer(serializers.ModelSerializer):
+class StandaloneRideEventSerializer(TimedSerializerMixin, RideEventSerializer):
+    """
+    A ride event on its own, with the ride it belongs to.
+    """
+
+    class Meta(RideEventSerializer.Meta):
+        fields = ["id_ride_event", "ride", "description", "created_at"]
+        list_serializer_class = TimedListSerializer
+
+
+class BulkRideEventSerializer(serializers.ModelSerializer):
+    """
+    One item of a bulk ingest. The ride is taken as a bare id and checked for
+    the whole batch at once, see ingest.py.
+    """
+
+    ride = serializers.IntegerField(source="ride_id", min_value=1, max_value=2**31 - 1)
+    description = serializers.CharField(max_length=255)
+
+    class Meta:
+        model = RideEvent
+        fields = ["ride", "description", "created_at"]
+
+
+class RideEventHistorySerializer(RideEventSerializer):
+    """
+    A hot or archived event of a ride, see ``RideViewSet.events``.
+    """
+
+    archived = serializers.BooleanField(read_only=True)
+
+    class Meta(RideEventSerializer.Meta):
+        fields = ["id_ride_event", "description", "created_at", "archived"]
+
+
+class RideSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A ride with its rider, driver and the events of the last 24 hours.
+
+    ``fields`` and ``expand`` (sets of field names) make it sparse: only
+    ``fields`` are shown (all but ``opt_in_fields`` by default), rider and
+    driver as ids unless expanded, and ``todays_ride_events`` only when
+    expanded. Leaving both out shows everything but ``opt_in_fields``
+    expanded.
+    """
+
     rider = UserSerializer()
     driver = UserSerializer()
     todays_ride_events = serializers.SerializerMethodField()
 
+    expandable_fields = ("rider", "driver", "todays_ride_events")
+    # The event and trip summary columns, only shown when ``fields`` names
+    # them so the default payload stays as it was.
+    opt_in_fields = (
+        "last_event_at",
+        "last_event_description",
+        "event_count",
+        "trip_distance_km",
+        "duration_seconds",
+    )
+
     class Meta:
         model = Ride
         fields = [
@@ -35,12 +133,207 @@ class RideSerializer(serializers.ModelSerializer):
             "dropoff_latitude",
             "dropoff_longitude",
             "pickup_time",
+            "last_event_at",
+            "last_event_description",
+            "event_count",
+            "trip_distance_km",
+            "duration_seconds",
             "todays_ride_events",
         ]
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse_fields = fields
+        self.expand = expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is None:
+            for name in self.opt_in_fields:
+                del fields[name]
+            if self.expand is None:
+                return fields
+        expand = self.expand or frozenset()
+        for name in ("rider", "driver"):
+            if name not in expand:
+                fields[name] = serializers.IntegerField(
+                    source=f"{name}_id", read_only=True
+                )
+        if "todays_ride_events" not in expand:
+            del fields["todays_ride_events"]
+        if self.sparse_fields is not None:
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name in self.sparse_fields or name in expand
+            }
+        return fields
 
     def get_todays_ride_events(self, obj):
+        return RideEventSerializer(self.todays_events(obj), many=True).data
+
+    def todays_events(self, obj):
         if hasattr(obj, "todays_events"):
-            return RideEventSerializer(obj.todays_events, many=True).data
+            return obj.todays_events
         last_24_hours = timezone.now() - timedelta(days=1)
-        events = obj.ride_events.filter(created_at__gte=last_24_hours)
-        return RideEventSerializer(events, many=True).data
+        return obj.ride_events.filter(created_at__gte=last_24_hours)
+
+
+class RideExportSerializer(serializers.ModelSerializer):
+    """
+    Flat ride representation for bulk exports: related users by id and every
+    event of the ride, read from the ``export_events`` prefetch.
+    """
+
+    rider = serializers.IntegerField(source="rider_id")
+    driver = serializers.IntegerField(source="driver_id")
+    events = RideEventSerializer(source="export_events", many=True)
+
+    class Meta:
+        model = Ride
+        fields = [
+            "id_ride",
+            "status",
+            "rider",
+            "driver",
+            "pickup_latitude",
+            "pickup_longitude",
+            "dropoff_latitude",
+            "dropoff_longitude",
+            "pickup_time",
+            "events",
+        ]
+
+
+class FastRideSerializer(RideSerializer):
+    """
+    RideSerializer with a precompiled ``to_representation`` for reads.
+
+    Produces exactly the same output, but walks a flat list of per-field
+    accessors instead of instantiating nested serializers for every ride.
+    """
+
+    def to_representation(self, instance):
+        return compiled_representation(
+            FastRideSerializer,
+            fields=self.known_fields(self.sparse_fields),
+            expand=self.known_fields(self.expand),
+        )(instance)
+
+    def known_fields(self, names):
+        # Names that match no field change nothing, so leaving them out of the
+        # cache key keeps one compiled function per distinct output.
+        if names is None:
+            return None
+        return frozenset(names).intersection(self.Meta.fields)
+
+    def get_todays_ride_events(self, obj):
+        represent = compiled_representation(RideEventSerializer)
+        return [represent(event) for event in self.todays_events(obj)]
+
+
+@functools.lru_cache(maxsize=256)
+def compiled_representation(serializer_class, **kwargs):
+    """
+    Compile ``serializer_class(**kwargs).to_representation`` into a plain
+    function. The arguments come from query parameters, so only the most
+    recently used combinations are kept.
+
+    Every readable field is resolved once to an attribute getter and the field
+    instance's own ``to_representation``, so values are formatted exactly as
+    DRF would format them. Nested serializers are compiled recursively and
+    method fields are bound to one shared serializer instance.
+    """
+    serializer = serializer_class(**kwargs)
+    steps = []
+    for field in serializer._readable_fields:
+        if isinstance(field, serializers.SerializerMethodField):
+            steps.append(
+                (field.field_name, None, getattr(serializer, field.method_name))
+            )
+            continue
+        getter = operator.attrgetter(".".join(field.source_attrs))
+        if isinstance(field, serializers.ListSerializer):
+            child = compiled_representation(type(field.child))
+            represent = functools.partial(_represent_many, child)
+        elif isinstance(field, serializers.Serializer):
+            represent = compiled_representation(type(field))
+        else:
+            represent = field.to_representation
+        steps.append((field.field_name, getter, represent))
+
+    def to_representation(instance):
+        ret = {}
+        for name, getter, represent in steps:
+            value = instance if getter is None else getter(instance)
+            ret[name] = None if value is None else represent(value)
+        return ret
+
+    return to_representation
+
+
+def _represent_many(represent, items):
+    if hasattr(items, "all"):
+        items = items.all()
+    return [represent(item) for item in items]
+
+
+class LongTripReportParamsSerializer(serializers.Serializer):
+    min_duration_minutes = serializers.IntegerField(
+        min_value=0, default=lambda: settings.RIDES_LONG_TRIP_MINUTES
+    )
+    start = serializers.DateField(required=False, input_formats=["%Y-%m", "iso-8601"])
+    end = serializers.DateField(required=False, input_formats=["%Y-%m", "iso-8601"])
+
+    def validate(self, attrs):
+        # Trips are bucketed by dropoff month, so the range is whole months.
+        if "start" in attrs:
+            attrs["start"] = attrs["start"].replace(day=1)
+        if "end" in attrs:
+            attrs["end"] = attrs["end"].replace(day=1)
+        if "start" in attrs and "end" in attrs and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must not be after end.")
+        return attrs
+
+
+class UserStatsParamsSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must not be after end.")
+        return attrs
+
+
+class HeatmapParamsSerializer(serializers.Serializer):
+    point = serializers.ChoiceField(["pickup", "dropoff"], default="pickup")
+    # south,west,north,east in degrees.
+    bbox = serializers.CharField(default="-90,-180,90,180")
+    rows = serializers.IntegerField(
+        min_value=1, max_value=settings.RIDES_HEATMAP_MAX_SIZE, default=64
+    )
+    cols = serializers.IntegerField(
+        min_value=1, max_value=settings.RIDES_HEATMAP_MAX_SIZE, default=64
+    )
+
+    def validate_bbox(self, value):
+        try:
+            south, west, north, east = (float(part) for part in value.split(","))
+        except ValueError:
+            raise serializers.ValidationError(
+                "Expected south,west,north,east in degrees."
+            )
+        if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+            raise serializers.ValidationError(
+                "Expected -90 <= south < north <= 90 and -180 <= west < east <= 180."
+            )
+        return south, west, north, east
+
+
+class LiveFeedParamsSerializer(serializers.Serializer):
+    ride = serializers.IntegerField(required=False, min_value=1)
+    driver = serializers.IntegerField(required=False, min_value=1)
+    status = serializers.CharField(required=False, max_length=50)
+    last_event_id = serializers.IntegerField(required=False, min_value=0)
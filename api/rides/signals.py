@@ -0,0 +1,147 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import cache, instrumentation, live
+from .authentication import CREDENTIAL_FIELDS, credential_cache
+from .models import Ride, RideEvent, RideEventType, RideTrip, User, UserDailyStats
+
+
+def _deleting_ride(origin):
+    # Deleting a ride cascades to its events and trip; there is nothing to
+    # recompute for each of those events.
+    return isinstance(origin, Ride) or getattr(origin, "model", None) is Ride
+
+
+def _affected_ride_ids(event):
+    # An update may have moved the event to another ride.
+    return {event.ride_id, getattr(event, "saved_ride_id", None)} - {None}
+
+
+@receiver(post_save, sender=RideEvent)
+def update_ride_trip(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if instance.description in (RideEvent.PICKUP, RideEvent.DROPOFF):
+            RideTrip.objects.record_event(instance)
+    else:
+        RideTrip.objects.rebuild(_affected_ride_ids(instance))
+
+
+@receiver(post_delete, sender=RideEvent)
+def remove_from_ride_trip(sender, instance, origin=None, **kwargs):
+    if not _deleting_ride(origin):
+        RideTrip.objects.rebuild([instance.ride_id])
+
+
+# Registered after the RideTrip handlers above, whose trips they count.
+@receiver(post_save, sender=RideEvent)
+def update_trip_user_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        UserDailyStats.objects.refresh_rides(_affected_ride_ids(instance))
+    elif instance.description in (RideEvent.PICKUP, RideEvent.DROPOFF):
+        UserDailyStats.objects.refresh(instance.ride.stats_keys())
+
+
+@receiver(post_delete, sender=RideEvent)
+def remove_trip_from_user_stats(sender, instance, origin=None, **kwargs):
+    if not _deleting_ride(origin) and instance.description in (
+        RideEvent.PICKUP,
+        RideEvent.DROPOFF,
+    ):
+        UserDailyStats.objects.refresh_rides([instance.ride_id])
+
+
+@receiver(post_save, sender=RideEvent)
+def update_ride_event_summary(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        Ride.objects.record_event(instance)
+    else:
+        Ride.objects.filter(pk__in=_affected_ride_ids(instance)).refresh_event_summary()
+
+
+@receiver(post_save, sender=RideEvent)
+def publish_ride_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        live.events_created([instance.pk])
+
+
+@receiver(post_delete, sender=RideEvent)
+def remove_from_ride_event_summary(sender, instance, origin=None, **kwargs):
+    if not _deleting_ride(origin):
+        Ride.objects.filter(pk=instance.ride_id).refresh_event_summary()
+
+
+@receiver(post_save, sender=Ride)
+def update_ride_trip_driver(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        RideTrip.objects.filter(ride=instance).exclude(
+            driver_id=instance.driver_id
+        ).update(driver_id=instance.driver_id)
+
+
+@receiver(post_save, sender=Ride)
+def update_user_stats(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        # Both the rows the ride counted towards and those it now does.
+        keys = getattr(instance, "saved_stats_keys", set()) | instance.stats_keys()
+        UserDailyStats.objects.refresh(keys)
+
+
+@receiver(post_delete, sender=Ride)
+def remove_from_user_stats(sender, instance, **kwargs):
+    UserDailyStats.objects.refresh(instance.stats_keys())
+
+
+@receiver([post_save, post_delete], sender=Ride)
+def invalidate_ride_cache(sender, instance, **kwargs):
+    cache.invalidate(cache.LIST_TAG, cache.ride_tag(instance.pk))
+
+
+@receiver(post_delete, sender=Ride)
+def mark_ride_deleted(sender, instance, **kwargs):
+    # Nothing left to carry an updated_at.
+    cache.mark_changed()
+
+
+@receiver([post_save, post_delete], sender=RideEvent)
+def invalidate_ride_event_cache(sender, instance, origin=None, **kwargs):
+    if not _deleting_ride(origin):
+        # Lists filter and sort on the event summary fields of rides.
+        cache.invalidate(
+            cache.LIST_TAG,
+            *(cache.ride_tag(pk) for pk in _affected_ride_ids(instance)),
+        )
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_cache(sender, instance, update_fields=None, **kwargs):
+    tags = [cache.user_tag(instance.pk)]
+    # A new email changes which rides the rider__email filter matches.
+    if update_fields is None or "email" in update_fields:
+        tags.append(cache.LIST_TAG)
+    cache.invalidate(*tags)
+    # Rides embed their rider and driver.
+    cache.mark_changed()
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_credentials(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or CREDENTIAL_FIELDS & set(update_fields):
+        credential_cache.forget_user(instance.pk)
+
+
+@receiver(post_migrate)
+def forget_event_types(sender, **kwargs):
+    # Flushing the database, as tests do, may reuse type codes.
+    RideEventType.objects.clear_cache()
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    instrumentation.install_query_recorder(connection)
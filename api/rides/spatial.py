@@ -0,0 +1,240 @@
+"""
+Grid-cell spatial index and nearest-ride search over Ride pickup coordinates.
+
+Pickup points are bucketed into a fixed latitude/longitude grid and the cell
+number is stored on ``Ride.pickup_cell``. Cells are numbered row-major, so every
+grid row is a contiguous integer range and a square of cells becomes a handful
+of indexed ``BETWEEN`` lookups.
+"""
+
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+try:
+    import numpy
+except ImportError:  # Optional, see requirements-heatmap.txt.
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CELL_SIZE_DEGREES = 0.1
+GRID_ROWS = round(180 / CELL_SIZE_DEGREES)
+GRID_COLS = round(360 / CELL_SIZE_DEGREES)
+
+# Past this many rings the cell lookups stop paying for themselves and the
+# search falls back to sorting in SQL.
+MAX_SEARCH_RING = 64
+
+
+def cell_row_col(latitude, longitude):
+    row = int((latitude + 90) // CELL_SIZE_DEGREES)
+    col = int(((longitude + 180) % 360) // CELL_SIZE_DEGREES)
+    return min(max(row, 0), GRID_ROWS - 1), min(max(col, 0), GRID_COLS - 1)
+
+
+def cell_for(latitude, longitude):
+    row, col = cell_row_col(latitude, longitude)
+    return row * GRID_COLS + col
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_many(lat1, lng1, lat2, lng2):
+    """
+    ``haversine_km`` of each position of four equally long sequences, as a
+    list. Computed with NumPy array operations when it's installed.
+    """
+    if numpy is None:
+        return list(map(haversine_km, lat1, lng1, lat2, lng2))
+    lat1, lng1, lat2, lng2 = (
+        numpy.asarray(values, dtype=numpy.float64)
+        for values in (lat1, lng1, lat2, lng2)
+    )
+    phi1, phi2 = numpy.radians(lat1), numpy.radians(lat2)
+    a = (
+        numpy.sin((phi2 - phi1) / 2) ** 2
+        + numpy.cos(phi1)
+        * numpy.cos(phi2)
+        * numpy.sin(numpy.radians(lng2 - lng1) / 2) ** 2
+    )
+    distances = 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(1.0, numpy.sqrt(a)))
+    return distances.tolist()
+
+
+def haversine_expression(
+    latitude, longitude, lat_field="pickup_latitude", lng_field="pickup_longitude"
+):
+    """
+    Great-circle distance in km from (latitude, longitude) to the given fields.
+    """
+    phi = math.radians(latitude)
+    a = Power(Sin((Radians(F(lat_field)) - phi) / 2), 2) + math.cos(phi) * Cos(
+        Radians(F(lat_field))
+    ) * Power(Sin((Radians(F(lng_field)) - math.radians(longitude)) / 2), 2)
+    return (
+        2
+        * EARTH_RADIUS_KM
+        * ASin(Least(Value(1.0), Sqrt(a), output_field=FloatField()))
+    )
+
+
+def square_filter(row, col, ring, field="pickup_cell"):
+    """
+    Q matching every cell within ``ring`` cells of (row, col).
+    """
+    first_row = max(row - ring, 0)
+    last_row = min(row + ring, GRID_ROWS - 1)
+    if 2 * ring + 1 >= GRID_COLS:
+        return Q(
+            **{
+                f"{field}__range": (
+                    first_row * GRID_COLS,
+                    (last_row + 1) * GRID_COLS - 1,
+                )
+            }
+        )
+
+    start, end = (col - ring) % GRID_COLS, (col + ring) % GRID_COLS
+    col_ranges = [(start, end)] if start <= end else [(start, GRID_COLS - 1), (0, end)]
+    q = Q()
+    for r in range(first_row, last_row + 1):
+        for first_col, last_col in col_ranges:
+            offset = r * GRID_COLS
+            q |= Q(**{f"{field}__range": (offset + first_col, offset + last_col)})
+    return q
+
+
+def covered_radius_km(latitude, longitude, ring):
+    """
+    Distance from (latitude, longitude) within which every point is guaranteed
+    to fall inside the square of ``ring`` cells around it.
+    """
+    row, col = cell_row_col(latitude, longitude)
+    bounds = []
+    if row - ring > 0:
+        south_edge = (row - ring) * CELL_SIZE_DEGREES - 90
+        bounds.append((latitude - south_edge) * KM_PER_DEGREE)
+    if row + ring + 1 < GRID_ROWS:
+        north_edge = (row + ring + 1) * CELL_SIZE_DEGREES - 90
+        bounds.append((north_edge - latitude) * KM_PER_DEGREE)
+    if 2 * ring + 1 < GRID_COLS:
+        # Lower bound on the distance to the meridians bounding the square.
+        offset = (longitude + 180) % 360
+        cos_lat = math.cos(math.radians(latitude))
+        for delta in (
+            offset - (col - ring) * CELL_SIZE_DEGREES,
+            (col + ring + 1) * CELL_SIZE_DEGREES - offset,
+        ):
+            sin_delta = math.sin(math.radians(min(delta, 180)))
+            bounds.append(EARTH_RADIUS_KM * math.asin(min(1.0, cos_lat * sin_delta)))
+    return max(min(bounds, default=math.inf), 0.0)
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """
+    Restrict ``queryset`` to rides picked up within ``radius_km`` of a point,
+    annotating each with its ``distance`` in km.
+    """
+    ring = 0
+    while covered_radius_km(latitude, longitude, ring) < radius_km:
+        ring += 1
+        if ring > MAX_SEARCH_RING:
+            break
+    else:
+        row, col = cell_row_col(latitude, longitude)
+        queryset = queryset.filter(square_filter(row, col, ring))
+    return queryset.annotate(distance=haversine_expression(latitude, longitude)).filter(
+        distance__lte=radius_km
+    )
+
+
+def order_by_distance(queryset, latitude, longitude, descending=False):
+    queryset = queryset.annotate(distance=haversine_expression(latitude, longitude))
+    if descending:
+        return queryset.order_by(F("distance").desc(nulls_last=True), "pk")
+    return queryset.order_by("distance", "pk")
+
+
+class NearestRides:
+    """
+    Ordered, lazily evaluated sequence of rides nearest to a point.
+
+    Quacks enough like a queryset for Django's ``Paginator``: ``count()`` is a
+    plain COUNT over the filtered queryset, while slicing runs an expanding-ring
+    search over ``pickup_cell`` that only reads the cells needed to rank the
+    first ``stop`` rides. ``queryset`` should already be ordered by distance
+    (see ``order_by_distance``); it is sliced as-is when the index can't help.
+    """
+
+    ordered = True
+
+    def __init__(self, queryset, latitude, longitude, radius_km=None):
+        self.queryset = queryset
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+
+    def count(self):
+        return self.queryset.order_by().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[slice(key, key + 1)][0]
+        start, stop = key.start or 0, key.stop
+        if stop is None:
+            stop = self.count()
+
+        ranked = self.rank(stop)
+        if ranked is None:
+            return list(self.queryset[start:stop])
+
+        page = ranked[start:stop]
+        rides = self.queryset.filter(pk__in=[pk for _, pk in page]).order_by()
+        rides = {ride.pk: ride for ride in rides}
+        results = []
+        for distance, pk in page:
+            ride = rides[pk]
+            ride.distance = distance
+            results.append(ride)
+        return results
+
+    def rank(self, limit):
+        """
+        Return the ``limit`` nearest ``(distance_km, pk)`` pairs, or None when
+        the nearest rides are too sparse for the cell index to help.
+        """
+        row, col = cell_row_col(self.latitude, self.longitude)
+        candidates = self.queryset.order_by().values_list(
+            "pk", "pickup_latitude", "pickup_longitude"
+        )
+        ring = 0
+        while ring <= MAX_SEARCH_RING:
+            covered = covered_radius_km(self.latitude, self.longitude, ring)
+            ranked = sorted(
+                (haversine_km(self.latitude, self.longitude, lat, lng), pk)
+                for pk, lat, lng in candidates.filter(square_filter(row, col, ring))
+            )
+            if self.radius_km is not None:
+                ranked = [item for item in ranked if item[0] <= self.radius_km]
+                if covered >= self.radius_km:
+                    return ranked[:limit]
+            if covered == math.inf:
+                return ranked[:limit]
+            exact = [item for item in ranked if item[0] <= covered]
+            if len(exact) >= limit:
+                return exact[:limit]
+            ring = max(1, ring * 2)
+        return None
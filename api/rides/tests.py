@@ -1,13 +1,60 @@
-from datetime import timedelta
+import asyncio
+import base64
+import csv
+import gc
+import gzip
+import itertools
+import json
+import os
+import re
+import runpy
+import tempfile
+import time
+import warnings
+from contextlib import suppress
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-from django.db import connection
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (
+    APIRequestFactory,
+    APITestCase,
+    APITransactionTestCase,
+    force_authenticate,
+)
 
-from .models import Ride, RideEvent, User
+from . import cache as response_cache
+from . import compression, heatmap, live, renderers, routers, spatial
+from .async_views import AsyncRideView
+from .authentication import CachedBasicAuthentication, credential_cache
+from .instrumentation import registry as metrics_registry
+from .management.commands import benchmark_db, loadtest
+from .models import (
+    ArchivedRideEvent,
+    Ride,
+    RideEvent,
+    RideEventType,
+    RideTrip,
+    User,
+    UserDailyStats,
+)
+from .serializers import FastRideSerializer, RideSerializer, compiled_representation
+from .views import RideEventViewSet, RideViewSet, UserViewSet
 
 
 class RideListAPITests(APITestCase):
@@ -161,3 +208,3577 @@ class RideListAPITests(APITestCase):
             self.assertLessEqual(
                 len(queries), 3, msg=f"Too many queries executed: {len(queries)}"
             )
+
+
+class RideDistanceSearchTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        now = timezone.now()
+        # A loose grid of pickups around Manila plus a few far away ones.
+        self.rides = []
+        for i in range(6):
+            for j in range(6):
+                self.rides.append(
+                    Ride.objects.create(
+                        status="pickup" if (i + j) % 2 else "dropoff",
+                        rider=self.rider,
+                        driver=self.admin_user,
+                        pickup_latitude=14.5 + i * 0.07,
+                        pickup_longitude=120.9 + j * 0.11,
+                        dropoff_latitude=14.6,
+                        dropoff_longitude=121.0,
+                        pickup_time=now - timedelta(minutes=i * 6 + j),
+                    )
+                )
+        for latitude, longitude in [(35.6, 139.7), (-33.9, 151.2), (51.5, -0.1)]:
+            self.rides.append(
+                Ride.objects.create(
+                    status="pickup",
+                    rider=self.rider,
+                    driver=self.admin_user,
+                    pickup_latitude=latitude,
+                    pickup_longitude=longitude,
+                    dropoff_latitude=latitude,
+                    dropoff_longitude=longitude,
+                    pickup_time=now,
+                )
+            )
+        self.origin = (14.6, 121.0)
+        self.list_url = reverse("ride-list")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def expected_order(self, rides):
+        return [
+            ride.id_ride
+            for ride in sorted(
+                rides,
+                key=lambda ride: (
+                    spatial.haversine_km(
+                        *self.origin, ride.pickup_latitude, ride.pickup_longitude
+                    ),
+                    ride.id_ride,
+                ),
+            )
+        ]
+
+    def get_ids(self, **params):
+        response = self.client.get(
+            self.list_url,
+            {
+                "ordering": "distance",
+                "latitude": self.origin[0],
+                "longitude": self.origin[1],
+                **params,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        return data["count"], [ride["id_ride"] for ride in data["results"]]
+
+    def test_pickup_cell_is_maintained(self):
+        ride = self.rides[0]
+        self.assertEqual(ride.pickup_cell, spatial.cell_for(14.5, 120.9))
+        ride.pickup_latitude = -20.0
+        ride.save(update_fields=["pickup_latitude"])
+        ride.refresh_from_db()
+        self.assertEqual(ride.pickup_cell, spatial.cell_for(-20.0, 120.9))
+
+    def test_nearest_pages_match_full_sort(self):
+        expected = self.expected_order(self.rides)
+        count, first_page = self.get_ids()
+        _, second_page = self.get_ids(page=2)
+        self.assertEqual(count, len(self.rides))
+        self.assertEqual(first_page + second_page, expected[:20])
+
+    def test_nearest_honours_filters(self):
+        expected = self.expected_order(
+            ride for ride in self.rides if ride.status == "pickup"
+        )
+        count, ids = self.get_ids(status="pickup")
+        self.assertEqual(count, len(expected))
+        self.assertEqual(ids, expected[:10])
+
+    def test_radius_km(self):
+        nearby = [
+            ride
+            for ride in self.rides
+            if spatial.haversine_km(
+                *self.origin, ride.pickup_latitude, ride.pickup_longitude
+            )
+            <= 25
+        ]
+        count, ids = self.get_ids(radius_km=25)
+        self.assertEqual(count, len(nearby))
+        self.assertEqual(ids, self.expected_order(nearby)[:10])
+
+        # The radius also applies without distance ordering.
+        response = self.client.get(
+            self.list_url,
+            {"latitude": self.origin[0], "longitude": self.origin[1], "radius_km": 25},
+        )
+        self.assertEqual(response.json()["count"], len(nearby))
+
+    def test_descending_distance(self):
+        _, ids = self.get_ids(ordering="-distance")
+        self.assertEqual(ids, self.expected_order(self.rides)[::-1][:10])
+
+    def test_invalid_origin(self):
+        for latitude, longitude in [
+            ("nan", "0"),
+            ("0", "nan"),
+            ("inf", "0"),
+            ("-inf", "0"),
+            ("90.5", "0"),
+            ("0", "-180.5"),
+            ("north", "0"),
+        ]:
+            for params in [
+                {"ordering": "distance"},
+                {"radius_km": 25},
+                {"ordering": "distance", "pagination": "cursor"},
+            ]:
+                with self.subTest(latitude=latitude, longitude=longitude, **params):
+                    query = {"latitude": latitude, "longitude": longitude, **params}
+                    response = self.client.get(self.list_url, query)
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                    response = self.client.get(reverse("async-ride-list"), query)
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_radius(self):
+        for radius_km in ["-1", "nan", "inf", "five"]:
+            for params in [{}, {"ordering": "distance"}, {"pagination": "cursor"}]:
+                with self.subTest(radius_km=radius_km, **params):
+                    query = {
+                        "latitude": 0,
+                        "longitude": 0,
+                        "radius_km": radius_km,
+                        **params,
+                    }
+                    for url in [self.list_url, reverse("async-ride-list")]:
+                        response = self.client.get(url, query)
+                        self.assertEqual(
+                            response.status_code, status.HTTP_400_BAD_REQUEST
+                        )
+                        self.assertIn("radius_km", response.json())
+
+
+class RidePaginationModeTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.riders = [
+            User.objects.create_user(
+                username=f"rider{i}@example.com", email=f"rider{i}@example.com"
+            )
+            for i in range(2)
+        ]
+        now = timezone.now()
+        # Pickup times repeat so the key has to fall back on id_ride for ties.
+        self.rides = [
+            Ride.objects.create(
+                status="pickup" if i % 3 else "dropoff",
+                rider=self.riders[i % 2],
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=10.0,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=now - timedelta(hours=i // 4),
+            )
+            for i in range(25)
+        ]
+        for ride in self.rides:
+            RideEvent.objects.create(
+                ride=ride, description="Status changed to pickup", created_at=now
+            )
+        self.list_url = reverse("ride-list")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def walk(self, url, params=None):
+        ids = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            self.assertNotIn("count", data)
+            ids.extend(ride["id_ride"] for ride in data["results"])
+            url, params = data["next"], None
+        return ids, data
+
+    def test_cursor_pagination_walks_every_ride_once(self):
+        expected = [
+            ride.id_ride
+            for ride in sorted(self.rides, key=lambda r: (r.pickup_time, r.id_ride))
+        ]
+        ids, _ = self.walk(self.list_url, {"pagination": "cursor"})
+        self.assertEqual(ids, expected)
+
+        ids, _ = self.walk(
+            self.list_url, {"pagination": "cursor", "ordering": "-pickup_time"}
+        )
+        self.assertEqual(ids, expected[::-1])
+
+    def test_cursor_pagination_honours_filters(self):
+        rider = self.riders[1]
+        expected = [
+            ride.id_ride
+            for ride in sorted(self.rides, key=lambda r: (r.pickup_time, r.id_ride))
+            if ride.status == "pickup" and ride.rider == rider
+        ]
+        ids, _ = self.walk(
+            self.list_url,
+            {"pagination": "cursor", "status": "pickup", "rider__email": rider.email},
+        )
+        self.assertEqual(ids, expected)
+
+    def test_cursor_previous_link(self):
+        first = self.client.get(self.list_url, {"pagination": "cursor"}).json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+        self.assertIsNotNone(back["next"])
+
+    def test_cursor_pagination_rejects_other_orderings(self):
+        for ordering in [
+            "distance",
+            "-distance",
+            "status",
+            "pickup_time,status",
+            "-pickup_time,id_ride",
+            "event_count",
+        ]:
+            params = {
+                "pagination": "cursor",
+                "ordering": ordering,
+                "latitude": 10.0,
+                "longitude": 10.0,
+            }
+            for url in [self.list_url, reverse("async-ride-list")]:
+                with self.subTest(url=url, ordering=ordering):
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                    self.assertIn("ordering", response.json())
+        response = self.client.get(
+            self.list_url, {"pagination": "cursor", "ordering": "-pickup_time,-id_ride"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            self.list_url, {"pagination": "cursor", "cursor": "cD1ub3BlfDE="}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_pagination_for_ride_events(self):
+        view = RideEventViewSet.as_view({"get": "list"})
+        request = APIRequestFactory().get("/", {"pagination": "cursor"})
+        force_authenticate(request, user=self.admin_user)
+        data = view(request).data
+        expected = list(
+            RideEvent.objects.order_by("created_at", "id_ride_event").values_list(
+                "id_ride_event", flat=True
+            )[:10]
+        )
+        self.assertEqual(
+            [event["id_ride_event"] for event in data["results"]], expected
+        )
+        self.assertIsNotNone(data["next"])
+
+    def test_page_number_without_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.list_url, {"count": "false", "ordering": "pickup_time", "page": 3}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertIsNone(data["count"])
+        self.assertEqual(len(data["results"]), 5)
+        self.assertIsNone(data["next"])
+        self.assertIn("page=2", data["previous"])
+        self.assertFalse(
+            any("COUNT(" in query["sql"].upper() for query in queries.captured_queries)
+        )
+
+        data = self.client.get(self.list_url, {"count": "false"}).json()
+        self.assertEqual(len(data["results"]), 10)
+        self.assertIn("page=2", data["next"])
+        self.assertIsNone(data["previous"])
+
+
+# The README's bonus queries, per database vendor.
+LONG_TRIPS_REPORT_SQL = {
+    "sqlite": """
+SELECT
+    strftime('%Y-%m', dropoff_event.created_at) AS "Month",
+    (driver.first_name || ' ' || driver.last_name) AS "Driver",
+    COUNT(*) AS "Count of Trips > 1 hr"
+FROM rides_ride AS ride
+JOIN rides_user AS driver
+  ON ride.id_driver = driver.id
+JOIN rides_rideeventtype AS pickup_type
+  ON pickup_type.description = 'Status changed to pickup'
+JOIN rides_rideeventtype AS dropoff_type
+  ON dropoff_type.description = 'Status changed to dropoff'
+JOIN rides_rideevent AS pickup_event
+  ON pickup_event.id_ride = ride.id_ride
+ AND pickup_event.id_event_type = pickup_type.id_event_type
+JOIN rides_rideevent AS dropoff_event
+  ON dropoff_event.id_ride = ride.id_ride
+ AND dropoff_event.id_event_type = dropoff_type.id_event_type
+WHERE (
+    julianday(dropoff_event.created_at) - julianday(pickup_event.created_at)
+) * 24 > 1
+GROUP BY 1, 2
+ORDER BY 1, 2
+""",
+    "postgresql": """
+SELECT
+    TO_CHAR(dropoff_event.created_at, 'YYYY-MM') AS "Month",
+    CONCAT(driver.first_name, ' ', driver.last_name) AS "Driver",
+    COUNT(*) AS "Count of Trips > 1 hr"
+FROM rides_ride AS ride
+JOIN rides_user AS driver
+  ON ride.id_driver = driver.id
+JOIN rides_rideeventtype AS pickup_type
+  ON pickup_type.description = 'Status changed to pickup'
+JOIN rides_rideeventtype AS dropoff_type
+  ON dropoff_type.description = 'Status changed to dropoff'
+JOIN rides_rideevent AS pickup_event
+  ON pickup_event.id_ride = ride.id_ride
+ AND pickup_event.id_event_type = pickup_type.id_event_type
+JOIN rides_rideevent AS dropoff_event
+  ON dropoff_event.id_ride = ride.id_ride
+ AND dropoff_event.id_event_type = dropoff_type.id_event_type
+WHERE dropoff_event.created_at - pickup_event.created_at > INTERVAL '1 hour'
+GROUP BY 1, 2
+ORDER BY 1, 2
+""",
+}
+
+
+@skipUnless(connection.vendor == "sqlite", "Uses SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(APITestCase):
+    """
+    Runs EXPLAIN QUERY PLAN over every query an endpoint issues and fails when
+    a hot query reads a table without an index or sorts through a temp B-tree.
+    """
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        now = timezone.now()
+        for i in range(40):
+            ride = Ride.objects.create(
+                status="pickup" if i % 2 else "dropoff",
+                rider=self.rider,
+                driver=self.admin_user,
+                pickup_latitude=14.6 + (i % 8) * 0.01,
+                pickup_longitude=121.0 + (i // 8) * 0.01,
+                dropoff_latitude=14.7,
+                dropoff_longitude=121.1,
+                pickup_time=now - timedelta(minutes=i),
+            )
+            RideEvent.objects.create(
+                ride=ride, description="Status changed to pickup", created_at=now
+            )
+            RideEvent.objects.create(
+                ride=ride,
+                description="Status changed to dropoff",
+                created_at=now + timedelta(hours=2),
+            )
+        self.list_url = reverse("ride-list")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertIndexedPlans(self, queries, allow_scan=(), allow_group_by=False):
+        self.assertTrue(queries)
+        for sql in queries:
+            for detail in self.explain(sql):
+                msg = f"{detail!r} in plan for:\n{sql}"
+                if allow_group_by and detail == "USE TEMP B-TREE FOR GROUP BY":
+                    continue
+                self.assertNotIn("TEMP B-TREE", detail, msg=msg)
+                scan = re.match(r"SCAN (\w+)$", detail)
+                if scan:
+                    self.assertIn(scan.group(1), allow_scan, msg=msg)
+
+    def capture(self, url, params=None, view=None):
+        with CaptureQueriesContext(connection) as queries:
+            if view is None:
+                response = self.client.get(url, params)
+            else:
+                request = APIRequestFactory().get("/", params)
+                force_authenticate(request, user=self.admin_user)
+                response = view.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT")
+        ]
+
+    def test_ride_list_filters_and_ordering(self):
+        for params in [
+            {"status": "pickup"},
+            {"rider__email": self.rider.email},
+            {"ordering": "pickup_time"},
+            {"ordering": "-pickup_time"},
+            {"status": "pickup", "ordering": "pickup_time"},
+            {"rider__email": self.rider.email, "ordering": "-pickup_time"},
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.capture(self.list_url, params))
+
+    def test_ride_list_event_summary_filters(self):
+        for params in [
+            {"idle_minutes": 30},
+            {"ordering": "-last_event_at"},
+            {"last_event_at_after": timezone.now().isoformat()},
+            {"idle_minutes": 30, "ordering": "last_event_at"},
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.capture(self.list_url, params))
+
+    def test_ride_list_trip_column_filters(self):
+        for params in [
+            {"ordering": "trip_distance_km"},
+            {"ordering": "-duration_seconds"},
+            {"trip_distance_km__gte": 100, "trip_distance_km__lte": 500},
+            {"duration_seconds__gte": 3600, "ordering": "duration_seconds"},
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.capture(self.list_url, params))
+
+    def test_ride_list_unfiltered_pages(self):
+        # An unfiltered, unordered page may walk the table, but only up to its
+        # LIMIT; it must never sort.
+        for params in [{}, {"count": "false", "page": 2}]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(
+                    self.capture(self.list_url, params), allow_scan=["rides_ride"]
+                )
+
+    def test_ride_list_cursor_pages(self):
+        for params in [
+            {"pagination": "cursor"},
+            {"pagination": "cursor", "status": "pickup"},
+            {"pagination": "cursor", "rider__email": self.rider.email},
+        ]:
+            with self.subTest(**params):
+                first = self.client.get(self.list_url, params).json()
+                self.assertIndexedPlans(self.capture(first["next"]))
+
+    def test_ride_list_distance(self):
+        for params in [
+            {"ordering": "distance", "latitude": 14.6, "longitude": 121.0},
+            {"latitude": 14.6, "longitude": 121.0, "radius_km": 3},
+            {
+                "ordering": "distance",
+                "latitude": 14.6,
+                "longitude": 121.0,
+                "radius_km": 3,
+            },
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.capture(self.list_url, params))
+
+    def test_ride_export(self):
+        url = reverse("ride-export")
+        for params in [
+            {},
+            {"status": "pickup"},
+            {"rider__email": self.rider.email, "format": "csv"},
+            {"pickup_time_after": (timezone.now() - timedelta(minutes=5)).isoformat()},
+        ]:
+            with self.subTest(**params):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+                    b"".join(response.streaming_content)
+                self.assertIndexedPlans(
+                    [query["sql"] for query in queries.captured_queries],
+                    allow_scan=["rides_ride"] if not params else [],
+                )
+
+    def test_ride_event_archive(self):
+        RideEvent.objects.update(created_at=timezone.now() - timedelta(days=60))
+        with CaptureQueriesContext(connection) as queries:
+            call_command("archive_ride_events", "--batch-size", 50, stdout=StringIO())
+        self.assertEqual(ArchivedRideEvent.objects.count(), 80)
+        self.assertIndexedPlans(
+            [
+                query["sql"]
+                for query in queries.captured_queries
+                if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+            ]
+        )
+
+    def test_async_ride_list(self):
+        for params in [
+            {},
+            {"status": "pickup", "ordering": "pickup_time"},
+            {"pagination": "cursor", "rider__email": self.rider.email},
+        ]:
+            with self.subTest(**params):
+                with CaptureQueriesContext(connection) as queries:
+                    request = APIRequestFactory().get("/api/async/rides/", params)
+                    force_authenticate(request, user=self.admin_user)
+                    response = async_to_sync(AsyncRideView.as_view())(request)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIndexedPlans(
+                    [query["sql"] for query in queries.captured_queries],
+                    allow_scan=["rides_ride"] if not params else [],
+                )
+
+    def test_ride_retrieve(self):
+        ride = Ride.objects.first()
+        url = reverse("ride-detail", args=[ride.id_ride])
+        self.assertIndexedPlans(self.capture(url))
+
+    def test_ride_event_list(self):
+        ride = Ride.objects.first()
+        for params in [
+            {"ride__id_ride": ride.id_ride},
+            {"description": "Status changed to pickup"},
+            {"ordering": "created_at"},
+            {"pagination": "cursor", "ordering": "-created_at"},
+        ]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(
+                    self.capture(None, params, view=RideEventViewSet)
+                )
+
+    def test_user_list(self):
+        for params in [{"email": self.rider.email}, {"role": "rider"}]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(self.capture(None, params, view=UserViewSet))
+
+    def test_long_trips_report(self):
+        self.assertIndexedPlans([LONG_TRIPS_REPORT_SQL["sqlite"]], allow_group_by=True)
+        for params in [{}, {"start": "2025-01", "end": "2025-06"}]:
+            with self.subTest(**params):
+                self.assertIndexedPlans(
+                    self.capture(reverse("long-trips-report"), params)
+                )
+
+
+class LongTripReportTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        self.drivers = [
+            User.objects.create_user(
+                username=f"driver{i}",
+                first_name="Driver",
+                last_name=str(i),
+                role="driver",
+            )
+            for i in range(2)
+        ]
+        # (driver, pickup, trip length in minutes)
+        march, april = datetime(2025, 3, 10, tzinfo=dt_timezone.utc), datetime(
+            2025, 4, 10, tzinfo=dt_timezone.utc
+        )
+        for driver, pickup_at, minutes in [
+            (0, march, 90),
+            (0, march, 61),
+            (0, march, 30),
+            (1, march, 120),
+            (0, april, 75),
+            (1, april, 60),
+        ]:
+            self.create_trip(self.drivers[driver], pickup_at, minutes)
+        self.url = reverse("long-trips-report")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def create_trip(self, driver, pickup_at, minutes):
+        ride = Ride.objects.create(
+            status="dropoff",
+            rider=self.rider,
+            driver=driver,
+            pickup_latitude=10.0,
+            pickup_longitude=10.0,
+            dropoff_latitude=20.0,
+            dropoff_longitude=20.0,
+            pickup_time=pickup_at,
+        )
+        RideEvent.objects.create(
+            ride=ride, description=RideEvent.PICKUP, created_at=pickup_at
+        )
+        RideEvent.objects.create(
+            ride=ride,
+            description=RideEvent.DROPOFF,
+            created_at=pickup_at + timedelta(minutes=minutes),
+        )
+        return ride
+
+    def test_trip_is_maintained_from_events(self):
+        pickup_at = datetime(2025, 1, 31, 23, 30, tzinfo=dt_timezone.utc)
+        ride = self.create_trip(self.drivers[0], pickup_at, 45)
+        trip = ride.trip
+        self.assertEqual(trip.pickup_at, pickup_at)
+        self.assertEqual(trip.duration, timedelta(minutes=45))
+        self.assertEqual(trip.dropoff_month, date(2025, 2, 1))
+        self.assertEqual(trip.driver, self.drivers[0])
+
+        dropoff = ride.ride_events.with_description(RideEvent.DROPOFF).get()
+        dropoff.created_at = pickup_at + timedelta(hours=3)
+        dropoff.save()
+        trip.refresh_from_db()
+        self.assertEqual(trip.duration, timedelta(hours=3))
+
+        dropoff.delete()
+        trip.refresh_from_db()
+        self.assertIsNone(trip.dropoff_at)
+        self.assertIsNone(trip.duration)
+
+        ride.driver = self.drivers[1]
+        ride.save()
+        trip.refresh_from_db()
+        self.assertEqual(trip.driver, self.drivers[1])
+
+        ride.delete()
+        self.assertFalse(RideTrip.objects.filter(pk=trip.pk).exists())
+
+    def test_report_matches_readme_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "month": "2025-03",
+                    "driver_id": self.drivers[0].pk,
+                    "driver": "Driver 0",
+                    "count": 2,
+                },
+                {
+                    "month": "2025-03",
+                    "driver_id": self.drivers[1].pk,
+                    "driver": "Driver 1",
+                    "count": 1,
+                },
+                {
+                    "month": "2025-04",
+                    "driver_id": self.drivers[0].pk,
+                    "driver": "Driver 0",
+                    "count": 1,
+                },
+            ],
+        )
+        if connection.vendor in LONG_TRIPS_REPORT_SQL:
+            with connection.cursor() as cursor:
+                cursor.execute(LONG_TRIPS_REPORT_SQL[connection.vendor])
+                expected = cursor.fetchall()
+            self.assertEqual(
+                [
+                    (row["month"], row["driver"], row["count"])
+                    for row in response.json()
+                ],
+                expected,
+            )
+
+    def test_threshold_and_month_range(self):
+        response = self.client.get(
+            self.url, {"min_duration_minutes": 100, "start": "2025-03"}
+        )
+        self.assertEqual(
+            [(row["month"], row["driver"]) for row in response.json()],
+            [("2025-03", "Driver 1")],
+        )
+        response = self.client.get(
+            self.url, {"min_duration_minutes": 0, "start": "2025-04", "end": "2025-04"}
+        )
+        self.assertEqual(sum(row["count"] for row in response.json()), 2)
+
+        response = self.client.get(self.url, {"start": "2025-05", "end": "2025-04"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        expected = list(RideTrip.objects.order_by("pk").values())
+        RideTrip.objects.all().delete()
+        call_command("rebuild_ride_trips", stdout=StringIO())
+        self.assertEqual(list(RideTrip.objects.order_by("pk").values()), expected)
+
+    def test_permission_required(self):
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PopulateRidesCommandTests(TestCase):
+    def populate(self, **options):
+        call_command(
+            "populate_rides",
+            rides=23,
+            riders=3,
+            drivers=2,
+            batch_size=10,
+            seed=7,
+            stdout=StringIO(),
+            **options,
+        )
+
+    def snapshot(self):
+        return (
+            list(Ride.objects.order_by("pk").values()),
+            list(RideEvent.objects.order_by("pk").values()),
+        )
+
+    def test_populates_in_batches(self):
+        self.populate(events_per_ride=3)
+        self.assertEqual(Ride.objects.count(), 23)
+        self.assertEqual(RideEvent.objects.count(), 69)
+        self.assertEqual(RideTrip.objects.count(), 23)
+        self.assertEqual(User.objects.filter(role="rider").count(), 3)
+        self.assertEqual(User.objects.filter(role="driver").count(), 2)
+        ride = Ride.objects.first()
+        self.assertEqual(
+            ride.pickup_cell,
+            spatial.cell_for(ride.pickup_latitude, ride.pickup_longitude),
+        )
+
+        self.assertAlmostEqual(
+            ride.trip_distance_km,
+            spatial.haversine_km(
+                ride.pickup_latitude,
+                ride.pickup_longitude,
+                ride.dropoff_latitude,
+                ride.dropoff_longitude,
+            ),
+        )
+
+        # The bulk-built trips and ride durations match what the event signals
+        # would have produced.
+        trips = list(RideTrip.objects.order_by("pk").values())
+        durations = Ride.objects.order_by("pk").values_list(
+            "duration_seconds", flat=True
+        )
+        expected_durations = list(durations)
+        RideTrip.objects.rebuild()
+        self.assertEqual(list(RideTrip.objects.order_by("pk").values()), trips)
+        self.assertEqual(list(durations), expected_durations)
+        self.assertNotIn(None, expected_durations)
+        # Every ride counts once for its rider and once for its driver.
+        rides = UserDailyStats.objects.values_list("rides", flat=True)
+        self.assertEqual(sum(rides), 46)
+
+    def test_seed_is_deterministic_and_clears_existing_rides(self):
+        self.populate()
+        first = self.snapshot()
+        self.populate()
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(len(first[0]), 23)
+
+
+class RideResponseCacheTests(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        response_cache.reset_stats()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com",
+            first_name="Rider",
+            email="rider@example.com",
+            role="rider",
+        )
+        self.now = timezone.now()
+        self.rides = [
+            Ride.objects.create(
+                status="pickup",
+                rider=self.rider if i else self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=10.0,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=self.now - timedelta(hours=i),
+            )
+            for i in range(3)
+        ]
+        self.list_url = reverse("ride-list")
+        self.detail_url = reverse("ride-detail", args=[self.rides[1].id_ride])
+        self.client.force_authenticate(user=self.admin_user)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def assertCached(self, url, params=None):
+        response, queries = self.get(url, params)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(queries, 0)
+        return response
+
+    def assertNotCached(self, url, params=None):
+        response, _ = self.get(url, params)
+        self.assertEqual(response["X-Cache"], "MISS")
+        return response
+
+    def test_repeated_reads_are_served_from_cache(self):
+        for url, params in [
+            (self.list_url, {"status": "pickup", "ordering": "pickup_time"}),
+            (self.detail_url, None),
+        ]:
+            first = self.assertNotCached(url, params)
+            self.assertEqual(self.assertCached(url, params).json(), first.json())
+        # Parameter order doesn't matter, their values do.
+        self.assertCached(
+            self.list_url, {"ordering": "pickup_time", "status": "pickup"}
+        )
+        self.assertNotCached(self.list_url, {"status": "dropoff"})
+        self.assertEqual(response_cache.stats(), {"hits": 3, "misses": 3})
+
+    def test_ride_event_invalidates_only_its_ride(self):
+        other_url = reverse("ride-detail", args=[self.rides[2].id_ride])
+        for url in (self.list_url, self.detail_url, other_url):
+            self.assertNotCached(url)
+        RideEvent.objects.create(
+            ride=self.rides[1],
+            description="Status changed to pickup",
+            created_at=self.now,
+        )
+        self.assertCached(other_url)
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(len(response.json()["todays_ride_events"]), 1)
+        self.assertNotCached(self.list_url)
+
+    def test_ride_changes_invalidate_lists(self):
+        self.assertNotCached(self.list_url, {"status": "pickup"})
+        Ride.objects.create(
+            status="pickup",
+            rider=self.rider,
+            driver=self.admin_user,
+            pickup_latitude=1.0,
+            pickup_longitude=1.0,
+            dropoff_latitude=1.0,
+            dropoff_longitude=1.0,
+            pickup_time=self.now,
+        )
+        response = self.assertNotCached(self.list_url, {"status": "pickup"})
+        self.assertEqual(response.json()["count"], 4)
+
+    def test_user_changes_invalidate_rides_they_appear_in(self):
+        other_url = reverse("ride-detail", args=[self.rides[0].id_ride])
+        self.assertNotCached(self.detail_url)
+        self.assertNotCached(other_url)
+        self.rider.first_name = "Renamed"
+        self.rider.save(update_fields=["first_name"])
+        response = self.assertNotCached(self.detail_url)
+        self.assertEqual(response.json()["rider"]["first_name"], "Renamed")
+        self.assertCached(other_url)
+
+    def test_entries_expire_with_the_24_hour_window(self):
+        RideEvent.objects.create(
+            ride=self.rides[1],
+            description="Status changed to pickup",
+            created_at=self.now - timedelta(days=1) + timedelta(seconds=20),
+        )
+        backend = response_cache.get_cache()
+        with mock.patch.object(backend, "set", wraps=backend.set) as cache_set:
+            self.assertNotCached(self.detail_url)
+        (_, _, timeout), _ = cache_set.call_args
+        self.assertLessEqual(timeout, 20)
+
+    @override_settings(RIDES_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        response, _ = self.get(self.list_url)
+        self.assertNotIn("X-Cache", response)
+        response, queries = self.get(self.list_url)
+        self.assertGreater(queries, 0)
+
+
+class FastRideSerializerParityTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.driver = User.objects.create_user(
+            username="driver@example.com",
+            first_name="Dríver",
+            last_name="",
+            email="driver@example.com",
+            role="driver",
+        )
+        now = timezone.now().replace(microsecond=123456)
+        self.rides = []
+        for i in range(4):
+            ride = Ride.objects.create(
+                status=["pickup", "en-route", "dropoff", ""][i],
+                rider=self.admin_user,
+                driver=self.driver,
+                pickup_latitude=-33.8688 + i / 7,
+                pickup_longitude=151.2093,
+                dropoff_latitude=0.0,
+                dropoff_longitude=-0.1,
+                pickup_time=now - timedelta(hours=i),
+            )
+            # No events on the last ride; one event is too old to be listed.
+            for hours in range(3 - i):
+                RideEvent.objects.create(
+                    ride=ride,
+                    description=RideEvent.PICKUP,
+                    created_at=now - timedelta(hours=hours * 13),
+                )
+            self.rides.append(ride)
+        self.client.force_authenticate(user=self.admin_user)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_output_matches_ride_serializer(self):
+        rides = list(Ride.objects.select_related("rider", "driver").order_by("pk"))
+        self.assertEqual(
+            self.render(FastRideSerializer(rides, many=True).data),
+            self.render(RideSerializer(rides, many=True).data),
+        )
+        for ride in rides:
+            self.assertEqual(
+                self.render(FastRideSerializer(ride).data),
+                self.render(RideSerializer(ride).data),
+            )
+
+    def test_compiled_representations_are_bounded(self):
+        ride = Ride.objects.select_related("rider", "driver").first()
+        compiled_representation.cache_clear()
+        for names in [{"status"}, {"status", "unknown"}, ["status", "status"]]:
+            FastRideSerializer(ride, fields=names).data
+        self.assertEqual(compiled_representation.cache_info().currsize, 1)
+
+        maxsize = compiled_representation.cache_info().maxsize
+        names = list(itertools.combinations(RideSerializer.Meta.fields, 3))
+        self.assertGreater(len(names), maxsize)
+        for fields in names:
+            data = FastRideSerializer(ride, fields=fields).data
+            self.assertEqual(data, RideSerializer(ride, fields=fields).data)
+        self.assertLessEqual(compiled_representation.cache_info().currsize, maxsize)
+
+    @override_settings(RIDES_CACHE_TIMEOUT=0)
+    def test_api_responses_match_and_use_no_extra_queries(self):
+        for url, params in [
+            (reverse("ride-list"), {"ordering": "pickup_time"}),
+            (reverse("ride-list"), {"pagination": "cursor"}),
+            (reverse("ride-list"), {"latitude": -33.8, "longitude": 151.2}),
+            (reverse("ride-detail", args=[self.rides[0].pk]), None),
+        ]:
+            with CaptureQueriesContext(connection) as default_queries:
+                default = self.client.get(url, params)
+            with override_settings(RIDES_FAST_SERIALIZATION=True):
+                with CaptureQueriesContext(connection) as fast_queries:
+                    fast = self.client.get(url, params)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, default.content)
+            self.assertEqual(len(fast_queries), len(default_queries))
+
+    @override_settings(RIDES_FAST_SERIALIZATION=True)
+    def test_writes_still_use_ride_serializer(self):
+        response = self.client.patch(
+            reverse("ride-detail", args=[self.rides[0].pk]),
+            {"status": "dropoff"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"], "dropoff")
+
+
+class RideExportTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        self.now = timezone.now()
+        self.rides = []
+        for i in range(5):
+            ride = Ride.objects.create(
+                status="pickup" if i % 2 else "dropoff",
+                rider=self.rider if i < 3 else self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=20.0,
+                dropoff_latitude=11.0,
+                dropoff_longitude=21.0,
+                pickup_time=self.now - timedelta(days=i),
+            )
+            # Ride 0 has no events; the rest have i events, however old.
+            for j in range(i):
+                RideEvent.objects.create(
+                    ride=ride,
+                    description=f"Event {j}",
+                    created_at=self.now - timedelta(days=i, minutes=-j),
+                )
+            self.rides.append(ride)
+        self.url = reverse("ride-export")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def export(self, params=None, **extra):
+        response = self.client.get(self.url, params, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_rides_with_all_events_in_pickup_order(self):
+        response, content = self.export()
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["id_ride"] for row in rows],
+            [ride.id_ride for ride in reversed(self.rides)],
+        )
+        first = rows[0]
+        self.assertEqual(first["rider"], self.admin_user.pk)
+        self.assertEqual(first["driver"], self.admin_user.pk)
+        self.assertEqual(
+            [event["description"] for event in first["events"]],
+            ["Event 0", "Event 1", "Event 2", "Event 3"],
+        )
+        self.assertEqual(rows[-1]["events"], [])
+
+    def test_csv_has_one_row_per_event(self):
+        for params, extra in [
+            ({"format": "csv"}, {}),
+            (None, {"HTTP_ACCEPT": "text/csv"}),
+        ]:
+            response, content = self.export(params, **extra)
+            self.assertTrue(response["Content-Type"].startswith("text/csv"))
+            self.assertIn("attachment", response["Content-Disposition"])
+            rows = list(csv.DictReader(StringIO(content)))
+            # 1 + 2 + 3 + 4 events, plus one row for the ride without any.
+            self.assertEqual(len(rows), 11)
+            empty = [row for row in rows if row["event_id"] == ""]
+            self.assertEqual(
+                [row["id_ride"] for row in empty], [str(self.rides[0].id_ride)]
+            )
+
+    def test_filters(self):
+        for params, expected in [
+            ({"status": "pickup"}, [3, 1]),
+            ({"rider__email": self.rider.email}, [2, 1, 0]),
+            (
+                {
+                    "pickup_time_after": (self.now - timedelta(days=2)).isoformat(),
+                    "pickup_time_before": (self.now - timedelta(days=1)).isoformat(),
+                },
+                [2, 1],
+            ),
+        ]:
+            with self.subTest(**params):
+                _, content = self.export(params)
+                self.assertEqual(
+                    [json.loads(line)["id_ride"] for line in content.splitlines()],
+                    [self.rides[i].id_ride for i in expected],
+                )
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(self.url, {"pickup_time_after": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("pickup_time", json.loads(response.content))
+
+    def test_queries_are_per_chunk(self):
+        with mock.patch.object(RideViewSet, "export_chunk_size", 2):
+            response = self.client.get(self.url)
+            with CaptureQueriesContext(connection) as queries:
+                chunks = list(response.streaming_content)
+        # One ride query, fetched in chunks, and one hot and one archived
+        # events query per chunk.
+        self.assertEqual(len(queries), 1 + 3 * 2)
+        self.assertEqual(len(chunks), 3)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RideEventBulkIngestTests(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.now = timezone.now()
+        self.rides = [
+            Ride.objects.create(
+                status="en-route",
+                rider=self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=20.0,
+                dropoff_latitude=11.0,
+                dropoff_longitude=21.0,
+                pickup_time=self.now,
+            )
+            for _ in range(3)
+        ]
+        self.url = reverse("rideevent-bulk")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def event(self, ride, description, minutes=0):
+        return {
+            "ride": ride.id_ride,
+            "description": description,
+            "created_at": (self.now + timedelta(minutes=minutes)).isoformat(),
+        }
+
+    def test_single_event_endpoint_is_routed(self):
+        response = self.client.post(
+            reverse("rideevent-list"),
+            self.event(self.rides[0], RideEvent.PICKUP),
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["ride"], self.rides[0].id_ride)
+
+    def test_bulk_creates_events_updates_status_and_trips(self):
+        ride, other, _ = self.rides
+        events = [
+            self.event(ride, RideEvent.PICKUP),
+            self.event(ride, RideEvent.DROPOFF, minutes=90),
+            self.event(other, "Driver is 5 minutes away", minutes=1),
+            self.event(other, RideEvent.PICKUP, minutes=2),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, events, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (4, 0))
+        self.assertEqual([result["index"] for result in body["results"]], [0, 1, 2, 3])
+        created_ids = [result["id_ride_event"] for result in body["results"]]
+        self.assertEqual(
+            list(
+                RideEvent.objects.filter(pk__in=created_ids)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            ),
+            sorted(created_ids),
+        )
+        # Independent of the number of events or rides in the batch; user
+        # stats take three per role and pickup day of its rides, and the event
+        # types new to the database three more.
+        self.assertLessEqual(len(queries), 27)
+
+        ride.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((ride.status, other.status), ("dropoff", "pickup"))
+        self.assertEqual(self.rides[2].status, "en-route")
+        self.assertEqual(ride.trip.duration, timedelta(minutes=90))
+        self.assertIsNone(other.trip.dropoff_at)
+
+    def test_older_events_do_not_roll_back_status(self):
+        ride = self.rides[0]
+        self.client.post(
+            self.url, [self.event(ride, RideEvent.DROPOFF, minutes=60)], format="json"
+        )
+        response = self.client.post(
+            self.url, [self.event(ride, RideEvent.PICKUP)], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, "dropoff")
+        self.assertEqual(ride.trip.duration, timedelta(minutes=60))
+
+    def test_partial_failures_are_reported_per_item(self):
+        events = [
+            self.event(self.rides[0], RideEvent.PICKUP),
+            {"ride": 999999, "description": "x", "created_at": self.now.isoformat()},
+            {"ride": self.rides[1].id_ride, "created_at": "not a date"},
+            "not an object",
+        ]
+        response = self.client.post(self.url, events, format="json")
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "error", "error", "error"],
+        )
+        self.assertIn("ride", results[1]["errors"])
+        self.assertEqual(set(results[2]["errors"]), {"description", "created_at"})
+        self.assertEqual(RideEvent.objects.count(), 1)
+
+        response = self.client.post(self.url, events[1:], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ndjson_body(self):
+        body = "\n".join(
+            json.dumps(self.event(ride, RideEvent.PICKUP)) for ride in self.rides
+        )
+        response = self.client.post(
+            self.url, body + "\n\n", content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["created"], 3)
+
+        response = self.client.post(
+            self.url, '{"ride": 1}\n{oops', content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("line 2", response.json()["detail"])
+
+    def test_rejects_non_lists_and_oversized_batches(self):
+        response = self.client.post(
+            self.url, self.event(self.rides[0], RideEvent.PICKUP), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with mock.patch.object(RideEventViewSet, "bulk_max_events", 1):
+            response = self.client.post(
+                self.url,
+                [self.event(ride, RideEvent.PICKUP) for ride in self.rides],
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(RideEvent.objects.count(), 0)
+
+    def test_invalidates_cached_rides(self):
+        detail_url = reverse("ride-detail", args=[self.rides[0].id_ride])
+        self.client.get(detail_url)
+        self.assertEqual(self.client.get(detail_url)["X-Cache"], "HIT")
+        self.client.post(
+            self.url, [self.event(self.rides[0], RideEvent.PICKUP)], format="json"
+        )
+        response = self.client.get(detail_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["status"], "pickup")
+        self.assertEqual(len(response.json()["todays_ride_events"]), 1)
+
+
+class CachedBasicAuthenticationTests(APITestCase):
+    def setUp(self):
+        credential_cache.clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.url = reverse("ride-list")
+        self.login("admin@example.com", "adminpass")
+
+    def login(self, username, password):
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {token}")
+
+    def get_status(self):
+        return self.client.get(self.url).status_code
+
+    def hashes(self):
+        return mock.patch(
+            "django.contrib.auth.base_user.check_password", wraps=check_password
+        )
+
+    def test_password_is_only_hashed_once(self):
+        with self.hashes() as hashed:
+            for _ in range(3):
+                self.assertEqual(self.get_status(), status.HTTP_200_OK)
+        self.assertEqual(hashed.call_count, 1)
+
+    def test_wrong_password_is_not_cached(self):
+        self.login("admin@example.com", "wrong")
+        with self.hashes() as hashed:
+            for _ in range(2):
+                self.assertEqual(self.get_status(), status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(hashed.call_count, 2)
+
+    def test_credential_changes_take_effect_immediately(self):
+        self.assertEqual(self.get_status(), status.HTTP_200_OK)
+        self.admin_user.set_password("newpass")
+        self.admin_user.save()
+        self.assertEqual(self.get_status(), status.HTTP_401_UNAUTHORIZED)
+        self.login("admin@example.com", "newpass")
+        self.assertEqual(self.get_status(), status.HTTP_200_OK)
+
+        self.admin_user.role = "rider"
+        self.admin_user.save(update_fields=["role"])
+        self.assertEqual(self.get_status(), status.HTTP_403_FORBIDDEN)
+
+        self.admin_user.role = "admin"
+        self.admin_user.is_active = False
+        self.admin_user.save()
+        self.assertEqual(self.get_status(), status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_request_gets_its_own_user(self):
+        authentication = CachedBasicAuthentication()
+        first, _ = authentication.authenticate_credentials(
+            "admin@example.com", "adminpass"
+        )
+        first.first_name = "Changed"
+        first.cached_permissions = {"everything"}
+        with self.hashes() as hashed:
+            for _ in range(2):
+                user, _ = authentication.authenticate_credentials(
+                    "admin@example.com", "adminpass"
+                )
+                self.assertIsNot(user, first)
+                self.assertEqual(user, self.admin_user)
+                self.assertEqual(user.first_name, "")
+                self.assertEqual(user.role, "admin")
+                self.assertFalse(hasattr(user, "cached_permissions"))
+                self.assertFalse(user._state.adding)
+                user.first_name = "Changed"
+        self.assertEqual(hashed.call_count, 0)
+
+    def test_unrelated_updates_keep_the_entry(self):
+        self.get_status()
+        self.admin_user.save(update_fields=["last_login"])
+        self.assertEqual(len(credential_cache), 1)
+
+    def test_entries_expire_and_are_bounded(self):
+        with self.hashes() as hashed:
+            self.get_status()
+            later = time.monotonic() + 61
+            with mock.patch("rides.authentication.time.monotonic", return_value=later):
+                self.get_status()
+        self.assertEqual(hashed.call_count, 2)
+
+        User.objects.create_user(
+            username="other@example.com", password="otherpass", role="admin"
+        )
+        with override_settings(RIDES_AUTH_CACHE_SIZE=1):
+            self.login("other@example.com", "otherpass")
+            self.get_status()
+        self.assertEqual(len(credential_cache), 1)
+
+    @override_settings(RIDES_AUTH_CACHE_TIMEOUT=0)
+    def test_can_be_disabled(self):
+        with self.hashes() as hashed:
+            self.get_status()
+            self.get_status()
+        self.assertEqual(hashed.call_count, 2)
+        self.assertEqual(len(credential_cache), 0)
+
+
+@override_settings(RIDES_CACHE_TIMEOUT=0)
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        credential_cache.clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com",
+            email="rider@example.com",
+            password="riderpass",
+            role="rider",
+        )
+        now = timezone.now()
+        for i in range(25):
+            ride = Ride.objects.create(
+                status="pickup" if i % 3 else "dropoff",
+                rider=self.rider if i % 2 else self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=14.5 + i / 100,
+                pickup_longitude=121.0,
+                dropoff_latitude=14.7,
+                dropoff_longitude=121.1,
+                pickup_time=now - timedelta(hours=i),
+            )
+            for hours in (1, 30)[: i % 3]:
+                RideEvent.objects.create(
+                    ride=ride,
+                    description=RideEvent.PICKUP,
+                    created_at=now - timedelta(hours=hours),
+                )
+        self.auth = self.basic_auth("admin@example.com", "adminpass")
+
+    def basic_auth(self, username, password):
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        return {"Authorization": f"Basic {token}"}
+
+    async def assertSameResponse(self, path, params=None):
+        sync_response = await sync_to_async(self.client.get)(
+            f"/api/{path}", params, headers=self.auth
+        )
+        async_response = await self.async_client.get(
+            f"/api/async/{path}", params, headers=self.auth
+        )
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(
+            async_response.content.decode().replace("/api/async/", "/api/"),
+            sync_response.content.decode(),
+        )
+        return async_response
+
+    async def test_ride_list_matches_sync_viewset(self):
+        for params in [
+            {},
+            {"page": 2},
+            {"page": "last"},
+            {"page": 9},
+            {"count": "false", "page": 2},
+            {"pagination": "cursor"},
+            {"pagination": "cursor", "ordering": "-pickup_time", "status": "pickup"},
+            {"rider__email": "rider@example.com", "ordering": "pickup_time"},
+            {"ordering": "distance", "latitude": 14.6, "longitude": 121.0},
+            {"latitude": 14.6, "longitude": 121.0, "radius_km": 5},
+            {"fields": "id_ride,rider", "expand": "driver"},
+            {"fields": "status", "pagination": "cursor"},
+            {"expand": "todays_ride_events", "page": 2},
+        ]:
+            with self.subTest(**params):
+                await self.assertSameResponse("rides/", params)
+
+        response = await self.assertSameResponse("rides/", {"pagination": "cursor"})
+        next_url = response.json()["next"].replace("/api/async/", "/api/")
+        path, query = next_url.split("/api/", 1)[1].split("?")
+        await self.assertSameResponse(f"{path}?{query}")
+
+    async def test_ride_detail_matches_sync_viewset(self):
+        ride = await Ride.objects.order_by("pk").alast()
+        for path in [f"rides/{ride.pk}/", "rides/999999/", "rides/abc/"]:
+            with (
+                self.subTest(path=path),
+                warnings.catch_warnings(record=True) as caught,
+            ):
+                # A lookup coroutine left unawaited is only ever a warning.
+                warnings.simplefilter("always", RuntimeWarning)
+                await self.assertSameResponse(path)
+                gc.collect()
+            self.assertEqual([str(warning.message) for warning in caught], [])
+        await self.assertSameResponse(f"rides/{ride.pk}/", {"status": "other"})
+        await self.assertSameResponse(f"rides/{ride.pk}/", {"fields": "status"})
+
+    async def test_ride_event_and_user_lists_match_sync_viewsets(self):
+        event = await RideEvent.objects.afirst()
+        for path, params in [
+            ("ride-events/", {}),
+            ("ride-events/", {"ordering": "-created_at", "page": 2}),
+            ("ride-events/", {"pagination": "cursor", "ride__id_ride": event.ride_id}),
+            (f"ride-events/{event.pk}/", {}),
+        ]:
+            with self.subTest(path=path, **params):
+                await self.assertSameResponse(path, params)
+
+        # UserViewSet itself isn't routed.
+        for kwargs, params in [({}, {"role": "rider"}), ({"pk": self.rider.pk}, {})]:
+            request = APIRequestFactory().get("/api/users/", params)
+            force_authenticate(request, user=self.admin_user)
+            view = UserViewSet.as_view({"get": "retrieve" if kwargs else "list"})
+            expected = await sync_to_async(view)(request, **kwargs)
+            expected.render()
+            path = "".join(f"{value}/" for value in kwargs.values())
+            response = await self.async_client.get(
+                f"/api/async/users/{path}", params, headers=self.auth
+            )
+            self.assertEqual(
+                response.content.decode().replace("/api/async/", "/api/"),
+                expected.content.decode(),
+            )
+
+    async def test_authentication_and_permissions(self):
+        response = await self.async_client.get("/api/async/rides/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+        self.auth = self.basic_auth("rider@example.com", "riderpass")
+        await self.assertSameResponse("rides/")
+        response = await self.async_client.get("/api/async/users/", headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_load_test_command(self):
+        # A single request is enough for the percentiles.
+        command = loadtest.Command(stdout=StringIO())
+        command.report("sync (WSGI)", [0.0125], 0.0125)
+        self.assertIn("p50    12.5 ms", command.stdout.getvalue())
+        self.assertIn("p99    12.5 ms", command.stdout.getvalue())
+        for path in ["users/", "nowhere/"]:
+            with self.subTest(path=path), self.assertRaises(CommandError):
+                call_command("loadtest", "--path", path, stdout=StringIO())
+
+    def test_ride_page_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(self.async_client.get)("/api/async/rides/", headers=self.auth)
+        # Authentication, count, rides and their events.
+        self.assertEqual(len(queries), 4)
+
+
+class RideEventSummaryTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.now = timezone.now()
+        self.rides = [
+            Ride.objects.create(
+                status="pickup",
+                rider=self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=20.0,
+                dropoff_latitude=11.0,
+                dropoff_longitude=21.0,
+                pickup_time=self.now - timedelta(hours=i),
+            )
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.admin_user)
+
+    def event(self, ride, description, minutes_ago):
+        return RideEvent.objects.create(
+            ride=ride,
+            description=description,
+            created_at=self.now - timedelta(minutes=minutes_ago),
+        )
+
+    def assertSummary(self, ride, count, description="", minutes_ago=None):
+        ride.refresh_from_db()
+        self.assertEqual(ride.event_count, count)
+        self.assertEqual(ride.last_event_description, description)
+        self.assertEqual(
+            ride.last_event_at,
+            None if minutes_ago is None else self.now - timedelta(minutes=minutes_ago),
+        )
+
+    def test_created_updated_moved_and_deleted_events(self):
+        ride, other, _ = self.rides
+        self.assertSummary(ride, 0)
+        late = self.event(ride, RideEvent.DROPOFF, minutes_ago=5)
+        early = self.event(ride, RideEvent.PICKUP, minutes_ago=50)
+        self.assertSummary(ride, 2, RideEvent.DROPOFF, 5)
+
+        early.created_at = self.now
+        early.save()
+        self.assertSummary(ride, 2, RideEvent.PICKUP, 0)
+
+        early = RideEvent.objects.get(pk=early.pk)
+        early.ride = other
+        early.save()
+        self.assertSummary(ride, 1, RideEvent.DROPOFF, 5)
+        self.assertSummary(other, 1, RideEvent.PICKUP, 0)
+
+        late.delete()
+        self.assertSummary(ride, 0)
+        other.delete()
+
+    def test_stale_ride_instance_does_not_overwrite_summary(self):
+        ride = Ride.objects.get(pk=self.rides[0].pk)
+        self.event(ride, RideEvent.PICKUP, minutes_ago=1)
+        ride.status = "en-route"
+        ride.save()
+        self.assertSummary(ride, 1, RideEvent.PICKUP, 1)
+        self.assertEqual(ride.status, "en-route")
+
+    def test_event_and_summary_are_written_together(self):
+        with mock.patch.object(
+            Ride.objects, "record_event", side_effect=RuntimeError("boom")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.event(self.rides[0], RideEvent.PICKUP, minutes_ago=1)
+        self.assertFalse(RideEvent.objects.exists())
+
+    def test_bulk_ingest_updates_summary(self):
+        self.event(self.rides[0], RideEvent.PICKUP, minutes_ago=10)
+        response = self.client.post(
+            reverse("rideevent-bulk"),
+            [
+                {
+                    "ride": self.rides[0].pk,
+                    "description": "Driver waiting",
+                    "created_at": (self.now - timedelta(minutes=m)).isoformat(),
+                }
+                for m in (20, 2)
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertSummary(self.rides[0], 3, "Driver waiting", 2)
+
+    def test_rebuild_and_verify_command(self):
+        self.event(self.rides[0], RideEvent.PICKUP, minutes_ago=10)
+        call_command("rebuild_ride_event_summary", "--verify", stdout=StringIO())
+
+        Ride.objects.update(event_count=7, last_event_description="wrong")
+        with self.assertRaisesMessage(CommandError, "3 rides"):
+            call_command("rebuild_ride_event_summary", "--verify", stdout=StringIO())
+
+        call_command("rebuild_ride_event_summary", "--batch-size", 2, stdout=StringIO())
+        call_command("rebuild_ride_event_summary", "--verify", stdout=StringIO())
+        self.assertSummary(self.rides[0], 1, RideEvent.PICKUP, 10)
+        self.assertSummary(self.rides[1], 0)
+
+    def test_populate_rides_writes_summary(self):
+        call_command(
+            "populate_rides", "--rides", 5, "--events-per-ride", 3, stdout=StringIO()
+        )
+        call_command("rebuild_ride_event_summary", "--verify", stdout=StringIO())
+        self.assertEqual(
+            set(Ride.objects.values_list("event_count", "last_event_description")),
+            {(3, RideEvent.DROPOFF)},
+        )
+
+    def test_filters_and_ordering_read_rides_only(self):
+        ride, busy, _ = self.rides
+        self.event(ride, RideEvent.PICKUP, minutes_ago=45)
+        self.event(busy, RideEvent.PICKUP, minutes_ago=40)
+        self.event(busy, RideEvent.DROPOFF, minutes_ago=5)
+
+        def ids(params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse("ride-list"), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # Besides the conditional GET validators, only the
+            # todays_ride_events prefetch reads ride events.
+            event_queries = [
+                query
+                for query in queries
+                if "rides_rideevent" in query["sql"]
+                and 'ORDER BY "rides_ride"."updated_at" DESC' not in query["sql"]
+            ]
+            self.assertLessEqual(len(event_queries), 1)
+            return [ride["id_ride"] for ride in response.json()["results"]]
+
+        idle = ids({"idle_minutes": 30, "ordering": "last_event_at"})
+        self.assertEqual(idle, [self.rides[2].pk, ride.pk])
+        self.assertEqual(ids({"event_count__gte": 2}), [busy.pk])
+        self.assertEqual(
+            ids({"ordering": "-last_event_at"}), [busy.pk, ride.pk, self.rides[2].pk]
+        )
+        self.assertEqual(ids({"last_event_description": RideEvent.DROPOFF}), [busy.pk])
+        for value in ["-1", "1e20", "inf", "nan"]:
+            with self.subTest(idle_minutes=value):
+                response = self.client.get(
+                    reverse("ride-list"), {"idle_minutes": value}
+                )
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("idle_minutes", response.json())
+        response = self.client.get(
+            reverse("ride-detail", args=[busy.pk]),
+            {"fields": "event_count,last_event_description"},
+        )
+        self.assertEqual(response.json()["event_count"], 2)
+        self.assertEqual(response.json()["last_event_description"], RideEvent.DROPOFF)
+
+
+class RideEventArchiveTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.now = timezone.now()
+        self.ride, self.old_ride = [
+            Ride.objects.create(
+                status="dropoff",
+                rider=self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=20.0,
+                dropoff_latitude=11.0,
+                dropoff_longitude=21.0,
+                pickup_time=self.now - timedelta(days=60),
+            )
+            for _ in range(2)
+        ]
+        self.events = [
+            self.event(self.ride, RideEvent.PICKUP, days_ago=60),
+            self.event(self.ride, "Status changed to en-route", days_ago=45),
+            self.event(self.ride, RideEvent.DROPOFF, days_ago=0),
+            self.event(self.old_ride, RideEvent.PICKUP, days_ago=40),
+            self.event(self.old_ride, RideEvent.DROPOFF, days_ago=39),
+        ]
+        self.client.force_authenticate(user=self.admin_user)
+
+    def event(self, ride, description, days_ago):
+        return RideEvent.objects.create(
+            ride=ride,
+            description=description,
+            created_at=self.now - timedelta(days=days_ago, minutes=1),
+        )
+
+    def archive(self, *args):
+        call_command("archive_ride_events", *args, stdout=StringIO())
+
+    def summary(self, ride):
+        ride.refresh_from_db()
+        trip = RideTrip.objects.get(ride=ride)
+        return (
+            ride.event_count,
+            ride.last_event_description,
+            ride.last_event_at,
+            trip.pickup_at,
+            trip.dropoff_at,
+        )
+
+    def test_moves_old_events_in_batches(self):
+        before = [self.summary(self.ride), self.summary(self.old_ride)]
+        self.archive("--older-than-days", 30, "--batch-size", 1)
+
+        hot, *archived = self.events[2], *self.events[:2], *self.events[3:]
+        self.assertEqual(list(RideEvent.objects.values_list("pk", flat=True)), [hot.pk])
+        self.assertEqual(
+            set(
+                ArchivedRideEvent.objects.values_list(
+                    "pk", "ride", "event_type__description", "created_at"
+                )
+            ),
+            {
+                (event.pk, event.ride_id, event.description, event.created_at)
+                for event in archived
+            },
+        )
+        # Archived events still count, also when recomputed from scratch.
+        self.assertEqual([self.summary(self.ride), self.summary(self.old_ride)], before)
+        call_command("rebuild_ride_event_summary", stdout=StringIO())
+        call_command("rebuild_ride_trips", stdout=StringIO())
+        self.assertEqual([self.summary(self.ride), self.summary(self.old_ride)], before)
+
+        self.archive("--older-than-days", 30)
+        self.assertEqual(ArchivedRideEvent.objects.count(), 4)
+
+    def test_hot_event_changes_account_for_archived_events(self):
+        self.archive("--older-than-days", 30)
+        self.events[2].delete()
+        self.assertEqual(
+            self.summary(self.ride),
+            (2, "Status changed to en-route", self.events[1].created_at)
+            + (self.events[0].created_at, None),
+        )
+
+        late = self.event(self.ride, RideEvent.DROPOFF, days_ago=50)
+        self.assertEqual(
+            self.summary(self.ride),
+            (3, "Status changed to en-route", self.events[1].created_at)
+            + (self.events[0].created_at, late.created_at),
+        )
+
+    def test_history_includes_archived_events(self):
+        self.archive("--older-than-days", 30)
+        response = self.client.get(reverse("ride-events", args=[self.ride.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(
+            [
+                (event["id_ride_event"], event["archived"])
+                for event in response.json()["results"]
+            ],
+            [
+                (self.events[0].pk, True),
+                (self.events[1].pk, True),
+                (self.events[2].pk, False),
+            ],
+        )
+        response = self.client.get(reverse("ride-events", args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_includes_archived_events(self):
+        self.archive("--older-than-days", 30)
+        response = self.client.get(reverse("ride-export"))
+        rides = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(
+            {
+                ride["id_ride"]: [e["id_ride_event"] for e in ride["events"]]
+                for ride in rides
+            },
+            {
+                self.ride.pk: [event.pk for event in self.events[:3]],
+                self.old_ride.pk: [event.pk for event in self.events[3:]],
+            },
+        )
+
+    def test_deleting_a_ride_deletes_its_archived_events(self):
+        self.archive("--older-than-days", 30)
+        self.ride.delete()
+        self.assertEqual(
+            set(ArchivedRideEvent.objects.values_list("ride", flat=True)),
+            {self.old_ride.pk},
+        )
+
+    def test_invalid_options(self):
+        for args in [("--older-than-days", 0), ("--batch-size", 0), ("--pause", -1)]:
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.archive(*args)
+        self.assertFalse(ArchivedRideEvent.objects.exists())
+
+
+# The first configured replica or, without DB_REPLICAS, a second connection to
+# the test database standing in for one, see ReplicaRoutingTests.setUpClass().
+REPLICA = (settings.RIDES_REPLICAS or ["replica"])[0]
+
+
+@override_settings(RIDES_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(APITransactionTestCase):
+    # Reads go through a separate connection, which only sees committed rows.
+    # REPLICA is only added to databases in setUpClass(), as the test runner
+    # looks the aliases up before then.
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings, so it exists whatever runs the
+        # tests and never outside them.
+        if REPLICA not in connections:
+            default = connections["default"].settings_dict
+            connections.settings[REPLICA] = {
+                **default,
+                "TEST": {**default["TEST"], "MIRROR": "default"},
+            }
+            cls.addClassCleanup(cls.remove_mirror)
+        cls.databases = {"default", REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def remove_mirror(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        routers._down_until.clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.ride = Ride.objects.create(
+            status="pickup",
+            rider=self.admin_user,
+            driver=self.admin_user,
+            pickup_latitude=10.0,
+            pickup_longitude=20.0,
+            dropoff_latitude=11.0,
+            dropoff_longitude=21.0,
+            pickup_time=timezone.now(),
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+    def tearDown(self):
+        routers.read_from(None)
+
+    def tables_read(self, request):
+        """
+        Send ``request()`` and return the rides tables it read on each alias.
+        """
+        with (
+            CaptureQueriesContext(connections["default"]) as primary,
+            CaptureQueriesContext(connections[REPLICA]) as replica,
+        ):
+            response = request()
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return {
+            alias: {
+                table
+                for query in queries.captured_queries
+                for table in re.findall(r'FROM "(rides_\w+)"', query["sql"])
+            }
+            for alias, queries in [("default", primary), ("replica", replica)]
+        }
+
+    def test_safe_requests_read_from_replica(self):
+        for name, request in [
+            ("list", lambda: self.client.get(reverse("ride-list"))),
+            (
+                "retrieve",
+                lambda: self.client.get(reverse("ride-detail", args=[self.ride.pk])),
+            ),
+            ("export", lambda: self.client.get(reverse("ride-export"))),
+            (
+                "events",
+                lambda: self.client.get(reverse("ride-events", args=[self.ride.pk])),
+            ),
+            ("ride events", lambda: self.client.get(reverse("rideevent-list"))),
+            ("report", lambda: self.client.get(reverse("long-trips-report"))),
+            (
+                "async",
+                lambda: async_to_sync(self.async_client.get)(
+                    reverse("async-ride-list"),
+                    headers={"Authorization": self.basic_auth()},
+                ),
+            ),
+        ]:
+            with self.subTest(name):
+                tables = self.tables_read(request)
+                self.assertTrue(tables["replica"])
+                self.assertFalse(tables["default"] - {"rides_user"})
+
+    def test_writer_reads_from_primary_until_sticky_window_ends(self):
+        def write():
+            return self.client.post(
+                reverse("rideevent-list"),
+                {
+                    "ride": self.ride.pk,
+                    "description": RideEvent.PICKUP,
+                    "created_at": timezone.now().isoformat(),
+                },
+            )
+
+        tables = self.tables_read(write)
+        self.assertFalse(tables["replica"])
+
+        tables = self.tables_read(lambda: self.client.get(reverse("ride-list")))
+        self.assertFalse(tables["replica"])
+        self.assertIn("rides_ride", tables["default"])
+
+        with override_settings(RIDES_REPLICA_STICKY_SECONDS=0):
+            response_cache.get_cache().clear()
+            self.tables_read(write)
+            tables = self.tables_read(lambda: self.client.get(reverse("ride-list")))
+        self.assertIn("rides_ride", tables["replica"])
+
+    def test_responses_read_right_after_a_write_are_not_cached(self):
+        routers.stick_to_primary(None)
+        self.client.get(reverse("ride-list"))
+        response = self.client.get(reverse("ride-list"))
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    @override_settings(RIDES_CACHE_TIMEOUT=0)
+    def test_unavailable_replica_falls_back_to_primary(self):
+        ensure_connection = mock.Mock(side_effect=OperationalError)
+
+        def request():
+            with mock.patch.object(
+                connections[REPLICA], "ensure_connection", ensure_connection
+            ):
+                return self.client.get(reverse("ride-list"))
+
+        with self.assertLogs("rides.routers", "WARNING"):
+            for _ in range(2):
+                tables = self.tables_read(request)
+                self.assertFalse(tables["replica"])
+                self.assertIn("rides_ride", tables["default"])
+        # Skipped without retrying until RIDES_REPLICA_RETRY_SECONDS pass.
+        self.assertEqual(ensure_connection.call_count, 1)
+
+    def test_writes_always_go_to_primary(self):
+        ride = Ride.objects.using(REPLICA).get(pk=self.ride.pk)
+        ride.status = "dropoff"
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            ride.save()
+        self.assertFalse(replica.captured_queries)
+        self.assertEqual(Ride.objects.get(pk=ride.pk).status, "dropoff")
+
+    def basic_auth(self):
+        return "Basic " + base64.b64encode(b"admin@example.com:adminpass").decode()
+
+
+@override_settings(RIDES_CACHE_TIMEOUT=0)
+@override_settings(RIDES_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        response_cache.reset_stats()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.ride = Ride.objects.create(
+            status="pickup",
+            rider=self.admin_user,
+            driver=self.admin_user,
+            pickup_latitude=10.0,
+            pickup_longitude=20.0,
+            dropoff_latitude=11.0,
+            dropoff_longitude=21.0,
+            pickup_time=timezone.now(),
+        )
+        RideEvent.objects.create(
+            ride=self.ride, description=RideEvent.PICKUP, created_at=timezone.now()
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+    def server_timing(self, response):
+        return dict(
+            re.match(r"(\w+);dur=([\d.]+)(?:;desc=\"(\d+) queries\")?", entry).group(
+                1, 3
+            )
+            for entry in response["Server-Timing"].split(", ")
+        )
+
+    def metrics(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("ride-list"))
+        self.assertEqual(
+            self.server_timing(response),
+            {"db": str(len(queries)), "serialize": None, "total": None},
+        )
+
+        response = async_to_sync(self.async_client.get)(
+            reverse("async-ride-list"),
+            headers={
+                "Authorization": "Basic "
+                + base64.b64encode(b"admin@example.com:adminpass").decode()
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(self.server_timing(response)["db"]), 1)
+
+    def test_metrics_endpoint(self):
+        for _ in range(2):
+            self.client.get(reverse("ride-list"))
+        with override_settings(RIDES_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse("ride-detail", args=[self.ride.pk]))
+        self.assertEqual(list(self.server_timing(response)), ["total"])
+
+        metrics = self.metrics()
+        labels = '{view="ride-list",method="GET"}'
+        for line in [
+            f"rides_request_duration_seconds_count{labels} 2",
+            f"rides_request_queries_count{labels} 2",
+            f"rides_request_serialize_seconds_count{labels} 2",
+            'rides_request_queries_bucket{view="ride-list",method="GET",le="+Inf"} 2',
+            'rides_request_duration_seconds_count{view="ride-detail",method="GET"} 1',
+            "# TYPE rides_request_db_seconds histogram",
+            "rides_response_cache_hits_total 0",
+        ]:
+            self.assertIn(line, metrics.splitlines())
+        # Unsampled requests only record their duration.
+        self.assertNotIn('rides_request_queries_count{view="ride-detail"', metrics)
+
+        self.client.force_authenticate(
+            user=User.objects.create_user(username="rider", role="rider")
+        )
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_only_api_requests_are_measured(self):
+        response = self.client.get("/admin/login/")
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertNotIn('view="admin:login"', self.metrics())
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        with override_settings(RIDES_METRICS_SAMPLE_RATE=0.1):
+            call_command(
+                "benchmark_metrics", "--requests", 2, "--rounds", 1, stdout=out
+            )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(
+            [line.split(":")[0].strip() for line in lines],
+            ["off", "sampled (0.1)", "sampled (1)"],
+        )
+        self.assertIn("+0.00%", lines[0])
+        self.assertFalse(User.objects.filter(username="benchmark-metrics").exists())
+        with self.assertRaises(CommandError):
+            call_command("benchmark_metrics", "--rounds", 0)
+
+
+class BenchmarkEndpointsCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.results = Path(directory.name) / "results.json"
+
+    def benchmark(self, *args):
+        call_command(
+            "benchmark_endpoints",
+            "--repeat",
+            2,
+            "--output",
+            self.results,
+            *args,
+            stdout=StringIO(),
+        )
+        return json.loads(self.results.read_text())
+
+    def test_records_every_endpoint(self):
+        results = self.benchmark("--rides", 30, "--events-per-ride", 3)
+        self.assertEqual(results["rides"], 30)
+        endpoints = results["endpoints"]
+        for name in [
+            "rides?rider__email",
+            "rides?ordering=distance",
+            "rides?page=last",
+            "ride events history",
+            "ride-event",
+            "async users",
+            "long trips report",
+        ]:
+            self.assertIn(name, endpoints)
+        self.assertEqual(endpoints["rides?page=last"]["path"], "/api/rides/?page=3")
+        for result in endpoints.values():
+            self.assertGreaterEqual(result["queries"], 1)
+            self.assertGreater(result["peak_kib"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+        # Count, page of rides with their riders and drivers, today's events.
+        self.assertEqual(endpoints["rides"]["queries"], 3)
+        # The throwaway user is gone.
+        self.assertFalse(User.objects.filter(username="benchmark").exists())
+
+    def test_fails_on_regression_from_baseline(self):
+        baseline = self.benchmark("--rides", 30)
+        baseline_file = self.results.with_name("baseline.json")
+        baseline_file.write_text(json.dumps(baseline))
+        self.benchmark("--baseline", baseline_file, "--latency-threshold", 100)
+
+        baseline["endpoints"]["ride"]["queries"] -= 1
+        baseline["endpoints"]["rides"]["p95_ms"] = 0
+        baseline_file.write_text(json.dumps(baseline))
+        with self.assertRaisesRegex(
+            CommandError, r"ride: \d+ queries, the baseline ran"
+        ) as raised:
+            self.benchmark("--baseline", baseline_file, "--latency-slack-ms", 0)
+        self.assertIn("rides: p95", str(raised.exception))
+
+        Ride.objects.first().delete()
+        with self.assertRaisesRegex(CommandError, "recorded with 30 rides"):
+            self.benchmark("--baseline", baseline_file)
+
+    def test_fails_when_queries_grow_with_page_size(self):
+        call_command("populate_rides", rides=60, stdout=StringIO())
+        paginate_queryset = RideViewSet.paginate_queryset
+
+        def paginate_with_a_query_per_ride(view, queryset):
+            page = paginate_queryset(view, queryset)
+            for ride in page:
+                ride.refresh_from_db(fields=["status"])
+            return page
+
+        with mock.patch.object(
+            RideViewSet, "paginate_queryset", paginate_with_a_query_per_ride
+        ):
+            with self.assertRaisesRegex(
+                CommandError, r"rides\?status: 13 queries with 10 rows per page, 53"
+            ):
+                self.benchmark()
+
+
+class DatabaseProfileTests(TestCase):
+    def load_settings(self, **environ):
+        """
+        The settings module as evaluated with the DB_* variables of
+        ``environ`` in place of the current ones.
+        """
+        environ = {
+            **{key: value for key, value in os.environ.items() if key[:3] != "DB_"},
+            **environ,
+        }
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return runpy.run_path(str(Path(settings.BASE_DIR, "api", "settings.py")))
+
+    def test_sqlite_profiles(self):
+        tuned = self.load_settings()
+        [default] = tuned["DATABASES"].values()
+        self.assertEqual(default["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(default["CONN_MAX_AGE"], 0)
+        self.assertEqual(default["OPTIONS"]["timeout"], 20)
+        self.assertEqual(default["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertIn("PRAGMA journal_mode = WAL;", default["OPTIONS"]["init_command"])
+
+        stock = self.load_settings(DB_SQLITE_TUNED="0", DB_NAME="/tmp/rides.db")
+        self.assertEqual(stock["DATABASES"]["default"]["OPTIONS"], {})
+        self.assertEqual(stock["DATABASES"]["default"]["NAME"], "/tmp/rides.db")
+
+    def test_postgresql_profiles(self):
+        persistent = self.load_settings(
+            DB_ENGINE="postgresql", DB_HOST="db", DB_NAME="rides_prod"
+        )["DATABASES"]["default"]
+        self.assertEqual(persistent["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(
+            (persistent["HOST"], persistent["NAME"], persistent["CONN_MAX_AGE"]),
+            ("db", "rides_prod", 60),
+        )
+        self.assertNotIn("pool", persistent["OPTIONS"])
+
+        pooled = self.load_settings(
+            DB_ENGINE="postgresql", DB_POOL="1", DB_POOL_MAX_SIZE="5"
+        )["DATABASES"]["default"]
+        self.assertEqual(pooled["CONN_MAX_AGE"], 0)
+        self.assertEqual(pooled["OPTIONS"]["pool"]["max_size"], 5)
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(DB_ENGINE="oracle")
+
+    def test_replicas(self):
+        for environ, expected in [
+            ({}, {}),
+            (
+                {"DB_REPLICAS": "/data/r1.sqlite3,/data/r2.sqlite3"},
+                {"replica1": "/data/r1.sqlite3", "replica2": "/data/r2.sqlite3"},
+            ),
+            (
+                {"DB_ENGINE": "postgresql", "DB_REPLICAS": "r1:6432,r2"},
+                {"replica1": ("r1", "6432"), "replica2": ("r2", "5432")},
+            ),
+        ]:
+            with self.subTest(**environ):
+                loaded = self.load_settings(**environ)
+                databases = loaded["DATABASES"]
+                self.assertEqual(loaded["RIDES_REPLICAS"], list(expected))
+                self.assertEqual(set(databases), {"default", *expected})
+                for alias, location in expected.items():
+                    replica = databases[alias]
+                    self.assertEqual(replica["TEST"], {"MIRROR": "default"})
+                    if isinstance(location, tuple):
+                        self.assertEqual((replica["HOST"], replica["PORT"]), location)
+                    else:
+                        self.assertEqual(replica["NAME"], location)
+
+    def test_benchmark_db_reports_the_profile(self):
+        with self.assertRaisesRegex(CommandError, "no rides"):
+            call_command("benchmark_db", stdout=StringIO())
+        profile = benchmark_db.Command().describe_profile()
+        self.assertTrue(profile.startswith("sqlite, CONN_MAX_AGE=0"))
+        self.assertIn("busy_timeout=20000", profile)
+
+
+@override_settings(RIDES_CACHE_TIMEOUT=0)
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        self.now = timezone.now()
+        self.rides = [
+            Ride.objects.create(
+                status="pickup",
+                rider=self.rider,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=10.0,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=self.now - timedelta(hours=i),
+            )
+            for i in range(3)
+        ]
+        self.list_url = reverse("ride-list")
+        self.detail_url = reverse("ride-detail", args=[self.rides[0].pk])
+        self.client.force_authenticate(user=self.admin_user)
+
+    def get(self, url, params=None, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, headers=headers)
+        return response, len(queries)
+
+    def assertNotModified(self, url, params=None, **headers):
+        response, queries = self.get(url, params, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(queries, 1)
+        return response
+
+    def assertModified(self, url, etag, params=None):
+        response, _ = self.get(url, params, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        return response["ETag"]
+
+    def test_unchanged_polls_are_not_modified(self):
+        for url, params in [
+            (self.list_url, None),
+            (self.list_url, {"status": "pickup", "ordering": "pickup_time"}),
+            (self.detail_url, None),
+        ]:
+            with self.subTest(url=url, params=params):
+                response, _ = self.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertTrue(response["ETag"].startswith('W/"'))
+                self.assertIn("no-cache", response["Cache-Control"])
+                self.assertIn("private", response["Cache-Control"])
+
+                not_modified = self.assertNotModified(
+                    url, params, if_none_match=response["ETag"]
+                )
+                self.assertEqual(not_modified["ETag"], response["ETag"])
+                self.assertNotModified(
+                    url, params, if_modified_since=response["Last-Modified"]
+                )
+
+        # Each page and filter has its own validators.
+        first, _ = self.get(self.list_url)
+        second, _ = self.get(self.list_url, {"status": "pickup"})
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_writes_change_validators(self):
+        list_etag = self.get(self.list_url)[0]["ETag"]
+        pickup_etag = self.get(self.list_url, {"status": "pickup"})[0]["ETag"]
+        detail_etag = self.get(self.detail_url)[0]["ETag"]
+
+        RideEvent.objects.create(
+            ride=self.rides[0], description=RideEvent.PICKUP, created_at=self.now
+        )
+        list_etag = self.assertModified(self.list_url, list_etag)
+        detail_etag = self.assertModified(self.detail_url, detail_etag)
+
+        # A ride leaving a filtered list.
+        ride = self.rides[2]
+        ride.status = "dropoff"
+        ride.save()
+        pickup_etag = self.assertModified(
+            self.list_url, pickup_etag, {"status": "pickup"}
+        )
+        self.assertNotModified(self.detail_url, if_none_match=detail_etag)
+
+        # Rides embed their rider.
+        self.rider.first_name = "Renamed"
+        self.rider.save()
+        detail_etag = self.assertModified(self.detail_url, detail_etag)
+
+        ride.delete()
+        list_etag = self.assertModified(self.list_url, list_etag)
+
+        # Bulk ingestion bypasses the model signals.
+        response = self.client.post(
+            reverse("rideevent-bulk"),
+            [
+                {
+                    "ride": self.rides[0].pk,
+                    "description": RideEvent.DROPOFF,
+                    "created_at": self.now.isoformat(),
+                }
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertModified(self.detail_url, detail_etag)
+
+    def test_events_falling_out_of_the_window_change_validators(self):
+        RideEvent.objects.create(
+            ride=self.rides[0],
+            description=RideEvent.PICKUP,
+            created_at=self.now - timedelta(hours=23, minutes=59),
+        )
+        response, _ = self.get(self.detail_url)
+        self.assertEqual(len(response.json()["todays_ride_events"]), 1)
+        later = self.now + timedelta(minutes=2)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            response, _ = self.get(self.detail_url, if_none_match=response["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["todays_ride_events"], [])
+            self.assertNotModified(self.detail_url, if_none_match=response["ETag"])
+            self.assertNotModified(
+                self.detail_url, if_modified_since=response["Last-Modified"]
+            )
+
+            # Not vouched for: events that fell out of the window before then
+            # aren't looked at.
+            response, _ = self.get(
+                self.detail_url,
+                if_modified_since=http_date((later - timedelta(days=2)).timestamp()),
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_reads_are_unconditional(self):
+        for params in [{"pagination": "cursor"}, {"count": "false"}]:
+            with self.subTest(params=params):
+                response, _ = self.get(self.list_url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse(response.has_header("ETag"))
+
+    @override_settings(RIDES_CACHE_TIMEOUT=300)
+    def test_time_relative_filters_are_neither_cached_nor_conditional(self):
+        RideEvent.objects.create(
+            ride=self.rides[0],
+            description=RideEvent.PICKUP,
+            created_at=self.now - timedelta(minutes=20),
+        )
+        params = {"idle_minutes": 30}
+        response, _ = self.get(self.list_url, params)
+        self.assertEqual(response.json()["count"], 2)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(response["X-Cache"], "MISS")
+        # The ride crosses the cutoff without any write.
+        later = self.now + timedelta(minutes=15)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            response, _ = self.get(self.list_url, params)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_list_counts_rides_with_the_validators(self):
+        response, queries = self.get(self.list_url)
+        self.assertEqual(response.json()["count"], 3)
+        # Validators and count, page, today's events.
+        self.assertEqual(queries, 3)
+
+    @override_settings(RIDES_CACHE_TIMEOUT=300)
+    def test_cached_responses_keep_their_validators(self):
+        response, _ = self.get(self.list_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        for headers in [
+            {"if_none_match": response["ETag"]},
+            {"if_modified_since": response["Last-Modified"]},
+        ]:
+            not_modified, queries = self.get(self.list_url, **headers)
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(queries, 0)
+        cached, queries = self.get(self.list_url)
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached["ETag"], response["ETag"])
+        self.assertEqual(queries, 0)
+
+        Ride.objects.create(
+            status="pickup",
+            rider=self.rider,
+            driver=self.admin_user,
+            pickup_latitude=10.0,
+            pickup_longitude=10.0,
+            dropoff_latitude=20.0,
+            dropoff_longitude=20.0,
+            pickup_time=self.now,
+        )
+        self.assertModified(self.list_url, response["ETag"])
+
+
+@override_settings(RIDES_CACHE_TIMEOUT=0)
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(
+            username="rider@example.com", email="rider@example.com", role="rider"
+        )
+        now = timezone.now()
+        self.rides = []
+        for i in range(3):
+            ride = Ride.objects.create(
+                status="pickup",
+                rider=self.rider,
+                driver=self.admin_user,
+                pickup_latitude=10.0,
+                pickup_longitude=10.0 + i,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=now - timedelta(hours=i),
+            )
+            RideEvent.objects.create(
+                ride=ride, description=RideEvent.PICKUP, created_at=now
+            )
+            self.rides.append(ride)
+        self.list_url = reverse("ride-list")
+        self.detail_url = reverse("ride-detail", args=[self.rides[0].pk])
+        self.client.force_authenticate(user=self.admin_user)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), queries
+
+    def test_default_response_is_unchanged(self):
+        ride, _ = self.get(self.detail_url)
+        self.assertEqual(
+            list(ride),
+            [
+                "id_ride",
+                "status",
+                "rider",
+                "driver",
+                "pickup_latitude",
+                "pickup_longitude",
+                "dropoff_latitude",
+                "dropoff_longitude",
+                "pickup_time",
+                "todays_ride_events",
+            ],
+        )
+        self.assertEqual(ride["rider"]["email"], "rider@example.com")
+        self.assertEqual(len(ride["todays_ride_events"]), 1)
+
+    def test_summary_fields_are_opt_in(self):
+        fields = ",".join(RideSerializer.opt_in_fields)
+        ride, _ = self.get(self.detail_url, {"fields": f"id_ride,{fields}"})
+        self.assertEqual(list(ride), ["id_ride", *RideSerializer.opt_in_fields])
+        self.assertEqual(ride["event_count"], 1)
+        self.assertEqual(ride["last_event_description"], RideEvent.PICKUP)
+        ride, _ = self.get(self.detail_url, {"expand": "rider,driver"})
+        self.assertFalse(set(ride) & set(RideSerializer.opt_in_fields))
+
+    def test_fields_load_only_what_is_shown(self):
+        data, queries = self.get(
+            self.list_url, {"fields": "id_ride,status,pickup_longitude"}
+        )
+        self.assertEqual(
+            data["results"][0],
+            {"id_ride": self.rides[0].pk, "status": "pickup", "pickup_longitude": 10.0},
+        )
+        # The validators and the page: no users joined, no events prefetched.
+        self.assertEqual(len(queries), 2)
+        page_sql = queries.captured_queries[-1]["sql"]
+        self.assertNotIn("JOIN", page_sql)
+        self.assertNotIn('"dropoff_latitude"', page_sql)
+
+        ride, queries = self.get(self.detail_url, {"fields": "status"})
+        self.assertEqual(ride, {"status": "pickup"})
+        self.assertEqual(len(queries), 2)
+
+    def test_expand(self):
+        ride, _ = self.get(self.detail_url, {"fields": "id_ride,rider,driver"})
+        self.assertEqual(
+            ride,
+            {
+                "id_ride": self.rides[0].pk,
+                "rider": self.rider.pk,
+                "driver": self.admin_user.pk,
+            },
+        )
+
+        ride, queries = self.get(
+            self.detail_url, {"fields": "id_ride", "expand": "rider"}
+        )
+        self.assertEqual(list(ride), ["id_ride", "rider"])
+        self.assertEqual(ride["rider"]["email"], "rider@example.com")
+        self.assertEqual(len(queries), 2)
+
+        # Only the expanded form of todays_ride_events exists.
+        for params in [
+            {"fields": "todays_ride_events"},
+            {"fields": "", "expand": "todays_ride_events"},
+        ]:
+            with self.subTest(**params):
+                ride, queries = self.get(self.detail_url, params)
+                self.assertEqual(list(ride), ["todays_ride_events"])
+                self.assertEqual(len(ride["todays_ride_events"]), 1)
+                self.assertEqual(len(queries), 3)
+
+        ride, _ = self.get(self.detail_url, {"expand": "driver"})
+        self.assertEqual(
+            list(ride),
+            [
+                name
+                for name in RideSerializer.Meta.fields
+                if name != "todays_ride_events"
+                and name not in RideSerializer.opt_in_fields
+            ],
+        )
+        self.assertEqual(ride["rider"], self.rider.pk)
+        self.assertEqual(ride["driver"]["id"], self.admin_user.pk)
+
+    def test_works_with_every_pagination_and_ordering(self):
+        for params in [
+            {"pagination": "cursor"},
+            {"count": "false", "ordering": "-pickup_time"},
+            {"ordering": "distance", "latitude": 10.0, "longitude": 10.0},
+            {"latitude": 10.0, "longitude": 10.0, "radius_km": 150},
+        ]:
+            with self.subTest(**params):
+                full, full_queries = self.get(self.list_url, params)
+                sparse, queries = self.get(
+                    self.list_url, {**params, "fields": "id_ride"}
+                )
+                self.assertEqual(
+                    sparse["results"],
+                    [{"id_ride": ride["id_ride"]} for ride in full["results"]],
+                )
+                # Less the events prefetch; deferred fields are never loaded
+                # ride by ride.
+                self.assertEqual(len(queries), len(full_queries) - 1)
+
+    @override_settings(RIDES_FAST_SERIALIZATION=True)
+    def test_fast_serialization(self):
+        for params in [
+            {"fields": "id_ride,rider"},
+            {"fields": "status", "expand": "driver,todays_ride_events"},
+        ]:
+            with self.subTest(**params):
+                fast, _ = self.get(self.list_url, params)
+                with override_settings(RIDES_FAST_SERIALIZATION=False):
+                    default, _ = self.get(self.list_url, params)
+                self.assertEqual(fast, default)
+
+    def test_unknown_fields_are_rejected(self):
+        for params in [{"fields": "id_ride,password"}, {"expand": "status"}]:
+            with self.subTest(**params):
+                response = self.client.get(self.list_url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn(next(iter(params)), response.json())
+
+    @override_settings(RIDES_CACHE_TIMEOUT=300)
+    def test_cached_sparse_responses_are_invalidated(self):
+        response_cache.get_cache().clear()
+        params = {"fields": "status"}
+        self.get(self.detail_url, params)
+        self.rides[0].status = "dropoff"
+        self.rides[0].save()
+        ride, _ = self.get(self.detail_url, params)
+        self.assertEqual(ride, {"status": "dropoff"})
+
+        params = {"fields": "id_ride", "expand": "rider"}
+        self.get(self.list_url, params)
+        self.rider.first_name = "Renamed"
+        self.rider.save(update_fields=["first_name"])
+        data, _ = self.get(self.list_url, params)
+        self.assertEqual(data["results"][0]["rider"]["first_name"], "Renamed")
+
+
+@override_settings(RIDES_CACHE_TIMEOUT=0)
+class CompactFormatTests(APITestCase):
+    COLUMNAR = "application/vnd.rides.columnar+json"
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.riders = [
+            User.objects.create_user(
+                username=f"rider{i}@example.com",
+                email=f"rider{i}@example.com",
+                role="rider",
+            )
+            for i in range(2)
+        ]
+        now = timezone.now()
+        for i in range(15):
+            ride = Ride.objects.create(
+                status="pickup",
+                rider=self.riders[i % 2],
+                driver=self.admin_user,
+                pickup_latitude=10.0 + i / 7,
+                pickup_longitude=10.0,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=now - timedelta(hours=i),
+            )
+            RideEvent.objects.create(
+                ride=ride, description=RideEvent.PICKUP, created_at=now
+            )
+        self.list_url = reverse("ride-list")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def get(self, url, accept, params=None, **headers):
+        response = self.client.get(url, params, headers={"Accept": accept, **headers})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_columnar_dedupes_users(self):
+        expected = self.get(self.list_url, "application/json").json()
+        response = self.get(self.list_url, self.COLUMNAR)
+        self.assertEqual(response["Content-Type"], self.COLUMNAR)
+        data = response.json()
+        self.assertEqual(
+            {key: data[key] for key in ("count", "next", "previous")},
+            {key: expected[key] for key in ("count", "next", "previous")},
+        )
+        self.assertEqual(data["columns"], list(expected["results"][0]))
+        self.assertEqual(
+            sorted(data["users"]),
+            sorted(str(user.pk) for user in [self.admin_user, *self.riders]),
+        )
+        users = {int(pk): user for pk, user in data["users"].items()}
+        rides = []
+        for row in data["rows"]:
+            ride = dict(zip(data["columns"], row))
+            ride["rider"], ride["driver"] = users[ride["rider"]], users[ride["driver"]]
+            rides.append(ride)
+        self.assertEqual(rides, expected["results"])
+
+        # Details and sparse pages.
+        detail_url = reverse("ride-detail", args=[rides[0]["id_ride"]])
+        self.assertEqual(
+            self.get(detail_url, self.COLUMNAR).json(),
+            self.get(detail_url, "application/json").json(),
+        )
+        data = self.get(self.list_url, self.COLUMNAR, {"fields": "id_ride"}).json()
+        self.assertEqual(data["columns"], ["id_ride"])
+        self.assertEqual(data["users"], {})
+
+    @skipUnless(renderers.msgpack, "Needs msgpack")
+    def test_msgpack(self):
+        for url, accept in [
+            (self.list_url, "application/msgpack"),
+            (reverse("rideevent-list"), "application/msgpack"),
+            (self.list_url, "application/vnd.rides.columnar+msgpack"),
+        ]:
+            with self.subTest(url=url, accept=accept):
+                expected = self.get(url, accept.replace("msgpack", "json")).json()
+                response = self.get(url, accept)
+                self.assertEqual(response["Content-Type"], accept)
+                self.assertEqual(renderers.msgpack.unpackb(response.content), expected)
+
+    def test_formats_have_their_own_etags(self):
+        etag = self.get(self.list_url, "application/json")["ETag"]
+        response = self.get(self.list_url, self.COLUMNAR, if_none_match=etag)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.get(
+            self.list_url,
+            headers={"Accept": self.COLUMNAR, "If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_compression(self):
+        plain = self.get(self.list_url, "application/json").content
+        response = self.get(self.list_url, "application/json", accept_encoding="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+        # The browsable API's pages carry a CSRF token.
+        response = self.get(self.list_url, "text/html", accept_encoding="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @skipUnless(compression.zstandard, "Needs zstandard")
+    def test_zstd_compression(self):
+        plain = self.get(self.list_url, "application/json").content
+        response = self.get(
+            self.list_url, "application/json", accept_encoding="gzip, zstd"
+        )
+        self.assertEqual(response["Content-Encoding"], "zstd")
+        self.assertEqual(
+            compression.zstandard.ZstdDecompressor().decompress(response.content),
+            plain,
+        )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_formats", "--repeat", 2, stdout=out)
+        lines = out.getvalue().splitlines()
+        for line in ["rides        json", "rides        columnar", "ride-events  json"]:
+            self.assertTrue(any(output.startswith(line) for output in lines), line)
+
+
+@override_settings(RIDES_LIVE_BACKEND="rides.live.LocalBackend")
+class LiveFeedTests(APITransactionTestCase):
+    def setUp(self):
+        credential_cache.clear()
+        live.get_backend.cache_clear()
+        self.addCleanup(live.get_backend.cache_clear)
+        self.addCleanup(live.broker.subscribers.clear)
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.driver = User.objects.create_user(
+            username="driver@example.com", email="driver@example.com", role="driver"
+        )
+        self.rides = [
+            Ride.objects.create(
+                status=status,
+                rider=self.admin_user,
+                driver=driver,
+                pickup_latitude=10.0,
+                pickup_longitude=10.0,
+                dropoff_latitude=20.0,
+                dropoff_longitude=20.0,
+                pickup_time=timezone.now(),
+            )
+            for status, driver in [
+                ("pickup", self.driver),
+                ("dropoff", self.driver),
+                ("pickup", self.admin_user),
+            ]
+        ]
+        token = base64.b64encode(b"admin@example.com:adminpass").decode()
+        self.auth = {"Authorization": f"Basic {token}"}
+        self.url = reverse("live-rideevent-stream")
+
+    async def open(self, params=None, **headers):
+        response = await self.async_client.get(
+            self.url, params, headers={**self.auth, **headers}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await self.read(stream)).startswith("retry: "))
+        return stream
+
+    async def disconnect(self, stream):
+        # As the ASGI handler does when the client goes away.
+        read = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        read.cancel()
+        with suppress(asyncio.CancelledError):
+            await read
+
+    async def read(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    async def read_events(self, stream, count):
+        events = []
+        while len(events) < count:
+            chunk = await self.read(stream)
+            fields = dict(
+                line.split(": ", 1) for line in chunk.splitlines() if ": " in line
+            )
+            if fields.get("event") == "ride_event":
+                data = json.loads(fields["data"])
+                self.assertEqual(fields["id"], str(data["id"]))
+                events.append(data)
+        return events
+
+    async def create_event(self, ride, description=RideEvent.PICKUP):
+        event = await RideEvent.objects.acreate(
+            ride=ride, description=description, created_at=timezone.now()
+        )
+        return event.pk
+
+    async def test_streams_new_events_matching_the_filters(self):
+        for params, ride in [
+            ({}, self.rides[1]),
+            ({"ride": self.rides[1].pk}, self.rides[1]),
+            ({"driver": self.admin_user.pk}, self.rides[2]),
+            ({"status": "dropoff"}, self.rides[1]),
+        ]:
+            with self.subTest(**params):
+                stream = await self.open(params)
+                skipped = [other for other in self.rides if other != ride and params]
+                for other in skipped:
+                    await self.create_event(other)
+                pk = await self.create_event(ride)
+                [event] = await self.read_events(stream, 1)
+                self.assertEqual(
+                    event,
+                    {
+                        "id": pk,
+                        "ride": ride.pk,
+                        "driver": ride.driver_id,
+                        "status": ride.status,
+                        "description": RideEvent.PICKUP,
+                        "created_at": event["created_at"],
+                    },
+                )
+                await self.disconnect(stream)
+        self.assertEqual(len(live.broker), 0)
+
+    async def test_resumes_after_the_last_event_id(self):
+        pks = [await self.create_event(self.rides[0]) for _ in range(3)]
+        stream = await self.open(last_event_id=str(pks[0]))
+        new_pk = await self.create_event(self.rides[0])
+        events = await self.read_events(stream, 3)
+        self.assertEqual([event["id"] for event in events], [*pks[1:], new_pk])
+
+        # Also from the query string, filtered.
+        stream = await self.open({"last_event_id": 0, "ride": self.rides[1].pk})
+        pk = await self.create_event(self.rides[1])
+        [event] = await self.read_events(stream, 1)
+        self.assertEqual(event["id"], pk)
+
+    async def test_bulk_ingest_publishes(self):
+        stream = await self.open()
+        response = await self.async_client.post(
+            reverse("rideevent-bulk"),
+            [
+                {
+                    "ride": ride.pk,
+                    "description": RideEvent.DROPOFF,
+                    "created_at": timezone.now().isoformat(),
+                }
+                for ride in self.rides[:2]
+            ],
+            content_type="application/json",
+            headers=self.auth,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        events = await self.read_events(stream, 2)
+        self.assertEqual(
+            [event["ride"] for event in events], [ride.pk for ride in self.rides[:2]]
+        )
+
+    @override_settings(RIDES_LIVE_QUEUE_SIZE=2)
+    async def test_subscribers_that_fall_behind_are_disconnected(self):
+        stream = await self.open()
+        [subscriber] = live.broker.subscribers
+        live.broker.publish(
+            [{"id": pk, "ride": 1, "driver": 1, "status": ""} for pk in (1, 2)]
+        )
+        live.broker.publish([{"id": 3, "ride": 1, "driver": 1, "status": ""}])
+        # Publishing never waits for the subscriber.
+        await asyncio.sleep(0)
+        self.assertTrue(subscriber.overflowed)
+        chunks = [chunk.decode() async for chunk in stream]
+        self.assertEqual(
+            [re.search("^event: (.*)$", chunk, re.M)[1] for chunk in chunks],
+            ["ride_event", "ride_event", "overflow"],
+        )
+        self.assertEqual(len(live.broker), 0)
+
+    @override_settings(RIDES_LIVE_KEEPALIVE_SECONDS=0.01)
+    async def test_idle_streams_are_kept_alive(self):
+        stream = await self.open()
+        self.assertEqual(await self.read(stream), ": keepalive\n\n")
+
+    @override_settings(
+        RIDES_LIVE_BACKEND="rides.live.DatabaseBackend", RIDES_LIVE_POLL_SECONDS=0.01
+    )
+    async def test_database_backend_polls_for_events(self):
+        live.get_backend.cache_clear()
+        stream = await self.open()
+        # As if another process wrote it.
+        with mock.patch.object(live, "events_created"):
+            pk = await self.create_event(self.rides[0])
+        [event] = await self.read_events(stream, 1)
+        self.assertEqual(event["id"], pk)
+        await self.disconnect(stream)
+        # Polling stops with the last subscriber.
+        await asyncio.wait_for(live.get_backend().task, 5)
+
+    async def test_authentication_and_parameters(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        for params in [{"ride": "abc"}, {"last_event_id": -1}]:
+            with self.subTest(**params):
+                response = await self.async_client.get(
+                    self.url, params, headers=self.auth
+                )
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(live.broker), 0)
+
+    def test_load_test_command(self):
+        out = StringIO()
+        call_command("loadtest_live", "--subscribers", 20, "--events", 3, stdout=out)
+        self.assertIn("20 streams connected", out.getvalue())
+        self.assertIn("3 events reached every stream", out.getvalue())
+        self.assertIn("0 streams left open", out.getvalue())
+        self.assertFalse(RideEvent.objects.exists())
+        self.assertFalse(User.objects.filter(username="live-loadtest").exists())
+
+
+class UserStatsTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.rider = User.objects.create_user(username="rider", role="rider")
+        self.drivers = [
+            User.objects.create_user(username=f"driver{i}", role="driver")
+            for i in range(2)
+        ]
+        self.march = datetime(2025, 3, 10, 23, 30, tzinfo=dt_timezone.utc)
+        self.rides = [
+            self.create_trip(self.drivers[0], self.march, 90),
+            self.create_trip(self.drivers[0], self.march, 30),
+            self.create_trip(self.drivers[1], self.march + timedelta(days=1), 75),
+        ]
+        self.client.force_authenticate(user=self.admin_user)
+
+    def create_trip(self, driver, pickup_at, minutes, status="dropoff"):
+        ride = Ride.objects.create(
+            status=status,
+            rider=self.rider,
+            driver=driver,
+            pickup_latitude=10.0,
+            pickup_longitude=10.0,
+            dropoff_latitude=20.0,
+            dropoff_longitude=20.0,
+            pickup_time=pickup_at,
+        )
+        RideEvent.objects.create(
+            ride=ride, description=RideEvent.PICKUP, created_at=pickup_at
+        )
+        RideEvent.objects.create(
+            ride=ride,
+            description=RideEvent.DROPOFF,
+            created_at=pickup_at + timedelta(minutes=minutes),
+        )
+        return ride
+
+    def stats_rows(self):
+        return sorted(
+            UserDailyStats.objects.values_list(
+                "user",
+                "role",
+                "day",
+                "status",
+                "rides",
+                "trips",
+                "long_trips",
+                "trip_duration",
+            )
+        )
+
+    def assertStatsCurrent(self):
+        maintained = self.stats_rows()
+        UserDailyStats.objects.rebuild()
+        self.assertEqual(maintained, self.stats_rows())
+
+    def test_stats_follow_writes(self):
+        day = self.march.date()
+        self.assertIn(
+            (self.drivers[0].pk, "driver", day, "dropoff", 2, 2, 1),
+            [row[:7] for row in self.stats_rows()],
+        )
+        self.assertStatsCurrent()
+
+        ride = self.rides[0]
+        ride.status = "cancelled"
+        ride.save()
+        self.assertStatsCurrent()
+        ride.driver = self.drivers[1]
+        ride.pickup_time += timedelta(hours=1)  # The next day in UTC.
+        ride.save()
+        self.assertStatsCurrent()
+
+        dropoff = ride.ride_events.with_description(RideEvent.DROPOFF).get()
+        dropoff.created_at += timedelta(hours=2)
+        dropoff.save()
+        self.assertStatsCurrent()
+        dropoff.ride = self.rides[1]
+        dropoff.save()
+        self.assertStatsCurrent()
+        dropoff.delete()
+        self.assertStatsCurrent()
+
+        response = self.client.post(
+            reverse("rideevent-bulk"),
+            [
+                {
+                    "ride": self.rides[2].pk,
+                    "description": "Status changed to disputed",
+                    "created_at": (self.march + timedelta(days=2)).isoformat(),
+                },
+                {
+                    "ride": self.rides[2].pk,
+                    "description": RideEvent.DROPOFF,
+                    "created_at": (self.march + timedelta(days=3)).isoformat(),
+                },
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertStatsCurrent()
+
+        self.rides[1].delete()
+        self.assertStatsCurrent()
+        self.drivers[1].delete()
+        self.assertStatsCurrent()
+        self.assertFalse(UserDailyStats.objects.filter(role="driver").exists())
+
+    def test_stats_action(self):
+        url = reverse("user-stats", args=[self.drivers[0].pk])
+        # The user and the sum of their rows.
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "user": self.drivers[0].pk,
+                "start": None,
+                "end": None,
+                "rider": {
+                    "rides": 0,
+                    "rides_by_status": {},
+                    "trips": 0,
+                    "long_trips": 0,
+                    "trip_duration": "00:00:00",
+                },
+                "driver": {
+                    "rides": 2,
+                    "rides_by_status": {"dropoff": 2},
+                    "trips": 2,
+                    "long_trips": 1,
+                    "trip_duration": "02:00:00",
+                },
+            },
+        )
+
+        url = reverse("user-stats", args=[self.rider.pk])
+        response = self.client.get(url, {"start": "2025-03-11", "end": "2025-03-31"})
+        body = response.json()
+        self.assertEqual((body["start"], body["end"]), ("2025-03-11", "2025-03-31"))
+        self.assertEqual(body["rider"]["rides"], 1)
+        self.assertEqual(body["rider"]["trip_duration"], "01:15:00")
+
+        response = self.client.get(url, {"start": "2025-04-01", "end": "2025-03-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("user-stats", args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_expand_stats(self):
+        for kwargs, params in [
+            ({}, {"role": "driver", "expand": "stats"}),
+            ({"pk": self.drivers[0].pk}, {"expand": "stats"}),
+        ]:
+            with self.subTest(**kwargs):
+                request = APIRequestFactory().get("/api/users/", params)
+                force_authenticate(request, user=self.admin_user)
+                view = UserViewSet.as_view({"get": "retrieve" if kwargs else "list"})
+                # One more query, for the stats of every user shown.
+                with self.assertNumQueries(2 if kwargs else 3):
+                    response = view(request, **kwargs)
+                    response.render()
+                users = response.data.get("results", [response.data])
+                self.assertEqual(
+                    users[0]["stats"]["driver"]["rides_by_status"], {"dropoff": 2}
+                )
+
+                path = "".join(f"{value}/" for value in kwargs.values())
+                async_response = self.client.get(f"/api/async/users/{path}", params)
+                self.assertEqual(
+                    async_response.content.decode().replace("/api/async/", "/api/"),
+                    response.content.decode(),
+                )
+
+        request = APIRequestFactory().get("/api/users/")
+        force_authenticate(request, user=self.admin_user)
+        response = UserViewSet.as_view({"get": "list"})(request)
+        self.assertNotIn("stats", response.data["results"][0])
+        request = APIRequestFactory().get("/api/users/", {"expand": "rides"})
+        force_authenticate(request, user=self.admin_user)
+        response = UserViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        expected = self.stats_rows()
+        UserDailyStats.objects.all().delete()
+        call_command("rebuild_user_stats", "--batch-days", 1, stdout=StringIO())
+        self.assertEqual(self.stats_rows(), expected)
+
+
+class RideHeatmapTests(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.now = timezone.now()
+        # (pickup, dropoff, status, hours ago)
+        for pickup, dropoff, ride_status, hours in [
+            ((0.0, 0.0), (5.0, 5.0), "dropoff", 1),
+            ((9.9, 9.9), (5.0, 5.0), "dropoff", 1),
+            ((10.0, 10.0), (1.0, 9.0), "pickup", 1),  # The north-east corner.
+            ((2.0, 7.0), (1.0, 9.0), "pickup", 48),
+            ((-1.0, 5.0), (1.0, 9.0), "dropoff", 1),  # Outside the box.
+        ]:
+            Ride.objects.create(
+                status=ride_status,
+                rider=self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=pickup[0],
+                pickup_longitude=pickup[1],
+                dropoff_latitude=dropoff[0],
+                dropoff_longitude=dropoff[1],
+                pickup_time=self.now - timedelta(hours=hours),
+            )
+        self.url = reverse("ride-heatmap")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def get(self, **params):
+        params = {"bbox": "0,0,10,10", "rows": 2, "cols": 2, **params}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_counts_points_in_cells(self):
+        self.assertEqual(
+            self.get(),
+            {
+                "point": "pickup",
+                "bbox": [0.0, 0.0, 10.0, 10.0],
+                "rows": 2,
+                "cols": 2,
+                "total": 4,
+                "max": 2,
+                "cells": [[0, 0, 1], [0, 1, 1], [1, 1, 2]],
+            },
+        )
+        body = self.get(point="dropoff")
+        self.assertEqual(body["cells"], [[0, 1, 3], [1, 1, 2]])
+        self.assertEqual(self.get(status="pickup")["cells"], [[0, 1, 1], [1, 1, 1]])
+        after = (self.now - timedelta(hours=2)).isoformat()
+        self.assertEqual(self.get(pickup_time_after=after)["total"], 3)
+
+    def test_chunks_and_binning_agree(self):
+        expected = self.get(rows=7, cols=5)
+        with override_settings(RIDES_HEATMAP_CHUNK_SIZE=2):
+            self.assertEqual(self.get(rows=7, cols=5), expected)
+        with mock.patch.object(heatmap, "numpy", None):
+            self.assertEqual(self.get(rows=7, cols=5), expected)
+
+    def test_reads_coordinates_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(rows=3, cols=3)
+        [query] = queries
+        self.assertIn('SELECT "rides_ride"."pickup_latitude"', query["sql"])
+        self.assertIn('"rides_ride"."pickup_longitude" FROM', query["sql"])
+
+    def test_common_sizes_are_cached(self):
+        response = self.client.get(self.url, {"rows": 64, "cols": 64})
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = self.client.get(self.url, {"rows": 64, "cols": 64})
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()["total"], 5)
+
+        ride = Ride.objects.first()
+        ride.pickup_latitude = 50.0
+        ride.save()
+        response = self.client.get(self.url, {"rows": 64, "cols": 64})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["total"], 5)
+
+        response = self.client.get(self.url, {"rows": 65, "cols": 64})
+        self.assertNotIn("X-Cache", response)
+
+    def test_invalid_parameters(self):
+        for params in [
+            {"bbox": "0,0,10"},
+            {"bbox": "a,b,c,d"},
+            {"bbox": "10,0,0,10"},
+            {"bbox": "0,0,91,10"},
+            {"rows": 0},
+            {"cols": settings.RIDES_HEATMAP_MAX_SIZE + 1},
+            {"point": "midway"},
+        ]:
+            with self.subTest(**params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RideEventTypeTests(APITestCase):
+    def setUp(self):
+        # Codes of types rolled back with each test can be reused.
+        self.addCleanup(RideEventType.objects.clear_cache)
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.ride = Ride.objects.create(
+            status="pickup",
+            rider=self.admin_user,
+            driver=self.admin_user,
+            pickup_latitude=14.6,
+            pickup_longitude=121.0,
+            dropoff_latitude=14.5,
+            dropoff_longitude=121.1,
+            pickup_time=timezone.now(),
+        )
+        self.client.force_authenticate(user=self.admin_user)
+
+    def event(self, description):
+        return RideEvent.objects.create(
+            ride=self.ride, description=description, created_at=timezone.now()
+        )
+
+    def test_descriptions_are_interned(self):
+        events = [self.event(RideEvent.PICKUP) for _ in range(3)]
+        self.event(RideEvent.DROPOFF)
+
+        self.assertEqual(
+            list(RideEventType.objects.values_list("description", flat=True)),
+            [RideEvent.PICKUP, RideEvent.DROPOFF],
+        )
+        code = RideEventType.objects.code_for(RideEvent.PICKUP)
+        self.assertEqual({event.event_type_id for event in events}, {code})
+        event = RideEvent.objects.get(pk=events[0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(event.description, RideEvent.PICKUP)
+            self.assertEqual(
+                RideEventType.objects.description_for(code), event.description
+            )
+
+    def test_api_presents_descriptions(self):
+        event = self.event("Driver waiting")
+        url = reverse("rideevent-detail", args=[event.pk])
+        self.assertEqual(self.client.get(url).json()["description"], "Driver waiting")
+
+        response = self.client.patch(url, {"description": RideEvent.PICKUP})
+        self.assertEqual(response.json()["description"], RideEvent.PICKUP)
+        event.refresh_from_db()
+        self.assertEqual(event.description, RideEvent.PICKUP)
+        response = self.client.get(reverse("ride-detail", args=[self.ride.pk]))
+        self.assertEqual(
+            [item["description"] for item in response.json()["todays_ride_events"]],
+            [RideEvent.PICKUP],
+        )
+        response = self.client.get(reverse("ride-events", args=[self.ride.pk]))
+        self.assertEqual(response.json()["results"][0]["description"], RideEvent.PICKUP)
+
+    def test_description_filter_compares_codes(self):
+        self.event(RideEvent.PICKUP)
+        dropoff = self.event(RideEvent.DROPOFF)
+        url = reverse("rideevent-list")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"description": RideEvent.DROPOFF})
+        self.assertEqual(
+            [item["id_ride_event"] for item in response.json()["results"]],
+            [dropoff.pk],
+        )
+        events_sql = [
+            query["sql"]
+            for query in queries
+            if 'FROM "rides_rideevent"' in query["sql"]
+        ]
+        self.assertTrue(events_sql)
+        for sql in events_sql:
+            self.assertIn(f'"id_event_type" IN ({dropoff.event_type_id})', sql)
+            self.assertNotIn(RideEvent.DROPOFF, sql)
+
+        # Unknown descriptions match nothing and aren't created.
+        response = self.client.get(url, {"description": "Never recorded"})
+        self.assertEqual(response.json()["results"], [])
+        self.assertFalse(RideEventType.objects.filter(description="Never recorded"))
+
+    def test_types_are_cached_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            code = RideEventType.objects.code_for("Committed")
+        with self.assertNumQueries(0):
+            self.assertEqual(RideEventType.objects.code_for("Committed"), code)
+            self.assertEqual(RideEventType.objects.description_for(code), "Committed")
+
+    def test_rolled_back_types_are_forgotten(self):
+        with suppress(RuntimeError), transaction.atomic():
+            code = self.event("Rolled back").event_type_id
+            # Known to the transaction that created it.
+            with self.assertNumQueries(0):
+                self.assertEqual(RideEventType.objects.code_for("Rolled back"), code)
+                self.assertEqual(
+                    RideEventType.objects.description_for(code), "Rolled back"
+                )
+            raise RuntimeError
+
+        self.assertIsNone(RideEventType.objects.code_for("Rolled back", create=False))
+        self.assertIsNone(RideEventType.objects.description_for(code))
+        self.assertEqual(self.event("Rolled back").description, "Rolled back")
+
+
+class RideTripColumnsTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password="adminpass",
+            role="admin",
+        )
+        self.now = timezone.now()
+        # (pickup, dropoff)
+        self.rides = [
+            Ride.objects.create(
+                status="pickup",
+                rider=self.admin_user,
+                driver=self.admin_user,
+                pickup_latitude=pickup[0],
+                pickup_longitude=pickup[1],
+                dropoff_latitude=dropoff[0],
+                dropoff_longitude=dropoff[1],
+                pickup_time=self.now,
+            )
+            for pickup, dropoff in [
+                ((0.0, 0.0), (0.0, 1.0)),
+                ((14.6, 121.0), (14.5, 121.1)),
+                ((51.5, -0.1), (48.9, 2.4)),
+            ]
+        ]
+        self.client.force_authenticate(user=self.admin_user)
+
+    def event(self, ride, description, minutes):
+        return RideEvent.objects.create(
+            ride=ride,
+            description=description,
+            created_at=self.now + timedelta(minutes=minutes),
+        )
+
+    def test_distance_is_stored_on_save(self):
+        ride = self.rides[0]
+        ride.refresh_from_db()
+        self.assertAlmostEqual(ride.trip_distance_km, 111.19, places=2)
+
+        ride.dropoff_longitude = 2.0
+        ride.save()
+        ride.refresh_from_db()
+        self.assertAlmostEqual(ride.trip_distance_km, 222.39, places=2)
+        ride.dropoff_latitude = 1.0
+        ride.save(update_fields=["dropoff_latitude"])
+        ride.refresh_from_db()
+        self.assertAlmostEqual(
+            ride.trip_distance_km, spatial.haversine_km(0.0, 0.0, 1.0, 2.0)
+        )
+
+    def test_duration_follows_pickup_and_dropoff_events(self):
+        ride, other, _ = self.rides
+        self.event(ride, RideEvent.PICKUP, 0)
+        ride.refresh_from_db()
+        self.assertIsNone(ride.duration_seconds)
+        dropoff = self.event(ride, RideEvent.DROPOFF, 90)
+        ride.refresh_from_db()
+        self.assertEqual(ride.duration_seconds, 5400)
+
+        # A save of a stale copy doesn't write back the old duration.
+        stale = Ride.objects.get(pk=other.pk)
+        self.event(other, RideEvent.PICKUP, 0)
+        self.event(other, RideEvent.DROPOFF, 30)
+        stale.status = "dropoff"
+        stale.save()
+        other.refresh_from_db()
+        self.assertEqual(other.duration_seconds, 1800)
+
+        dropoff.created_at += timedelta(minutes=30)
+        dropoff.save()
+        ride.refresh_from_db()
+        self.assertEqual(ride.duration_seconds, 7200)
+        dropoff.delete()
+        ride.refresh_from_db()
+        self.assertIsNone(ride.duration_seconds)
+
+        response = self.client.post(
+            reverse("rideevent-bulk"),
+            [
+                {
+                    "ride": ride.pk,
+                    "description": RideEvent.DROPOFF,
+                    "created_at": (self.now + timedelta(minutes=45)).isoformat(),
+                }
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ride.refresh_from_db()
+        self.assertEqual(ride.duration_seconds, 2700)
+
+    def test_filters_and_ordering(self):
+        short, medium, long = self.rides
+        self.event(short, RideEvent.PICKUP, 0)
+        self.event(short, RideEvent.DROPOFF, 10)
+        self.event(long, RideEvent.PICKUP, 0)
+        self.event(long, RideEvent.DROPOFF, 120)
+
+        def ids(params):
+            response = self.client.get(reverse("ride-list"), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [ride["id_ride"] for ride in response.json()["results"]]
+
+        self.assertEqual(
+            ids({"ordering": "trip_distance_km"}), [medium.pk, short.pk, long.pk]
+        )
+        self.assertEqual(ids({"trip_distance_km__gte": 100}), [short.pk, long.pk])
+        self.assertEqual(ids({"trip_distance_km__lte": 100}), [medium.pk])
+        self.assertEqual(
+            ids({"ordering": "-duration_seconds", "duration_seconds__gte": 0}),
+            [long.pk, short.pk],
+        )
+        self.assertEqual(ids({"duration_seconds__lte": 3600}), [short.pk])
+        response = self.client.get(
+            reverse("ride-detail", args=[long.pk]),
+            {"fields": "trip_distance_km,duration_seconds"},
+        )
+        self.assertEqual(response.json()["duration_seconds"], 7200)
+        self.assertAlmostEqual(
+            response.json()["trip_distance_km"], long.trip_distance_km
+        )
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command("backfill_ride_trip_columns", *args, stdout=out)
+        return out.getvalue()
+
+    def columns(self):
+        return list(
+            Ride.objects.order_by("pk").values_list(
+                "trip_distance_km", "duration_seconds"
+            )
+        )
+
+    def assertColumns(self, expected):
+        columns = self.columns()
+        self.assertEqual(len(columns), len(expected))
+        for (distance, seconds), (expected_distance, expected_seconds) in zip(
+            columns, expected
+        ):
+            if expected_distance is None:
+                self.assertIsNone(distance)
+            else:
+                self.assertAlmostEqual(distance, expected_distance)
+            self.assertEqual(seconds, expected_seconds)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        self.event(self.rides[2], RideEvent.PICKUP, 0)
+        self.event(self.rides[2], RideEvent.DROPOFF, 75)
+        expected = self.columns()
+        Ride.objects.update(trip_distance_km=None, duration_seconds=None)
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / "backfill.json"
+            checkpoint.write_text(json.dumps({"last_id": self.rides[0].pk}))
+            output = self.backfill("--checkpoint", checkpoint, "--batch-size", 1)
+            self.assertIn(f"Resuming after ride {self.rides[0].pk}.", output)
+            self.assertColumns([(None, None), *expected[1:]])
+            self.assertFalse(checkpoint.exists())
+
+            # Without progress recorded, a run starts over.
+            with mock.patch.object(spatial, "numpy", None):
+                self.backfill("--checkpoint", checkpoint)
+        self.assertColumns(expected)
+
+    def test_backfill_checks_its_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / "backfill.json"
+            checkpoint.write_text("not json")
+            with self.assertRaisesMessage(CommandError, "is not a checkpoint"):
+                self.backfill("--checkpoint", checkpoint)
+            self.backfill("--checkpoint", checkpoint, "--restart")
+            self.assertFalse(checkpoint.exists())
+        with self.assertRaisesMessage(CommandError, "--batch-size must be at least 1"):
+            self.backfill("--batch-size", 0)
@@ -1,11 +1,57 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import RideViewSet
+from .async_views import (
+    AsyncRideEventView,
+    AsyncRideView,
+    AsyncUserView,
+    RideEventStreamView,
+)
+from .views import (
+    LongTripReportView,
+    MetricsView,
+    RideEventViewSet,
+    RideViewSet,
+    UserViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"rides", RideViewSet, basename="ride")
+router.register(r"ride-events", RideEventViewSet, basename="rideevent")
 
 urlpatterns = [
     path("", include(router.urls)),
+    # Async (ASGI) read-only variants of the viewsets above.
+    path("async/rides/", AsyncRideView.as_view(), name="async-ride-list"),
+    path("async/rides/<str:pk>/", AsyncRideView.as_view(), name="async-ride-detail"),
+    path(
+        "async/ride-events/",
+        AsyncRideEventView.as_view(),
+        name="async-rideevent-list",
+    ),
+    path(
+        "async/ride-events/<str:pk>/",
+        AsyncRideEventView.as_view(),
+        name="async-rideevent-detail",
+    ),
+    path("async/users/", AsyncUserView.as_view(), name="async-user-list"),
+    path("async/users/<str:pk>/", AsyncUserView.as_view(), name="async-user-detail"),
+    # Only the stats of UserViewSet are routed; users are read through the
+    # async views above.
+    path(
+        "users/<str:pk>/stats/",
+        UserViewSet.as_view({"get": "stats"}),
+        name="user-stats",
+    ),
+    path(
+        "live/ride-events/",
+        RideEventStreamView.as_view(),
+        name="live-rideevent-stream",
+    ),
+    path(
+        "reports/long-trips/",
+        LongTripReportView.as_view(),
+        name="long-trips-report",
+    ),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
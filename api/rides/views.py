@@ -1,18 +1,59 @@
+import math
 from datetime import timedelta
 
-from django.db.models import ExpressionWrapper, F, FloatField, Prefetch
-from django.db.models.functions import Power
+from django.conf import settings
+from django.db.models import Count, F, Prefetch, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
-from rest_framework.authentication import BasicAuthentication
+from rest_framework import filters, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
-from .models import Ride, RideEvent, User
+from . import cache, export, heatmap, ingest, spatial
+from .authentication import CachedBasicAuthentication, credential_cache
+from .cache import CachedResponseMixin, ride_tag, seconds_until_events_expire, user_tag
+from .conditional import ConditionalGetMixin
+from .filters import RideEventFilter, RideFilter
+from .instrumentation import registry
+from .models import (
+    ArchivedRideEvent,
+    Ride,
+    RideEvent,
+    RideTrip,
+    User,
+    UserDailyStats,
+)
+from .pagination import AsyncPageNumberPagination, RidePagination
+from .parsers import NDJSONParser
 from .permissions import IsAdmin
-from .serializers import RideSerializer, RideEventSerializer, UserSerializer
+from .renderers import RENDERER_CLASSES, CSVRenderer, NDJSONRenderer
+from .routers import ReplicaReadMixin
+from .serializers import (
+    FastRideSerializer,
+    HeatmapParamsSerializer,
+    LongTripReportParamsSerializer,
+    RideEventHistorySerializer,
+    RideSerializer,
+    StandaloneRideEventSerializer,
+    UserSerializer,
+    UserStatsParamsSerializer,
+    UserStatsSerializer,
+)
 
 
-class RideViewSet(viewsets.ModelViewSet):
+class RideViewSet(
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    viewsets.ModelViewSet,
+):
     """
     Viewset for listing, retrieving, and modifying Rides.
     """
@@ -20,64 +61,380 @@ class RideViewSet(viewsets.ModelViewSet):
     queryset = Ride.objects.all()
     serializer_class = RideSerializer
     permission_classes = [IsAdmin]
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = [CachedBasicAuthentication]
+    renderer_classes = RENDERER_CLASSES
+    columnar_side_tables = {"rider": "users", "driver": "users"}
+    pagination_class = RidePagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ["status", "rider__email"]
-    ordering_fields = ["pickup_time"]
+    filterset_class = RideFilter
+    ordering_fields = [
+        "pickup_time",
+        "last_event_at",
+        "event_count",
+        "trip_distance_km",
+        "duration_seconds",
+    ]
+    cursor_ordering = ["pickup_time", "id_ride"]
+    replica_actions = ("list", "retrieve", "export", "events", "heatmap")
+    export_chunk_size = 1000
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related("rider", "driver")
-        # Prefetch ride events from the last 24 hours.
-        last_24_hours = timezone.now() - timedelta(days=1)
-        qs = qs.prefetch_related(
-            Prefetch(
-                "ride_events",
-                queryset=RideEvent.objects.filter(created_at__gte=last_24_hours),
-                to_attr="todays_events",
+        qs = super().get_queryset()
+        _, expand = self.get_sparse_fields()
+        if expand is None:
+            qs = qs.select_related("rider", "driver")
+        else:
+            qs = qs.only(*self.get_loaded_fields())
+            related = [name for name in ("rider", "driver") if name in expand]
+            if related:
+                qs = qs.select_related(*related)
+        if self.shows_todays_events():
+            # Prefetch ride events from the last 24 hours.
+            qs = qs.prefetch_related(
+                Prefetch(
+                    "ride_events",
+                    queryset=todays_ride_events(),
+                    to_attr="todays_events",
+                )
             )
+
+        # Filter by and/or sort by great-circle distance from a point.
+        origin = self.get_origin()
+        if origin is not None:
+            latitude, longitude = origin
+            radius_km = self.get_radius_km()
+            if radius_km is not None:
+                qs = spatial.within_radius(qs, latitude, longitude, radius_km)
+            ordering_param = self.request.query_params.get("ordering", "")
+            if "distance" in ordering_param:
+                qs = spatial.order_by_distance(
+                    qs, latitude, longitude, descending=ordering_param.startswith("-")
+                )
+
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        if expand is not None:
+            kwargs.update(fields=fields, expand=expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_sparse_fields(self):
+        """
+        The ``?fields=`` and ``?expand=`` of a list or retrieve, see
+        RideSerializer, as sets of field names. ``(None, None)`` when neither
+        was given; otherwise ``expand`` is a set, which includes
+        ``todays_ride_events`` when ``fields`` names it, as it has no
+        collapsed form.
+        """
+        if not hasattr(self, "_sparse_fields"):
+            fields = expand = None
+            if self.action in ("list", "retrieve"):
+                query_params = self.request.query_params
+                fields = parse_field_names(
+                    query_params, "fields", RideSerializer.Meta.fields
+                )
+                expand = parse_field_names(
+                    query_params, "expand", RideSerializer.expandable_fields
+                )
+            if fields is not None or expand is not None:
+                expand = (expand or frozenset()) | (
+                    (fields or frozenset()) & {"todays_ride_events"}
+                )
+            self._sparse_fields = fields, expand
+        return self._sparse_fields
+
+    def get_loaded_fields(self):
+        """
+        The columns a sparse response shows, for ``only()``, plus the keyset
+        pagination key.
+        """
+        loaded = ["pk", *self.cursor_ordering]
+        for field in self.get_serializer().fields.values():
+            if isinstance(field, serializers.Serializer):
+                loaded += [
+                    f"{field.source}__{child.source}" for child in field.fields.values()
+                ]
+            elif field.source != "*":
+                loaded.append(field.source)
+        return loaded
+
+    def shows_todays_events(self):
+        _, expand = self.get_sparse_fields()
+        return expand is None or "todays_ride_events" in expand
+
+    def get_serializer_class(self):
+        if settings.RIDES_FAST_SERIALIZATION and self.action in ("list", "retrieve"):
+            return FastRideSerializer
+        return super().get_serializer_class()
+
+    def paginate_queryset(self, queryset):
+        # Nearest-first pages come from the pickup cell index instead of
+        # sorting the whole table.
+        origin = self.get_origin()
+        ordering_param = self.request.query_params.get("ordering", "")
+        if (
+            origin is not None
+            and not self.paginator.is_cursor_request(self.request)
+            and "distance" in ordering_param
+            and not ordering_param.startswith("-")
+        ):
+            queryset = spatial.NearestRides(
+                queryset, *origin, radius_km=self.get_radius_km()
+            )
+        if self.response_validators is not None:
+            # Counted along with the validators.
+            self.paginator.known_count = self.response_validators["rides"]
+        return super().paginate_queryset(queryset)
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream every matching ride with all of its events, in pickup time
+        order, as NDJSON (default) or CSV (``?format=csv`` or
+        ``Accept: text/csv``). Takes the same filters as the list.
+        """
+        # Streamed after the view returns, so pinned to this request's replica.
+        queryset = self.filter_queryset(Ride.objects.using(self.read_db))
+        if request.accepted_renderer.format == "csv":
+            response = StreamingHttpResponse(
+                export.stream_csv(queryset, self.export_chunk_size),
+                content_type="text/csv; charset=utf-8",
+            )
+            response["Content-Disposition"] = 'attachment; filename="rides.csv"'
+            return response
+        return StreamingHttpResponse(
+            export.stream_ndjson(queryset, self.export_chunk_size),
+            content_type="application/x-ndjson; charset=utf-8",
         )
 
-        # If user wants to sort by distance:
-        request = self.request
-        ordering_param = request.query_params.get("ordering", "")
-        latitude = request.query_params.get("latitude")
-        longitude = request.query_params.get("longitude")
-        if latitude and longitude and "distance" in ordering_param:
+    @action(detail=True)
+    def events(self, request, *args, **kwargs):
+        """
+        Every event of the ride, archived ones included, oldest first.
+        """
+        ride = get_object_or_404(Ride.objects.only("pk"), pk=kwargs["pk"])
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(ride_event_history(ride.pk), request, self)
+        serializer = RideEventHistorySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES)
+    def heatmap(self, request):
+        """
+        Counts of the matching rides' pickup (or with ``?point=dropoff``,
+        dropoff) points in a ``rows`` x ``cols`` grid over ``bbox``
+        (south,west,north,east), listed as ``[row, col, count]`` for every
+        non-empty cell, row 0 the southernmost. Takes the list filters, e.g.
+        ``status`` and ``pickup_time_after``/``pickup_time_before``. Grids of
+        ``RIDES_HEATMAP_CACHED_SIZES`` are cached like lists.
+        """
+        params = HeatmapParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        cached_sizes = settings.RIDES_HEATMAP_CACHED_SIZES
+        if params["rows"] in cached_sizes and params["cols"] in cached_sizes:
+            return self.cached_response(self.build_heatmap, request, params)
+        return self.build_heatmap(request, params)
+
+    def build_heatmap(self, request, params):
+        rides = self.filter_queryset(Ride.objects.all())
+        return Response(
+            heatmap.build(
+                rides,
+                params["point"],
+                params["bbox"],
+                params["rows"],
+                params["cols"],
+                settings.RIDES_HEATMAP_CHUNK_SIZE,
+            )
+        )
+
+    def filters_relative_to_now(self):
+        return any(
+            name in self.request.query_params
+            for name in self.filterset_class.relative_to_now
+        )
+
+    def get_validator_querysets(self):
+        # Neither validators nor cached entries change as rides cross
+        # the cutoff of e.g. idle_minutes.
+        if self.filters_relative_to_now():
+            return None
+        if self.action == "retrieve":
             try:
-                latitude = float(latitude)
-                longitude = float(longitude)
+                ride_id = int(self.kwargs["pk"])
             except ValueError:
-                pass
-            else:
-                distance_expr = ExpressionWrapper(
-                    Power(F("pickup_latitude") - latitude, 2)
-                    + Power(F("pickup_longitude") - longitude, 2),
-                    output_field=FloatField(),
-                )
-                qs = qs.annotate(distance=distance_expr)
-                if ordering_param.startswith("-"):
-                    qs = qs.order_by(F("distance").desc(nulls_last=True))
-                else:
-                    qs = qs.order_by("distance")
+                return None  # A 404.
+            ride = Ride.objects.filter(pk=ride_id)
+            return ride, ride, RideEvent.objects.filter(ride_id=ride_id)
+        # Cursor and count-free pages exist to avoid reading every matching
+        # ride, which the validators would.
+        if self.paginator.is_cursor_request(
+            self.request
+        ) or self.paginator.is_count_free_request(self.request):
+            return None
+        # Any ride may be on the page. Reading each matching ride's
+        # updated_at and events would cost more than the page itself; like
+        # the response cache, lists change with every write.
+        rides = self.filter_queryset(self.get_queryset())
+        return rides, Ride.objects.all(), RideEvent.objects.all()
 
-        return qs
+    def get_cache_tags(self, data):
+        # Sparse responses may leave out the ride's id, and only show expanded
+        # riders and drivers.
+        tags = [ride_tag(self.kwargs["pk"])] if self.action == "retrieve" else []
+        for ride in data.get("results", [data]):
+            if "id_ride" in ride:
+                tags.append(ride_tag(ride["id_ride"]))
+            tags += [
+                user_tag(ride[name]["id"])
+                for name in ("rider", "driver")
+                if isinstance(ride.get(name), dict)
+            ]
+        return tags
+
+    def get_cache_ttl(self, data):
+        if self.filters_relative_to_now():
+            return 0
+        # todays_ride_events changes as events age out of the 24 hour window,
+        # without any write to invalidate it.
+        ttl = seconds_until_events_expire(data.get("results", [data]))
+        default = super().get_cache_ttl(data)
+        return default if ttl is None else min(ttl, default)
+
+    def get_origin(self):
+        latitude = self.request.query_params.get("latitude")
+        longitude = self.request.query_params.get("longitude")
+        if not (latitude and longitude):
+            return None
+        errors = {}
+        origin = []
+        for name, value, limit in [
+            ("latitude", latitude, 90),
+            ("longitude", longitude, 180),
+        ]:
+            try:
+                value = float(value)
+            except ValueError:
+                value = math.nan
+            if not (math.isfinite(value) and -limit <= value <= limit):
+                errors[name] = [f"Must be a number between -{limit} and {limit}."]
+            origin.append(value)
+        if errors:
+            raise ValidationError(errors)
+        return tuple(origin)
+
+    def get_radius_km(self):
+        radius_km = self.request.query_params.get("radius_km")
+        if not radius_km:
+            return None
+        try:
+            radius_km = float(radius_km)
+        except ValueError:
+            radius_km = math.nan
+        if not (math.isfinite(radius_km) and radius_km >= 0):
+            raise ValidationError({"radius_km": ["Must be a non-negative number."]})
+        return radius_km
+
+
+def todays_ride_events():
+    last_24_hours = timezone.now() - timedelta(days=1)
+    # With their descriptions, for the async views, which can't query for
+    # one missing from the event type cache while serializing.
+    return (
+        RideEvent.objects.filter(created_at__gte=last_24_hours)
+        .select_related("event_type")
+        .order_by("ride", "created_at", "id_ride_event")
+    )
+
+
+def ride_event_history(ride_id):
+    fields = ["id_ride_event", "created_at"]
+    hot = RideEvent.objects.filter(ride_id=ride_id).values(
+        *fields, description=F("event_type__description"), archived=Value(False)
+    )
+    archived = ArchivedRideEvent.objects.filter(ride_id=ride_id).values(
+        *fields, description=F("event_type__description"), archived=Value(True)
+    )
+    return hot.union(archived, all=True).order_by("created_at", "id_ride_event")
+
+
+def parse_field_names(query_params, param, allowed):
+    """
+    The set of comma separated names in ``param``, which must all be
+    ``allowed``, or None when it wasn't given.
+    """
+    if param not in query_params:
+        return None
+    names = frozenset(
+        name.strip()
+        for value in query_params.getlist(param)
+        for name in value.split(",")
+        if name.strip()
+    )
+    unknown = names.difference(allowed)
+    if unknown:
+        raise ValidationError(
+            {param: [f"Unknown fields: {', '.join(sorted(unknown))}."]}
+        )
+    return names
 
 
-class RideEventViewSet(viewsets.ModelViewSet):
+class RideEventViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     Viewset for listing, retrieving, and modifying RideEvents.
     """
 
     queryset = RideEvent.objects.all()
-    serializer_class = RideEventSerializer
+    serializer_class = StandaloneRideEventSerializer
     permission_classes = [IsAdmin]
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = [CachedBasicAuthentication]
+    renderer_classes = RENDERER_CLASSES
+    pagination_class = RidePagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ["ride__id_ride", "description"]
+    filterset_class = RideEventFilter
     ordering_fields = ["created_at"]
+    cursor_ordering = ["created_at", "id_ride_event"]
+    bulk_max_events = 10000
+
+    @action(detail=False, methods=["post"], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Create many events at once from a JSON array or NDJSON body.
+
+        Responds 201 when every event was created, 207 when only some were and
+        400 when none were, with one result per item in ``results``.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError(
+                {"non_field_errors": ["Expected a list of ride events."]}
+            )
+        if len(items) > self.bulk_max_events:
+            raise ValidationError(
+                {
+                    "non_field_errors": [
+                        f"Send at most {self.bulk_max_events} ride events at once."
+                    ]
+                }
+            )
 
+        results = ingest.ingest_events(items)
+        created = sum(result["status"] == "created" for result in results)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=response_status,
+        )
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     Viewset for listing, retrieving, and modifying Users.
     """
@@ -85,7 +442,145 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdmin]
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = [CachedBasicAuthentication]
+    pagination_class = AsyncPageNumberPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ["username", "email", "role"]
     ordering_fields = ["first_name", "last_name", "email"]
+    replica_actions = ("list", "retrieve", "stats")
+    # Set by views that read the stats of ?expand=stats themselves.
+    user_stats = None
+
+    def get_serializer(self, *args, **kwargs):
+        if args and self.expands_stats():
+            users = args[0] if kwargs.get("many") else [args[0]]
+            kwargs["context"] = {
+                **self.get_serializer_context(),
+                "user_stats": self.get_user_stats(users),
+            }
+        return super().get_serializer(*args, **kwargs)
+
+    def expands_stats(self):
+        """
+        Whether a list or retrieve shows each user's all-time ``stats``, see
+        UserSerializer.
+        """
+        if self.action not in ("list", "retrieve"):
+            return False
+        expand = parse_field_names(
+            self.request.query_params, "expand", UserSerializer.expandable_fields
+        )
+        return bool(expand)
+
+    def get_user_stats(self, users):
+        if self.user_stats is not None:
+            return self.user_stats
+        return UserDailyStats.objects.totals(user.pk for user in users)
+
+    @action(detail=True)
+    def stats(self, request, *args, **kwargs):
+        """
+        The user's ride statistics as rider and as driver, by pickup day
+        ``start``..``end`` (inclusive, ISO dates, either optional). Summed
+        from UserDailyStats, so the cost grows with the days in the range
+        rather than the user's rides.
+        """
+        user = get_object_or_404(User.objects.only("pk"), pk=kwargs["pk"])
+        params = UserStatsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        start = params.validated_data.get("start")
+        end = params.validated_data.get("end")
+        [stats] = UserDailyStats.objects.totals([user.pk], start, end).values()
+        return Response(
+            {
+                "user": user.pk,
+                "start": params.data.get("start"),
+                "end": params.data.get("end"),
+                **UserStatsSerializer(stats).data,
+            }
+        )
+
+
+class LongTripReportView(ReplicaReadMixin, APIView):
+    """
+    Count of trips longer than ``min_duration_minutes`` (default 60) by dropoff
+    month and driver, optionally limited to the ``start``..``end`` months.
+
+    Reads the RideTrip summary table rather than joining ride events.
+    """
+
+    permission_classes = [IsAdmin]
+    authentication_classes = [CachedBasicAuthentication]
+
+    def get(self, request):
+        params = LongTripReportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        trips = RideTrip.objects.filter(
+            duration__gt=timedelta(minutes=params["min_duration_minutes"])
+        )
+        if "start" in params:
+            trips = trips.filter(dropoff_month__gte=params["start"])
+        if "end" in params:
+            trips = trips.filter(dropoff_month__lte=params["end"])
+        rows = list(
+            trips.values("dropoff_month", "driver")
+            .annotate(count=Count("*"))
+            .order_by("dropoff_month", "driver")
+        )
+
+        drivers = User.objects.only("first_name", "last_name").in_bulk(
+            {row["driver"] for row in rows}
+        )
+        return Response(
+            [
+                {
+                    "month": row["dropoff_month"].strftime("%Y-%m"),
+                    "driver_id": row["driver"],
+                    "driver": (
+                        f"{drivers[row['driver']].first_name} "
+                        f"{drivers[row['driver']].last_name}"
+                    ),
+                    "count": row["count"],
+                }
+                for row in rows
+            ]
+        )
+
+
+class MetricsView(APIView):
+    """
+    Request metrics of this process (see instrumentation.py) and cache
+    counters, in the Prometheus text format.
+    """
+
+    permission_classes = [IsAdmin]
+    authentication_classes = [CachedBasicAuthentication]
+
+    def get(self, request):
+        cache_stats = cache.stats()
+        extra = [
+            (
+                "rides_response_cache_hits_total",
+                "counter",
+                "Ride responses served from the response cache.",
+                cache_stats["hits"],
+            ),
+            (
+                "rides_response_cache_misses_total",
+                "counter",
+                "Ride responses that missed the response cache.",
+                cache_stats["misses"],
+            ),
+            (
+                "rides_auth_cache_entries",
+                "gauge",
+                "Verified credentials held by CachedBasicAuthentication.",
+                len(credential_cache),
+            ),
+        ]
+        return HttpResponse(
+            registry.render(extra),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )